@@ -0,0 +1,123 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import RunMetrics
+
+# Config sections named like [Account family] each describe one Google account
+ACCOUNT_SECTION_PREFIX = 'Account '
+# The column of the consolidated album list that says which account an album is in
+ACCOUNT_HEADER = 'Account'
+# Parameters every account keeps separate, and the config option each is read from.  Files the account section
+# doesn't name get the account name added to the file name from the main sections, e.g. "token - family.json".
+ACCOUNT_FILE_OPTIONS = {
+    'credentials_file': 'credentials_file',
+    'token_file': 'token_file',
+    'album_list_file': 'album_list_file',
+    'album_store_file': 'store_file',
+    'journal_file': 'journal_file',
+    'browser_profile_dir': 'browser_profile_dir',
+    'inventory_db_file': 'inventory_db_file',
+}
+# Each account has its own API quota, so its own rate limit
+ACCOUNT_NUMBER_OPTIONS = {
+    'requests_per_second': 'requests_per_second',
+    'max_requests_per_second': 'max_requests_per_second',
+}
+
+
+def account_file(path, account):
+    """:return: path with the account name added before the extension, e.g. 'token.json' -> 'token - family.json'."""
+    stem, extension = os.path.splitext(path)
+    return f"{stem} - {account}{extension}"
+
+
+def read_account_profiles(config, parameters):
+    """
+    Reads the [Account <name>] sections of the config file.  Every option in them is optional.
+
+    :param config: The ConfigParser the parameters were read from.
+    :param parameters: The parameters of the main sections, which the accounts' defaults come from.
+    :return: Dictionary of account name to the parameters that account overrides, in config file order.
+    """
+    accounts = {}
+    for section in config.sections():
+        if not section.startswith(ACCOUNT_SECTION_PREFIX):
+            continue
+        account = section[len(ACCOUNT_SECTION_PREFIX):].strip()
+        overrides = {}
+        for parameter, option in ACCOUNT_FILE_OPTIONS.items():
+            # The client secret belongs to the Google Cloud project, so all accounts can share it
+            default = parameters[parameter] if parameter == 'credentials_file' else account_file(parameters[parameter], account)
+            overrides[parameter] = config.get(section, option, fallback=default)
+        for parameter, option in ACCOUNT_NUMBER_OPTIONS.items():
+            overrides[parameter] = config.getfloat(section, option, fallback=parameters[parameter])
+        overrides['album_list_length_limit'] = config.getint(section, 'album_list_length_limit', fallback=parameters['album_list_length_limit'])
+        accounts[account] = overrides
+    return accounts
+
+
+def parameters_for_account(parameters, account):
+    """:return: A copy of parameters for one account, so every command can run on that account as is."""
+    return {**parameters, **parameters['accounts'][account], 'account': account}
+
+
+def select_accounts(parameters, names):
+    """
+    :param names: Account names from the command line; 'all' for every account in the config file.
+    :return: List of account names, or None (after logging why) if one isn't in the config file.
+    """
+    if 'all' in names:
+        return list(parameters['accounts'])
+    unknown = [name for name in names if name not in parameters['accounts']]
+    if unknown:
+        logging.error(f"No [{ACCOUNT_SECTION_PREFIX}...] section in the config file for {', '.join(unknown)}; "
+                      f"the accounts are: {', '.join(parameters['accounts']) or 'none'}")
+        return None
+    # Each account once, in the order given
+    return list(dict.fromkeys(names))
+
+
+def run_for_accounts(parameters, accounts, function, workers=4):
+    """
+    Runs function on several accounts at the same time.  Each account has its own parameters, files, API session
+    and rate limiter, so they don't slow each other down; an account that fails doesn't stop the others.
+
+    :param parameters: The parameters from read_config_and_set_up_logging.
+    :param accounts: Account names.
+    :param function: Function taking an account's parameters and returning True on success.
+    :param workers: Most accounts worked on at the same time.
+    :return: Dictionary of account name to True if function succeeded for it.
+    """
+    def run(account):
+        start = time.monotonic()
+        try:
+            with RunMetrics.metrics.timer('account_seconds', account=account):
+                return bool(function(parameters_for_account(parameters, account))), time.monotonic() - start
+        except Exception as e:
+            logging.error(f"Account {account} failed: {e}")
+            return False, time.monotonic() - start
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='account-worker') as pool:
+        futures = {pool.submit(run, account): account for account in accounts}
+        for future in as_completed(futures):
+            account = futures[future]
+            results[account], seconds = future.result()
+            logging.info(f"Account {account} {'done' if results[account] else 'FAILED'} in {seconds:.1f}s")
+    return results
+
+
+def consolidate_album_lists(album_lists):
+    """
+    Puts the album lists of several accounts into one, with the account of each album in the first column.
+
+    :param album_lists: Dictionary of account name to its album list (DataFrame with the script's short headers).
+    :return: The consolidated DataFrame.
+    """
+    import pandas as pd
+    frames = [album_list.assign(**{ACCOUNT_HEADER: account}) for account, album_list in album_lists.items()]
+    if not frames:
+        return pd.DataFrame(columns=[ACCOUNT_HEADER])
+    consolidated = pd.concat(frames, ignore_index=True)
+    return consolidated[[ACCOUNT_HEADER] + [column for column in consolidated.columns if column != ACCOUNT_HEADER]]
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import logging
+import threading
+
+# Journal statuses.  A resumed run skips the albums whose merged action says they were deleted or renamed;
+# failed albums are tried again, and albums left at started are logged to be checked by hand.
+STARTED = 'started'
+DELETED = 'deleted'
+RENAMED = 'renamed'
+FAILED = 'failed'
+
+
+class ActionJournal:
+    """
+    Append-only JSON Lines journal of what a delete or rename run has done.  Every record is flushed and
+    fsync'd before the run moves on, so a crash or Ctrl-C loses at most the album that was in progress.
+
+    :param file_path: Path to the journal file; it is created if needed and appended to otherwise.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file = open(file_path, 'a', encoding='utf-8')
+        # The headless browser records from several workers
+        self.lock = threading.Lock()
+
+    def record(self, album_id, status, action='', **details):
+        """
+        Appends one record for an album.
+
+        :param album_id: The album's ID.
+        :param status: STARTED, DELETED, RENAMED or FAILED.
+        :param action: Text for the album's Actions column, e.g. 'Deleted on 2024-01-01 12:00:00'.
+        :param details: Anything else worth keeping (title, latency...).
+        """
+        entry = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'album_id': album_id, 'status': status, 'action': action, **details}
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_journal(file_path):
+    """
+    Reads every record of a journal.  A half-written last line (from a crash) is skipped.
+
+    :return: List of record dictionaries in the order they were written; empty if there is no journal.
+    """
+    entries = []
+    if not os.path.exists(file_path):
+        return entries
+    with open(file_path, encoding='utf-8') as journal:
+        for line_number, line in enumerate(journal, 1):
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                logging.warning(f"Skipping unreadable line {line_number} of journal {file_path}")
+    return entries
+
+
+def merge_journal(album_list, file_path):
+    """
+    Writes the outcome of every album in the journal into the album list's Actions column in one pass.
+    Albums that were started but never finished are logged, as they may need to be checked by hand.
+
+    :param album_list: DataFrame with the script's short headers.
+    :param file_path: Path to the journal file.
+    :return: Number of albums updated.
+    """
+    import AlbumSchema
+    latest_action = {}
+    unfinished = {}
+    for entry in read_journal(file_path):
+        album_id = entry.get('album_id')
+        if entry.get('status') == STARTED:
+            unfinished[album_id] = entry.get('title', album_id)
+            continue
+        unfinished.pop(album_id, None)
+        if entry.get('action'):
+            latest_action[album_id] = entry['action']
+    for album_id, title in unfinished.items():
+        logging.warning(f"Album {title} ({album_id}) was being processed when the last run stopped; please check it by hand")
+    if not latest_action:
+        return 0
+    mask = album_list['Album ID'].isin(latest_action.keys())
+    # Add to the actions log rather than replacing what is already there
+    AlbumSchema.set_values(album_list, mask, 'Actions', [
+        action if not str(existing) else (str(existing) if action in str(existing) else f"{existing}; {action}")
+        for existing, action in zip(album_list.loc[mask, 'Actions'].fillna(''), album_list.loc[mask, 'Album ID'].map(latest_action))
+    ])
+    logging.info(f"Merged {int(mask.sum())} album actions from journal {file_path}")
+    return int(mask.sum())
+
+
+def archive_journal(file_path):
+    """Moves a journal that has been merged and saved out of the way, keeping the last one for reference."""
+    if os.path.exists(file_path):
+        os.replace(file_path, file_path + '.merged')
@@ -0,0 +1,239 @@
+import logging
+import itertools
+import numpy as np
+import pandas as pd
+import AlbumMarkingRules
+import AlbumSchema
+from ConfigChoices import EXACT_DUPLICATE, SUBSET, NEAR_DUPLICATE, DUPLICATE_KINDS, DEFAULT_NEAR_DUPLICATE_THRESHOLD
+
+# Columns the duplicate finder fills in
+DUPLICATE_OF_COLUMN = 'Duplicate Of'
+DUPLICATE_TYPE_COLUMN = 'Duplicate Type'
+# MinHash signature length and how many LSH bands it is cut into.  With 128 hashes in 32 bands of 4, pairs of albums
+# sharing about half their photos or more are very likely to be compared; pairs sharing little almost never are.
+DEFAULT_NUM_PERM = 128
+DEFAULT_LSH_BANDS = 32
+# MinHash uses multiply-shift hashing, (a * x + b) >> 32 with uint64 arithmetic wrapping around, which needs no division
+_HASH_SHIFT = np.uint64(32)
+
+
+def encode_memberships(memberships):
+    """
+    Numbers the photos so albums can be handled as integer arrays rather than sets of ID strings.
+
+    :param memberships: Dictionary of album ID to list of media item IDs.
+    :return: (album IDs, flat photos, sizes, number of distinct photos): the non-empty albums in their original
+             order, the sorted distinct photo numbers of every album one after another, and how many photos each has.
+    """
+    album_ids = [album_id for album_id, media_ids in memberships.items() if media_ids]
+    lengths = np.array([len(memberships[album_id]) for album_id in album_ids], dtype=np.int64)
+    photo_numbers, distinct_photos = pd.factorize(np.fromiter(itertools.chain.from_iterable(memberships[album_id] for album_id in album_ids), dtype=object, count=int(lengths.sum())))
+    rows = np.repeat(np.arange(len(album_ids)), lengths)
+    # Sort each album's photos and drop any photo listed twice in the same album
+    order = np.lexsort((photo_numbers, rows))
+    photo_numbers, rows = photo_numbers[order], rows[order]
+    first = np.ones(len(photo_numbers), dtype=bool)
+    first[1:] = (photo_numbers[1:] != photo_numbers[:-1]) | (rows[1:] != rows[:-1])
+    sizes = np.bincount(rows[first], minlength=len(album_ids))
+    return album_ids, photo_numbers[first].astype(np.uint64), sizes, len(distinct_photos)
+
+
+def minhash_signatures(flat_photos, offsets, num_perm, seed=1):
+    """
+    Computes the MinHash signatures of all albums at once: for each of the hash functions (a * x + b) >> 32, the
+    smallest value over each album's photos.  Two albums agree on a signature entry with probability equal to
+    their Jaccard similarity.  Only one hash function is applied at a time, so memory stays at a few copies of
+    flat_photos however long the signatures are.
+
+    :param flat_photos: The photo numbers of all albums, one album after another.
+    :param offsets: Where each album starts in flat_photos (no album may be empty).
+    :param num_perm: Signature length.
+    :param seed: Seed for the hash functions, so runs are repeatable.
+    :return: uint64 array with one row of num_perm values per album.
+    """
+    rng = np.random.default_rng(seed)
+    # Multipliers must be odd for multiply-shift hashing
+    a = rng.integers(0, 2 ** 64, size=num_perm, dtype=np.uint64, endpoint=False) | np.uint64(1)
+    b = rng.integers(0, 2 ** 64, size=num_perm, dtype=np.uint64, endpoint=False)
+    signatures = np.empty((len(offsets), num_perm), dtype=np.uint64)
+    for i in range(num_perm):
+        signatures[:, i] = np.minimum.reduceat((a[i] * flat_photos + b[i]) >> _HASH_SHIFT, offsets)
+    return signatures
+
+
+def lsh_candidate_pairs(signatures, bands):
+    """
+    Finds the pairs of albums worth comparing with locality sensitive hashing: the signatures are cut into bands,
+    and albums whose signatures are identical in at least one band land in the same bucket.  Each album is
+    bucketed once per band, so this is linear in the number of albums rather than quadratic.
+
+    :param signatures: Array from minhash_signatures.
+    :param bands: Number of bands; must divide the signature length.
+    :return: Set of (row, row) pairs, smaller row first.
+    """
+    pairs = set()
+    rows = signatures.shape[1] // bands
+    for band in range(bands):
+        # Each album's slice of the band as a single opaque value, so np.unique can bucket them
+        keys = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows]).view(np.dtype((np.void, 8 * rows))).ravel()
+        _, bucket_of, bucket_sizes = np.unique(keys, return_inverse=True, return_counts=True)
+        shared = np.flatnonzero(bucket_sizes[bucket_of] > 1)
+        if not len(shared):
+            continue
+        shared = shared[np.argsort(bucket_of[shared], kind='stable')]
+        for bucket in np.split(shared, np.flatnonzero(np.diff(bucket_of[shared])) + 1):
+            bucket = bucket.tolist()
+            for i, first in enumerate(bucket):
+                for second in bucket[i + 1:]:
+                    pairs.add((first, second))
+    return pairs
+
+
+def _contains(superset, subset):
+    # Both are sorted arrays of distinct photo numbers
+    positions = np.searchsorted(superset, subset)
+    return bool(np.all(positions < len(superset)) and np.all(superset[np.minimum(positions, len(superset) - 1)] == subset))
+
+
+def find_duplicate_albums(memberships, near_duplicate_threshold=DEFAULT_NEAR_DUPLICATE_THRESHOLD, num_perm=DEFAULT_NUM_PERM, lsh_bands=DEFAULT_LSH_BANDS, seed=1):
+    """
+    Finds albums that have the same photos as another album, without comparing every pair of albums:
+      - exact duplicates are grouped by their set of photos,
+      - subsets are found through the rarest photo of each album, which any album containing it must also have,
+      - near duplicates are found with MinHash/LSH and then checked against the real sets of photos.
+
+    :param memberships: Dictionary of album ID to list of media item IDs, in order of preference for the album
+                        to keep (the first album of a group of duplicates is kept).  Empty albums are ignored.
+    :param near_duplicate_threshold: Lowest Jaccard similarity that counts as a near duplicate.
+    :param num_perm: MinHash signature length.
+    :param lsh_bands: Number of LSH bands; must divide num_perm.
+    :param seed: Seed for the MinHash hash functions, so runs are repeatable.
+    :return: Dictionary of album ID to (kind, ID of the album to keep instead, similarity) for every duplicate album.
+    """
+    album_ids, flat_photos, sizes, photo_count = encode_memberships(memberships)
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64)
+    duplicates = {}
+
+    # Exact duplicates: the first album with each set of photos is kept
+    kept_by_photos = {}
+    is_kept = np.ones(len(album_ids), dtype=bool)
+    for row, (album_id, start, size) in enumerate(zip(album_ids, offsets, sizes)):
+        key = flat_photos[start:start + size].tobytes()
+        if key in kept_by_photos:
+            duplicates[album_id] = (EXACT_DUPLICATE, kept_by_photos[key], 1.0)
+            is_kept[row] = False
+        else:
+            kept_by_photos[key] = album_id
+    logging.info(f"Found {len(duplicates)} exact duplicate albums")
+    if not is_kept.any():
+        return duplicates
+    # Everything else works on one album per set of photos, by row number in preference order
+    flat_photos = flat_photos[np.repeat(is_kept, sizes)]
+    album_ids = [album_id for album_id, kept in zip(album_ids, is_kept) if kept]
+    sizes = sizes[is_kept]
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64)
+    photos = np.split(flat_photos, offsets[1:])
+    row_of_flat = np.repeat(np.arange(len(album_ids)), sizes)
+
+    # Subsets: every album that contains all of A's photos contains A's rarest photo, so only those need checking
+    albums_per_photo = np.bincount(flat_photos.astype(np.int64), minlength=photo_count)
+    by_photo = np.argsort(flat_photos, kind='stable')
+    photo_starts = np.searchsorted(flat_photos[by_photo], np.arange(photo_count + 1))
+    # The rarest photo of each album: sort each album's photos by how many albums have them and take the first
+    by_rarity = np.lexsort((albums_per_photo[flat_photos.astype(np.int64)], row_of_flat))
+    rarest_photos = flat_photos[by_rarity][offsets].astype(np.int64)
+    subsets = 0
+    for row, rarest_photo in enumerate(rarest_photos):
+        others = row_of_flat[by_photo[photo_starts[rarest_photo]:photo_starts[rarest_photo + 1]]]
+        supersets = [other for other in others.tolist() if sizes[other] > sizes[row] and _contains(photos[other], photos[row])]
+        if supersets:
+            # Point at the smallest album that has all of the photos, as that is the closest match
+            superset = min(supersets, key=lambda other: (sizes[other], other))
+            duplicates[album_ids[row]] = (SUBSET, album_ids[superset], sizes[row] / sizes[superset])
+            subsets += 1
+    logging.info(f"Found {subsets} albums whose photos are all in a bigger album")
+
+    # Near duplicates: compare only the pairs LSH puts in the same bucket, most similar first
+    signatures = minhash_signatures(flat_photos, offsets, num_perm, seed)
+    scored_pairs = []
+    for first, second in lsh_candidate_pairs(signatures, lsh_bands):
+        shared = len(np.intersect1d(photos[first], photos[second], assume_unique=True))
+        similarity = shared / (sizes[first] + sizes[second] - shared)
+        if similarity >= near_duplicate_threshold:
+            scored_pairs.append((similarity, first, second))
+    near_duplicates = 0
+    for similarity, first, second in sorted(scored_pairs, key=lambda pair: -pair[0]):
+        # Keep the bigger album (or the preferred one if they are the same size)
+        keep, duplicate = (album_ids[row] for row in sorted((first, second), key=lambda row: (-sizes[row], row)))
+        # Never chain duplicates: the album kept must not itself be a duplicate of something else
+        if duplicate in duplicates or keep in duplicates:
+            continue
+        duplicates[duplicate] = (NEAR_DUPLICATE, keep, float(similarity))
+        near_duplicates += 1
+    logging.info(f"Found {near_duplicates} near duplicate albums (at least {near_duplicate_threshold:.0%} of photos in common)")
+    return duplicates
+
+
+def describe_duplicate(kind, similarity):
+    """:return: The text for the Duplicate Type column."""
+    if kind == NEAR_DUPLICATE:
+        return f"{kind} ({similarity:.0%} of photos in common)"
+    if kind == SUBSET:
+        return f"{kind} ({similarity:.0%} of the other album)"
+    return kind
+
+
+def preferred_album_order(album_list):
+    """
+    Orders the album IDs so that the album kept from a group of duplicates is the one without the 'Copy of '
+    prefix Google Photos gives copied albums, then the one that comes first in the album list.
+
+    :return: List of album IDs.
+    """
+    is_copy = album_list['Album Title'].fillna('').astype(str).str.startswith(AlbumMarkingRules.COPY_OF_PREFIX)
+    return list(album_list.assign(_is_copy=is_copy.values).sort_values('_is_copy', kind='stable')['Album ID'])
+
+
+def apply_duplicate_results(album_list, duplicates):
+    """
+    Writes the duplicate finder's results into the Duplicate Of and Duplicate Type columns.  Results from an
+    earlier run are cleared first, as the albums may have changed since.
+
+    :param album_list: DataFrame with the script's short headers.
+    :param duplicates: Dictionary from find_duplicate_albums.
+    :return: The album list.
+    """
+    album_ids = album_list['Album ID']
+    album_list[DUPLICATE_OF_COLUMN] = AlbumSchema.annotation_column(album_ids.map(lambda album_id: duplicates[album_id][1] if album_id in duplicates else ''))
+    album_list[DUPLICATE_TYPE_COLUMN] = AlbumSchema.annotation_column(album_ids.map(lambda album_id: describe_duplicate(duplicates[album_id][0], duplicates[album_id][2]) if album_id in duplicates else ''))
+    return album_list
+
+
+def compile_duplicate_delete_rules(kinds):
+    """
+    Turns the duplicate kinds to delete into rules for AlbumMarkingRules.apply_delete_rules.
+
+    :param kinds: Iterable of DUPLICATE_KINDS.
+    :return: List of (rule name, function) pairs.
+    """
+    rules = []
+    for kind in DUPLICATE_KINDS:
+        if kind in kinds:
+            # Bind kind now, not when the rule runs
+            rules.append((f"delete: {kind} album", lambda titles, album_list, kind=kind: album_list[DUPLICATE_TYPE_COLUMN].fillna('').astype(str).str.startswith(kind)))
+    return rules
+
+
+def mark_duplicate_albums(album_list, memberships, delete_kinds=(EXACT_DUPLICATE,), near_duplicate_threshold=DEFAULT_NEAR_DUPLICATE_THRESHOLD, num_perm=DEFAULT_NUM_PERM, lsh_bands=DEFAULT_LSH_BANDS):
+    """
+    Finds the duplicate albums, records them in the album list and flags the kinds chosen for deletion.
+
+    :param album_list: DataFrame with the script's short headers.
+    :param memberships: Dictionary of album ID to list of media item IDs (see GooglePhotosApi.fetch_album_memberships).
+    :param delete_kinds: Kinds of duplicate to set the Delete Flag of.
+    :return: The album list.
+    """
+    order = [album_id for album_id in preferred_album_order(album_list) if album_id in memberships]
+    duplicates = find_duplicate_albums({album_id: memberships[album_id] for album_id in order}, near_duplicate_threshold, num_perm, lsh_bands)
+    album_list = apply_duplicate_results(album_list, duplicates)
+    return AlbumMarkingRules.apply_delete_rules(album_list, compile_duplicate_delete_rules(delete_kinds))
@@ -0,0 +1,92 @@
+import re
+import logging
+import numpy as np
+import pandas as pd
+import AlbumSchema
+
+# Column that records which rule(s) marked an album
+MATCHED_RULE_COLUMN = 'Matched Rule'
+# Separator between rule names when more than one rule has marked the same album
+RULE_SEPARATOR = '; '
+# Dates the way iPhoto named its automatic event albums, e.g. "Jul 4, 2009"
+IPHOTO_EVENT_DATE_PATTERN = re.compile(r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\b \d{1,2}, \d{4}')
+# Prefix that Google Photos gives duplicated albums
+COPY_OF_PREFIX = 'Copy of '
+
+# Add your own delete criteria here!  Each entry is a (rule name, function) pair.  The function gets the album titles
+# as a Series of strings and the whole album list, and returns a boolean Series that is True for albums to delete.
+# For example: ('delete: screenshots', lambda titles, album_list: titles.str.startswith('Screenshots'))
+CUSTOM_DELETE_RULES = []
+
+
+def compile_delete_rules(delete_empty_albums, delete_albums_that_contain):
+    """
+    Turns the delete settings from the config file into an ordered list of vectorized rules.
+    The first rule that matches an album is the one recorded for it.
+
+    :param delete_empty_albums: Mark albums with no photos.
+    :param delete_albums_that_contain: String or sequence of strings; albums whose title contains any of them are marked.
+    :return: List of (rule name, function) pairs, see CUSTOM_DELETE_RULES.
+    """
+    # convert delete_albums_that_contain to a list if it's just a simple string
+    if isinstance(delete_albums_that_contain, str):
+        delete_albums_that_contain = [delete_albums_that_contain]
+    # An empty entry (e.g. from a trailing comma in the config) would match every album, so leave those out
+    needles = [s for s in delete_albums_that_contain if s]
+
+    rules = []
+    if delete_empty_albums:
+        rules.append(('delete: empty album', lambda titles, album_list: pd.to_numeric(album_list['Photo Count'], errors='coerce').eq(0)))
+    if needles:
+        # One alternation regex means every title is scanned once, however many strings are configured
+        needle_pattern = '|'.join(re.escape(s) for s in needles)
+        rules.append(('delete: title contains configured text', lambda titles, album_list: titles.str.contains(needle_pattern, regex=True)))
+    rules.append(('delete: iPhoto Events date', lambda titles, album_list: titles.str.contains('iPhoto Events', regex=False) & titles.str.contains(IPHOTO_EVENT_DATE_PATTERN, regex=True)))
+    rules.extend(CUSTOM_DELETE_RULES)
+    return rules
+
+
+def record_rule(album_list, mask, rule_name):
+    # Add the rule name to the matched rule column of the masked rows, unless it is already there
+    if MATCHED_RULE_COLUMN not in album_list.columns:
+        album_list[MATCHED_RULE_COLUMN] = AlbumSchema.annotation_column(pd.Series('', index=album_list.index))
+    existing = album_list.loc[mask, MATCHED_RULE_COLUMN].fillna('').astype(str)
+    already_recorded = (RULE_SEPARATOR + existing + RULE_SEPARATOR).str.contains(RULE_SEPARATOR + rule_name + RULE_SEPARATOR, regex=False)
+    AlbumSchema.set_values(album_list, mask, MATCHED_RULE_COLUMN, np.where(already_recorded, existing, np.where(existing == '', rule_name, existing + RULE_SEPARATOR + rule_name)))
+
+
+def apply_delete_rules(album_list, rules):
+    """
+    Sets the Delete Flag of every album matched by one of the rules, in one vectorized pass per rule.
+    Albums are never un-marked, so flags set by hand in the spreadsheet are kept.
+
+    :param album_list: DataFrame with the script's short headers.
+    :param rules: List from compile_delete_rules.
+    :return: The album list.
+    """
+    titles = album_list['Album Title'].fillna('').astype(str)
+    unmatched = pd.Series(True, index=album_list.index)
+    for rule_name, rule in rules:
+        mask = rule(titles, album_list).fillna(False).astype(bool) & unmatched
+        if mask.any():
+            album_list.loc[mask, 'Delete Flag'] = True
+            record_rule(album_list, mask, rule_name)
+            unmatched &= ~mask
+        logging.info(f"Rule '{rule_name}' marked {int(mask.sum())} albums to delete")
+    return album_list
+
+
+def apply_rename_rules(album_list):
+    """
+    Fills in the Album New Title of every album that has the 'Copy of ' prefix, in one vectorized pass.
+
+    :param album_list: DataFrame with the script's short headers.
+    :return: The album list.
+    """
+    titles = album_list['Album Title'].fillna('').astype(str)
+    mask = titles.str.contains(COPY_OF_PREFIX, regex=False)
+    if mask.any():
+        AlbumSchema.set_values(album_list, mask, 'Album New Title', titles[mask].str.replace(COPY_OF_PREFIX, '', regex=False))
+        record_rule(album_list, mask, 'rename: Copy of prefix')
+    logging.info(f"Rule 'rename: Copy of prefix' marked {int(mask.sum())} albums to rename")
+    return album_list
@@ -0,0 +1,160 @@
+import logging
+import importlib.util
+import pandas as pd
+
+# What each column of the album list is kept as in memory:
+# - text: Arrow backed strings when pyarrow is installed (it comes with the Parquet backend), which take a fraction
+#   of the memory of Python string objects;
+# - count: nullable 32-bit integers.  A count that can't be read is missing rather than 0, so a bad cell never
+#   makes an album look empty to the empty album rule;
+# - flag: True or False;
+# - annotation: text that is empty for most albums, dictionary encoded (category) so an empty cell takes one byte.
+TEXT = 'text'
+COUNT = 'count'
+FLAG = 'flag'
+ANNOTATION = 'annotation'
+# The columns of the album list, in the order the spreadsheet has them
+COLUMN_KINDS = {
+    'Album Title': TEXT,
+    'Album New Title': ANNOTATION,
+    'Photo Count': COUNT,
+    'Delete Flag': FLAG,
+    'Album ID': TEXT,
+    'Album URL': TEXT,
+    'Actions': ANNOTATION,
+    'Matched Rule': ANNOTATION,
+    'Duplicate Of': ANNOTATION,
+    'Duplicate Type': ANNOTATION,
+    'Title Cluster': ANNOTATION,
+    'Unique Photos': COUNT,
+    'Shared Photos': COUNT,
+    'Sharing Albums': COUNT,
+}
+# Columns an album list can't do without; missing optional columns are added empty
+REQUIRED_COLUMNS = ('Album Title', 'Photo Count', 'Album ID', 'Album URL')
+# Delete Flag values (in lower case) that flag an album, and ones that don't.  Anything else is reported and
+# leaves the album unflagged, as deleting is the one thing that can't be undone.
+TRUE_WORDS = frozenset({'true', 'yes', 'y', 'x', '1', '1.0'})
+FALSE_WORDS = frozenset({'', 'false', 'no', 'n', '0', '0.0', 'nan', 'none', '<na>'})
+
+
+def text_dtype():
+    """:return: The dtype text columns are kept as: Arrow backed strings if pyarrow is installed, otherwise Python strings."""
+    if importlib.util.find_spec('pyarrow') is not None:
+        return pd.StringDtype('pyarrow')
+    return pd.StringDtype('python')
+
+
+def _as_text(series):
+    # Empty spreadsheet cells come back as NaN; keep them as empty strings, like a freshly listed album
+    return series.astype(object).where(series.notna(), '').astype(str)
+
+
+def delete_flags(series):
+    """
+    Reads Delete Flag values from any source (booleans, TRUE typed in the spreadsheet, 1 from SQLite, empty cells).
+
+    :param series: The Delete Flag column.
+    :return: Tuple of (boolean Series, boolean Series of the values that were neither yes nor no).
+    """
+    if pd.api.types.is_bool_dtype(series) and not series.isna().any():
+        return series.astype(bool), pd.Series(False, index=series.index)
+    words = _as_text(series).str.strip().str.lower()
+    flags = words.isin(TRUE_WORDS)
+    return flags, ~flags & ~words.isin(FALSE_WORDS)
+
+
+def photo_counts(series):
+    """
+    Reads photo counts from any source (numbers, or the strings the API gives).
+
+    :return: Tuple of (Int32 Series, boolean Series of the values that aren't empty but aren't a count either).
+    """
+    numbers = pd.to_numeric(series, errors='coerce')
+    valid = numbers.notna() & (numbers >= 0) & (numbers % 1 == 0)
+    filled = series.notna() & (_as_text(series).str.strip() != '')
+    return numbers.where(valid).astype('Int32'), filled & ~valid
+
+
+def annotation_column(series):
+    """:return: The column as dictionary encoded text, with the empty string always one of its categories."""
+    column = _as_text(series).astype('category')
+    if '' not in column.cat.categories:
+        column = column.cat.add_categories([''])
+    return column
+
+
+def set_values(album_list, rows, column, values):
+    """
+    Writes values into some rows of a column without changing the column's type.  Text that isn't one of a
+    dictionary encoded column's categories yet is added to them first; assigning it straight away would fail,
+    and turning the column back into Python strings to get round that takes several times the memory.
+
+    :param album_list: DataFrame with the script's short headers.
+    :param rows: Boolean mask, index label or list of index labels of the rows to write.
+    :param column: Name of the column.
+    :param values: One value for all the rows, or one value per row.
+    """
+    series = album_list[column]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        new_values = pd.Series(values if pd.api.types.is_list_like(values) else [values], dtype=object).dropna().unique()
+        new_categories = pd.Index(new_values).difference(series.cat.categories)
+        if len(new_categories):
+            album_list[column] = series.cat.add_categories(new_categories)
+    album_list.loc[rows, column] = values
+
+
+def apply_schema(album_list, source='the album list'):
+    """
+    Checks an album list that has just come in (listed from the API, or read from a spreadsheet, CSV, Parquet or
+    the snapshot database) and converts its columns to their compact types (see COLUMN_KINDS).  Columns the
+    schema doesn't know, like the Account of a consolidated list, are kept as they are.  Bad values are logged and
+    made safe: a photo count that isn't a count becomes missing, and a Delete Flag that isn't yes or no doesn't flag.
+
+    :param album_list: DataFrame with the script's short headers.
+    :param source: Where the album list came from, for the log messages.
+    :return: The converted DataFrame, or None (after logging why) if a required column is missing.
+    """
+    missing_columns = [column for column in REQUIRED_COLUMNS if column not in album_list.columns]
+    if missing_columns:
+        logging.error(f"{source} is missing the columns {', '.join(missing_columns)}")
+        return None
+    columns = {}
+    for column in album_list.columns:
+        series = album_list[column]
+        kind = COLUMN_KINDS.get(column)
+        if kind == TEXT:
+            columns[column] = _as_text(series).astype(text_dtype())
+        elif kind == COUNT:
+            columns[column], bad = photo_counts(series)
+            if bad.any():
+                logging.warning(f"{int(bad.sum())} {column} values in {source} aren't whole numbers (e.g. '{series[bad].iloc[0]}'); they are left empty")
+        elif kind == FLAG:
+            columns[column], bad = delete_flags(series)
+            if bad.any():
+                logging.warning(f"{int(bad.sum())} Delete Flags in {source} aren't TRUE or empty (e.g. '{series[bad].iloc[0]}'); those albums are not flagged")
+        elif kind == ANNOTATION:
+            columns[column] = annotation_column(series)
+        else:
+            columns[column] = series
+    for column, kind in COLUMN_KINDS.items():
+        if column not in columns:
+            if kind == ANNOTATION:
+                columns[column] = annotation_column(pd.Series('', index=album_list.index))
+            elif kind == COUNT:
+                columns[column] = pd.Series(pd.NA, index=album_list.index, dtype='Int32')
+            else:
+                columns[column] = pd.Series(False, index=album_list.index)
+    typed = pd.DataFrame(columns, index=album_list.index)
+    duplicated = typed['Album ID'].duplicated()
+    if duplicated.any():
+        logging.warning(f"{int(duplicated.sum())} albums in {source} have the same Album ID as an album before them (e.g. {typed['Album ID'][duplicated].iloc[0]})")
+    return typed
+
+
+def to_file_values(album_list):
+    """:return: A copy of the album list with the Delete Flag as TRUE or an empty cell, the way the spreadsheet has always shown it."""
+    if 'Delete Flag' not in album_list.columns:
+        return album_list
+    flags, _ = delete_flags(album_list['Delete Flag'])
+    return album_list.assign(**{'Delete Flag': pd.Series(True, index=album_list.index, dtype=object).where(flags, '')})
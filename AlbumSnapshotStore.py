@@ -0,0 +1,230 @@
+import sqlite3
+import time
+import datetime
+import logging
+import pandas as pd
+
+# Columns of the album table in the snapshot database, in the same order as the album list spreadsheet.
+# The short header names are the ones used everywhere else in the script (see LONG_TO_SHORT_HEADERS).
+STORE_TO_SHORT_HEADERS = {
+    "title": "Album Title",
+    "new_title": "Album New Title",
+    "photo_count": "Photo Count",
+    "delete_flag": "Delete Flag",
+    "album_id": "Album ID",
+    "url": "Album URL",
+    "actions": "Actions",
+    "matched_rule": "Matched Rule",
+    "duplicate_of": "Duplicate Of",
+    "duplicate_type": "Duplicate Type",
+    "title_cluster": "Title Cluster",
+    "unique_photos": "Unique Photos",
+    "shared_photos": "Shared Photos",
+    "sharing_albums": "Sharing Albums",
+}
+SHORT_TO_STORE_HEADERS = {v: k for k, v in STORE_TO_SHORT_HEADERS.items()}
+# Columns that only ever change locally.  A sync never touches these.
+ANNOTATION_COLUMNS = ("new_title", "delete_flag", "actions", "matched_rule", "duplicate_of", "duplicate_type", "title_cluster",
+                      "unique_photos", "shared_photos", "sharing_albums")
+# Annotations that are counts (from the media inventory) rather than text; NULL until an inventory is taken
+COUNT_COLUMNS = ("unique_photos", "shared_photos", "sharing_albums")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS albums (
+    album_id    TEXT PRIMARY KEY,
+    title       TEXT,
+    new_title   TEXT DEFAULT '',
+    photo_count INTEGER,
+    delete_flag DEFAULT '',
+    url         TEXT,
+    actions     TEXT DEFAULT '',
+    matched_rule TEXT DEFAULT '',
+    duplicate_of TEXT DEFAULT '',
+    duplicate_type TEXT DEFAULT '',
+    title_cluster TEXT DEFAULT '',
+    unique_photos INTEGER,
+    shared_photos INTEGER,
+    sharing_albums INTEGER,
+    first_seen  TEXT,
+    last_seen   TEXT
+);
+CREATE INDEX IF NOT EXISTS albums_last_seen ON albums (last_seen);
+CREATE INDEX IF NOT EXISTS albums_delete_flag ON albums (delete_flag);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def open_snapshot_store(db_file):
+    """
+    Opens (and creates if needed) the local album snapshot database.
+
+    :param db_file: Path to the SQLite file.
+    :return: An open sqlite3 connection.
+    """
+    conn = sqlite3.connect(db_file)
+    # WAL lets the spreadsheet export read while a sync is still writing
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    # Snapshots made by older versions of the script are missing the newer columns
+    existing_columns = {row[1] for row in conn.execute("PRAGMA table_info(albums)")}
+    for column in STORE_TO_SHORT_HEADERS:
+        if column not in existing_columns:
+            column_type = "INTEGER" if column in COUNT_COLUMNS else "TEXT DEFAULT ''"
+            conn.execute(f"ALTER TABLE albums ADD COLUMN {column} {column_type}")
+    return conn
+
+
+def get_meta(conn, key, default=None):
+    """Returns a value from the snapshot's key/value metadata table."""
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_meta(conn, key, value):
+    """Stores a value in the snapshot's key/value metadata table."""
+    with conn:
+        conn.execute("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, str(value)))
+
+
+def reset_snapshot(conn):
+    """
+    Forgets every annotation in the snapshot, the albums the last finished sync didn't see and any sync in progress
+    (used when the album list is downloaded from scratch).  The albums themselves stay until a listing that
+    finishes replaces them, so one that stops early (e.g. at album_list_length_limit) never loses any.
+    """
+    cleared = ", ".join(f"{c} = NULL" if c in COUNT_COLUMNS else f"{c} = ''" for c in ANNOTATION_COLUMNS)
+    with conn:
+        conn.execute("DELETE FROM albums WHERE last_seen < COALESCE((SELECT value FROM meta WHERE key = 'finished_sync_time'), '')")
+        conn.execute(f"UPDATE albums SET {cleared}")
+        conn.execute("DELETE FROM meta WHERE key IN ('sync_page_token', 'sync_time')")
+
+
+def _to_db_value(value):
+    # pandas gives NaN (or NA for nullable counts) for empty cells, SQLite wants NULL
+    if value is None or value is pd.NA or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if hasattr(value, 'item'):
+        # numpy scalar
+        return value.item()
+    return value
+
+
+def sync_checkpoint(conn):
+    """:return: The page token to resume an interrupted sync from, or None if the last sync finished."""
+    return get_meta(conn, 'sync_page_token')
+
+
+def sync_albums(conn, pages):
+    """
+    Brings the snapshot up to date with a fresh listing from the API, one page at a time.  Only new and changed
+    albums are written; local annotations (new title, delete flag, actions) are never overwritten.  Each page
+    is committed together with the token of the next page, so an interrupted sync can be resumed from
+    sync_checkpoint() and memory use doesn't grow with the size of the library.
+
+    :param conn: Connection from open_snapshot_store.
+    :param pages: Iterable of albums().list responses (dictionaries with 'albums' and 'nextPageToken').
+    :return: A dictionary with the number of added, updated, unchanged and no-longer-seen albums, and whether the listing finished.
+    """
+    sync_time = get_meta(conn, 'sync_time') if sync_checkpoint(conn) else None
+    if sync_time:
+        logging.info(f"Resuming the album sync started at {sync_time}")
+    else:
+        # Microseconds, so two syncs in the same second can still be told apart
+        sync_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+        set_meta(conn, 'sync_time', sync_time)
+    summary = {'added': 0, 'updated': 0, 'unchanged': 0, 'missing': 0, 'finished': False}
+    for results in pages:
+        albums = results.get('albums', [])
+        ids = [album.get('id', 'No ID') for album in albums]
+        # Only look up the albums on this page, so nothing grows with the library
+        known = {row[0]: (row[1], row[2], row[3]) for row in conn.execute(f"SELECT album_id, title, photo_count, url FROM albums WHERE album_id IN ({', '.join('?' * len(ids))})", ids)} if ids else {}
+        added, updated = [], []
+        for album_id, album in zip(ids, albums):
+            current = (album.get('title', 'Untitled'), int(album.get('mediaItemsCount', 0)), album.get('productUrl', 'No URL'))
+            if album_id not in known:
+                added.append((album_id, *current, sync_time, sync_time))
+            elif known[album_id] != current:
+                updated.append((*current, album_id))
+        next_page_token = results.get('nextPageToken')
+        with conn:
+            conn.executemany("INSERT INTO albums (album_id, title, photo_count, url, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?)", added)
+            conn.executemany("UPDATE albums SET title = ?, photo_count = ?, url = ? WHERE album_id = ?", updated)
+            conn.executemany("UPDATE albums SET last_seen = ? WHERE album_id = ?", [(sync_time, album_id) for album_id in ids])
+            # The checkpoint is committed with the page, so a resumed sync never skips or repeats a page
+            if next_page_token:
+                conn.execute("INSERT INTO meta (key, value) VALUES ('sync_page_token', ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value", (next_page_token,))
+            else:
+                conn.execute("DELETE FROM meta WHERE key = 'sync_page_token'")
+                conn.execute("INSERT INTO meta (key, value) VALUES ('finished_sync_time', ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value", (sync_time,))
+                summary['finished'] = True
+        summary['added'] += len(added)
+        summary['updated'] += len(updated)
+        summary['unchanged'] += len(ids) - len(added) - len(updated)
+    if not summary['finished']:
+        logging.warning('The album listing stopped before the last page. Sync again to carry on from where it stopped.')
+        return summary
+    summary['missing'] = conn.execute("SELECT COUNT(*) FROM albums WHERE last_seen < ?", (sync_time,)).fetchone()[0]
+    logging.info(f"Snapshot sync: {summary['added']} added, {summary['updated']} updated, {summary['unchanged']} unchanged, {summary['missing']} no longer in Google Photos")
+    return summary
+
+
+def load_album_list(conn, only_seen_in_last_sync=True):
+    """
+    Reads the album list from the snapshot into a DataFrame with the script's short headers.
+
+    :param conn: Connection from open_snapshot_store.
+    :param only_seen_in_last_sync: Leave out albums that were not returned by the most recent finished sync (e.g. already deleted).
+    :return: A pandas DataFrame.
+    """
+    columns = ", ".join(STORE_TO_SHORT_HEADERS.keys())
+    query = f"SELECT {columns} FROM albums"
+    if only_seen_in_last_sync:
+        # Albums seen by a sync that is still in progress are newer than that, so they are included too
+        query += " WHERE last_seen >= COALESCE((SELECT value FROM meta WHERE key = 'finished_sync_time'), '')"
+    query += " ORDER BY rowid"
+    df = pd.read_sql_query(query, conn)
+    df.rename(columns=STORE_TO_SHORT_HEADERS, inplace=True)
+    # Keep empty annotations as empty strings, the same as a freshly listed album
+    df[[STORE_TO_SHORT_HEADERS[c] for c in ANNOTATION_COLUMNS]] = df[[STORE_TO_SHORT_HEADERS[c] for c in ANNOTATION_COLUMNS]].fillna('')
+    return df
+
+
+def import_album_list(conn, album_list):
+    """
+    Seeds the snapshot from an existing album list (e.g. a spreadsheet written before the snapshot existed).
+    Albums already in the snapshot keep their listing data; annotations are taken from the album list.
+
+    :param conn: Connection from open_snapshot_store.
+    :param album_list: DataFrame with the script's short headers.
+    """
+    import_time = time.strftime('%Y-%m-%d %H:%M:%S')
+    # Imported albums count as seen in the latest sync, so they show up alongside the albums already there
+    last_seen = conn.execute("SELECT MAX(last_seen) FROM albums").fetchone()[0] or import_time
+    counts = pd.to_numeric(album_list['Photo Count'], errors='coerce')
+    rows = [(str(album_id), title, None if pd.isna(count) else int(count), url, import_time, last_seen)
+            for album_id, title, count, url in zip(album_list['Album ID'], album_list['Album Title'], counts, album_list['Album URL'])]
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO albums (album_id, title, photo_count, url, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?)", rows)
+    save_annotations(conn, album_list)
+
+
+def save_annotations(conn, album_list):
+    """
+    Writes the local annotations (new title, delete flag, actions) of an album list back to the snapshot.
+    Albums that are not in the snapshot yet are ignored.
+
+    :param conn: Connection from open_snapshot_store.
+    :param album_list: DataFrame with the script's short headers.
+    :return: Number of albums written.
+    """
+    # Only write the annotation columns this album list actually has
+    columns = [c for c in ANNOTATION_COLUMNS if STORE_TO_SHORT_HEADERS[c] in album_list.columns]
+    short_columns = [STORE_TO_SHORT_HEADERS[c] for c in columns]
+    rows = [tuple(_to_db_value(v) for v in row) for row in album_list[short_columns + ['Album ID']].itertuples(index=False, name=None)]
+    assignments = ", ".join(f"{c} = ?" for c in columns)
+    with conn:
+        conn.executemany(f"UPDATE albums SET {assignments} WHERE album_id = ?", rows)
+    return len(rows)
@@ -0,0 +1,337 @@
+import os
+import json
+import logging
+import pandas as pd
+import AlbumSnapshotStore
+import AlbumSchema
+import RunMetrics
+from ConfigChoices import FILE_BACKENDS, BACKENDS
+
+# Columns that are only ever changed locally (by the marking rules, by hand or by the deleter/renamer).
+# Syncing with Google Photos keeps these and refreshes everything else.
+ANNOTATION_HEADERS = ('Album New Title', 'Delete Flag', 'Actions', 'Matched Rule', 'Duplicate Of', 'Duplicate Type', 'Title Cluster',
+                      'Unique Photos', 'Shared Photos', 'Sharing Albums')
+# Columns that come from the albums().list API
+LISTING_HEADERS = ['Album Title', 'Photo Count', 'Album ID', 'Album URL']
+
+
+def albums_to_frame(albums):
+    """
+    Turns album dictionaries from the albums().list API into an album list with the script's short headers.
+
+    :param albums: Iterable of album dictionaries.
+    :return: A pandas DataFrame with the column types of AlbumSchema.
+    """
+    album_data = {'Album Title': [], 'Photo Count': [], 'Album ID': [], 'Album URL': []}
+    for album in albums:
+        album_data['Album Title'].append(album.get('title', 'Untitled'))
+        # The API gives the count as a string; the schema makes it a number
+        album_data['Photo Count'].append(album.get('mediaItemsCount', 0))
+        album_data['Album ID'].append(album.get('id', 'No ID'))
+        album_data['Album URL'].append(album.get('productUrl', 'No URL'))
+    # The annotation columns start out empty, which the schema keeps without a placeholder string per album
+    return AlbumSchema.apply_schema(pd.DataFrame(album_data), 'the Google Photos album listing')[list(AlbumSchema.COLUMN_KINDS)]
+
+
+class AlbumFileStore:
+    """
+    Album list kept in a single XLSX, CSV or Parquet file.  The file uses the long spreadsheet headers, so it
+    can be opened in a spreadsheet program; the script works with the short headers.
+
+    :param file_path: Path to the album list file.
+    :param file_format: One of FILE_BACKENDS.
+    :param long_to_short_headers: Header translation for the required columns.
+    :param optional_long_to_short_headers: Header translation for columns that may be missing from older files.
+    """
+
+    def __init__(self, file_path, file_format, long_to_short_headers, optional_long_to_short_headers=None):
+        self.file_path = file_path
+        self.file_format = file_format
+        self.long_to_short_headers = long_to_short_headers
+        self.optional_long_to_short_headers = optional_long_to_short_headers or {}
+        all_headers = {**long_to_short_headers, **self.optional_long_to_short_headers}
+        self.short_to_long_headers = {v: k for k, v in all_headers.items()}
+
+    def exists(self):
+        return os.path.exists(self.file_path)
+
+    def read(self):
+        """
+        Reads the album list, renames the columns to the short headers and logs errors for missing columns or file.
+
+        :return: A pandas DataFrame with short headers or None if an error occurs.
+        """
+        # Check if the file exists
+        if not self.exists():
+            logging.error(f"File not found: {self.file_path}")
+            return None
+
+        try:
+            with RunMetrics.metrics.timer('album_list_io_seconds', operation='read', format=self.file_format):
+                if self.file_format == 'xlsx':
+                    df = pd.read_excel(self.file_path)
+                elif self.file_format == 'csv':
+                    # Keep empty cells as empty strings, like a freshly listed album
+                    df = pd.read_csv(self.file_path, keep_default_na=False)
+                else:
+                    df = pd.read_parquet(self.file_path)
+        except Exception as e:
+            logging.error(f"Error reading the {self.file_format} file: {e}")
+            return None
+
+        # Check for missing expected columns
+        missing_columns = set(self.long_to_short_headers.keys()) - set(df.columns)
+        if missing_columns:
+            logging.error(f"Missing expected columns: {missing_columns}")
+            return None
+
+        # Add any optional columns the file doesn't have yet
+        for long_header in self.optional_long_to_short_headers:
+            if long_header not in df.columns:
+                df[long_header] = ''
+
+        # Rename columns
+        df = df.rename(columns={**self.long_to_short_headers, **self.optional_long_to_short_headers})
+        # Empty spreadsheet cells come back as NaN, which bool() treats as True; the schema checks and types every column
+        return AlbumSchema.apply_schema(df, self.file_path)
+
+    def write(self, album_list):
+        """
+        Writes the album list, overwriting the file if it already exists.
+
+        :param album_list: DataFrame with short headers.
+        """
+        # Check if the file already exists
+        if self.exists():
+            logging.info(f"Overwriting existing file: {self.file_path}")
+        df = AlbumSchema.to_file_values(album_list).rename(columns=self.short_to_long_headers)
+        with RunMetrics.metrics.timer('album_list_io_seconds', operation='write', format=self.file_format):
+            if self.file_format == 'xlsx':
+                df.to_excel(self.file_path, index=False)
+            elif self.file_format == 'csv':
+                df.to_csv(self.file_path, index=False)
+            else:
+                df = _to_parquet_safe_types(df, self.short_to_long_headers)
+                df.to_parquet(self.file_path, index=False)
+        logging.info(f"Data written to {self.file_path}")
+
+    def reset(self):
+        """
+        Forgets the annotations in the album list, and any sync that was in progress.  The albums themselves stay
+        until a listing that finishes replaces them, so one that stops early never loses any.
+        """
+        for path in (self.partial_path, self.checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+        if not self.exists():
+            return
+        album_list = self.read()
+        if album_list is None:
+            # Nothing worth keeping in a file that can't be read
+            os.remove(self.file_path)
+            return
+        self.write(AlbumSchema.apply_schema(album_list[LISTING_HEADERS], self.file_path)[list(AlbumSchema.COLUMN_KINDS)])
+
+    @property
+    def partial_path(self):
+        # Listing rows are appended here while a sync is running
+        return self.file_path + '.partial.csv'
+
+    @property
+    def checkpoint_path(self):
+        return self.file_path + '.checkpoint.json'
+
+    def checkpoint(self):
+        """:return: The page token to resume an interrupted sync from, or None if the last sync finished."""
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as checkpoint:
+                return json.load(checkpoint).get('page_token')
+        except (OSError, ValueError) as e:
+            logging.error(f"Error reading sync checkpoint {self.checkpoint_path}: {e}")
+            return None
+
+    def _write_checkpoint(self, page_token):
+        # Write and rename, so a crash never leaves half a checkpoint behind
+        temporary_path = self.checkpoint_path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as checkpoint:
+            json.dump({'page_token': page_token}, checkpoint)
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def sync(self, pages):
+        """
+        Replaces the listing data (title, photo count, URL) with a fresh listing from the API while keeping the
+        annotations of albums that were already in the list.  Albums no longer in Google Photos are dropped, but
+        only once a listing has finished.  Pages are appended to a partial CSV file as they arrive, with the next
+        page token saved as a checkpoint, so an interrupted sync can be resumed.  A listing that stopped before its
+        last page (e.g. at album_list_length_limit) brings the albums listed so far up to date and keeps the rest.
+
+        :param pages: Iterable of albums().list responses (dictionaries with 'albums' and 'nextPageToken').
+        :return: The synced album list, or None if the listing didn't finish.
+        """
+        if self.checkpoint() is None:
+            # Rows from a sync that never got as far as its first checkpoint
+            if os.path.exists(self.partial_path):
+                os.remove(self.partial_path)
+        else:
+            logging.info(f"Resuming the album sync in {self.partial_path}")
+        finished = False
+        for results in pages:
+            page = albums_to_frame(results.get('albums', []))[LISTING_HEADERS]
+            page.to_csv(self.partial_path, mode='a', header=not os.path.exists(self.partial_path), index=False)
+            next_page_token = results.get('nextPageToken')
+            if next_page_token:
+                self._write_checkpoint(next_page_token)
+            else:
+                finished = True
+        if not finished:
+            logging.warning('The album listing stopped before the last page. Sync again to carry on from where it stopped.')
+            if os.path.exists(self.partial_path):
+                self.write(self._merge_listing(self._read_partial(), keep_unlisted=True))
+            return None
+
+        fresh = self._merge_listing(self._read_partial(), keep_unlisted=False)
+        self.write(fresh)
+        os.remove(self.partial_path)
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        return AlbumSchema.apply_schema(fresh, self.file_path)
+
+    def _read_partial(self):
+        fresh = pd.read_csv(self.partial_path, keep_default_na=False, dtype={'Album Title': str, 'Album ID': str, 'Album URL': str})
+        # A crash between appending a page and saving its checkpoint means that page was listed twice
+        return fresh.drop_duplicates('Album ID', keep='last').reset_index(drop=True)
+
+    def _merge_listing(self, fresh, keep_unlisted):
+        """
+        Combines listed albums with the album list in the file: the listing data comes from the listing and the
+        annotations from the file.
+
+        :param fresh: DataFrame of the listed albums, with the LISTING_HEADERS.
+        :param keep_unlisted: Keep the albums in the file that weren't listed, because the listing hasn't finished;
+                              otherwise they are dropped as no longer in Google Photos.
+        :return: The combined album list.
+        """
+        columns = list(albums_to_frame([]).columns)
+        fresh = fresh.assign(**{header: '' for header in ANNOTATION_HEADERS})[columns]
+        existing = self.read() if self.exists() else None
+        if existing is None:
+            return fresh
+        annotations = existing.drop_duplicates('Album ID').set_index('Album ID')[[c for c in ANNOTATION_HEADERS if c in existing.columns]]
+        annotations.index = annotations.index.astype(str)
+        known = fresh['Album ID'].isin(annotations.index)
+        fresh = fresh.drop(columns=annotations.columns).join(annotations, on='Album ID')
+        # New albums have no annotations yet; counts stay missing, the rest are empty strings
+        text_columns = [c for c in annotations.columns if AlbumSchema.COLUMN_KINDS.get(c) != AlbumSchema.COUNT]
+        fresh[text_columns] = fresh[text_columns].fillna('')
+        fresh = fresh[columns]
+        unlisted = existing[~existing['Album ID'].astype(str).isin(fresh['Album ID'])]
+        if keep_unlisted:
+            logging.info(f"Album list sync so far: {int((~known).sum())} added, {int(known.sum())} kept, {len(unlisted)} not listed yet")
+            return pd.concat([fresh, unlisted[columns]], ignore_index=True)
+        logging.info(f"Album list sync: {int((~known).sum())} added, {int(known.sum())} kept, {len(unlisted)} no longer in Google Photos")
+        return fresh
+
+
+class AlbumSqliteStore:
+    """
+    Album list kept in the SQLite snapshot database (see AlbumSnapshotStore).  Syncs only write new and
+    changed albums, and saving only writes the annotation columns.
+
+    :param file_path: Path to the database file.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file_format = 'sqlite'
+
+    def exists(self):
+        return os.path.exists(self.file_path)
+
+    def read(self):
+        if not self.exists():
+            logging.error(f"File not found: {self.file_path}")
+            return None
+        conn = AlbumSnapshotStore.open_snapshot_store(self.file_path)
+        try:
+            with RunMetrics.metrics.timer('album_list_io_seconds', operation='read', format=self.file_format):
+                album_list = AlbumSnapshotStore.load_album_list(conn)
+        finally:
+            conn.close()
+        return AlbumSchema.apply_schema(album_list, self.file_path)
+
+    def write(self, album_list):
+        conn = AlbumSnapshotStore.open_snapshot_store(self.file_path)
+        try:
+            # Albums that aren't in the snapshot yet (e.g. imported from a spreadsheet) are added first
+            with RunMetrics.metrics.timer('album_list_io_seconds', operation='write', format=self.file_format):
+                AlbumSnapshotStore.import_album_list(conn, album_list)
+        finally:
+            conn.close()
+        logging.info(f"Data written to {self.file_path}")
+
+    def reset(self):
+        """Forgets the annotations and any sync that was in progress, see AlbumSnapshotStore.reset_snapshot."""
+        conn = AlbumSnapshotStore.open_snapshot_store(self.file_path)
+        try:
+            AlbumSnapshotStore.reset_snapshot(conn)
+        finally:
+            conn.close()
+
+    def checkpoint(self):
+        if not self.exists():
+            return None
+        conn = AlbumSnapshotStore.open_snapshot_store(self.file_path)
+        try:
+            return AlbumSnapshotStore.sync_checkpoint(conn)
+        finally:
+            conn.close()
+
+    def sync(self, pages):
+        """
+        Brings the snapshot up to date with a listing from the API (see AlbumSnapshotStore.sync_albums).
+
+        :return: The synced album list, or None if the listing didn't finish.
+        """
+        conn = AlbumSnapshotStore.open_snapshot_store(self.file_path)
+        try:
+            if not AlbumSnapshotStore.sync_albums(conn, pages)['finished']:
+                return None
+            album_list = AlbumSnapshotStore.load_album_list(conn)
+        finally:
+            conn.close()
+        return AlbumSchema.apply_schema(album_list, self.file_path)
+
+
+def _to_parquet_safe_types(df, short_to_long_headers):
+    # Parquet columns need one type, but the album list mixes strings, numbers, booleans and NaN in the same column
+    df = df.copy()
+    delete_flag = short_to_long_headers['Delete Flag']
+    for short_header, kind in AlbumSchema.COLUMN_KINDS.items():
+        if kind == AlbumSchema.COUNT and short_to_long_headers.get(short_header) in df.columns:
+            df[short_to_long_headers[short_header]] = pd.to_numeric(df[short_to_long_headers[short_header]], errors='coerce').astype('Int64')
+    # Keep the flag readable as the word TRUE, which is also what the spreadsheet uses
+    df[delete_flag] = df[delete_flag].map(lambda flag: 'TRUE' if flag is True or str(flag).upper() in ('TRUE', '1', '1.0') else '')
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].fillna('').astype(str)
+    return df
+
+
+def open_album_store(backend, file_path, long_to_short_headers, optional_long_to_short_headers=None):
+    """
+    Creates the album list store for the configured backend.
+
+    :param backend: One of BACKENDS.
+    :param file_path: Where the album list is kept.
+    :param long_to_short_headers: Header translation for the file backends.
+    :param optional_long_to_short_headers: Header translation for optional columns of the file backends.
+    :return: An AlbumFileStore or AlbumSqliteStore, or None if the backend is unknown.
+    """
+    if backend == 'sqlite':
+        return AlbumSqliteStore(file_path)
+    if backend in FILE_BACKENDS:
+        return AlbumFileStore(file_path, backend, long_to_short_headers, optional_long_to_short_headers)
+    logging.error(f"Unknown album storage backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    return None
@@ -0,0 +1,207 @@
+import re
+import logging
+from collections import Counter, defaultdict
+import pandas as pd
+import AlbumMarkingRules
+import AlbumSchema
+
+# Column the title clustering fills in: the cluster's canonical title and what this album is in the cluster
+TITLE_CLUSTER_COLUMN = 'Title Cluster'
+KEEP = 'keep'
+COPY = 'copy'
+SIMILAR = 'similar'
+# Titles whose trigrams overlap at least this much (Jaccard similarity) are clustered together
+DEFAULT_SIMILARITY_THRESHOLD = 0.8
+# How many neighbours in sorted order each title is compared with
+DEFAULT_WINDOW = 8
+
+# Ways albums get copied: "Copy of Trip", "Trip (1)", "Trip copy", "Trip - Copy 2".  These are always stripped.
+_COPY_PREFIX_PATTERN = re.compile(r'^\s*copy of\s+', re.IGNORECASE)
+_COPY_SUFFIX_PATTERN = re.compile(r'(?:\s*\(\d{1,3}\)|[\s\-_]+copy(?:\s*\d{1,3})?)\s*$', re.IGNORECASE)
+# "Trip 2" is only taken for a copy of "Trip" if there is a "Trip" album; otherwise "Week 1" to "Week 52" would be one album
+_NUMBER_SUFFIX_PATTERN = re.compile(r'^(.*\S)\s+\d{1,2}$')
+_NUMBER_PATTERN = re.compile(r'\d+')
+_NOT_WORD_PATTERN = re.compile(r'[\W_]+')
+_APOSTROPHE_PATTERN = re.compile(r"['\u2019]")
+
+
+def strip_copy_markers(title):
+    """:return: The title without the 'Copy of ' prefix and copy suffixes like ' (1)' or ' copy', e.g. 'Copy of Trip (2)' -> 'Trip'."""
+    title = str(title).strip()
+    while True:
+        stripped = _COPY_SUFFIX_PATTERN.sub('', _COPY_PREFIX_PATTERN.sub('', title)).strip()
+        if stripped == title or not stripped:
+            return title
+        title = stripped
+
+
+def _normalize(title):
+    # Case, punctuation and spacing don't make two titles different, and "Grandma's" is "Grandmas"
+    return _NOT_WORD_PATTERN.sub(' ', _APOSTROPHE_PATTERN.sub('', title.casefold())).strip()
+
+
+def title_keys(titles):
+    """
+    Reduces each title to the key its copies share: without copy markers, in lower case and without punctuation.
+    A trailing small number ('Trip 2') is only dropped if the title without it is another album's key.
+
+    :param titles: Iterable of album titles.
+    :return: List of keys, one per title.
+    """
+    keys = [_normalize(strip_copy_markers(title)) for title in titles]
+    known = set(keys)
+    for i, key in enumerate(keys):
+        match = _NUMBER_SUFFIX_PATTERN.match(key)
+        if match and match.group(1) in known:
+            keys[i] = match.group(1)
+    return keys
+
+
+def _trigrams(key):
+    # Padded so short keys and the start of a key count too
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similar_key_pairs(keys, threshold=DEFAULT_SIMILARITY_THRESHOLD, window=DEFAULT_WINDOW):
+    """
+    Finds pairs of keys whose trigram sets have a Jaccard similarity of at least threshold, without comparing every
+    pair (sorted neighbourhood blocking): the keys are sorted, and each is only compared with the next window keys.
+    A typo near the end of a title keeps it next to the original in that order; one near the start doesn't, so the
+    keys are also sorted by their reversed text and compared again.  That is O(n log n) for the sorts plus
+    2 * window comparisons per key, however alike the titles are.  Keys with different numbers in them (years,
+    dates) never match.
+
+    :param keys: List of distinct keys from title_keys.
+    :param window: How many neighbours in each sort order every key is compared with.
+    :return: Set of (index, index) pairs into keys, the smaller index first.
+    """
+    gram_sets = [_trigrams(key) for key in keys]
+    sizes = [len(grams) for grams in gram_sets]
+    # A set smaller than threshold times the other's size can't reach the threshold
+    min_sizes = [threshold * size for size in sizes]
+    numbers = [_NUMBER_PATTERN.findall(key) for key in keys]
+    pairs = set()
+    # Keys with different numbers never match, so sorting by the numbers first keeps the window for keys that can
+    for sort_key in (lambda i: (numbers[i], keys[i]), lambda i: (numbers[i], keys[i][::-1])):
+        order = sorted(range(len(keys)), key=sort_key)
+        for position, i in enumerate(order):
+            for j in order[position + 1:position + 1 + window]:
+                if sizes[j] < min_sizes[i] or sizes[i] < min_sizes[j] or numbers[i] != numbers[j]:
+                    continue
+                common = len(gram_sets[i] & gram_sets[j])
+                if common >= threshold * (sizes[i] + sizes[j] - common):
+                    pairs.add((min(i, j), max(i, j)))
+    return pairs
+
+
+def cluster_titles(titles, threshold=DEFAULT_SIMILARITY_THRESHOLD, window=DEFAULT_WINDOW):
+    """
+    Groups titles that are copies of each other or nearly the same.
+
+    :param titles: List of album titles.
+    :return: Tuple of (cluster number per title, key per title).  Titles in the same cluster share a number;
+             a title on its own has a cluster of its own.
+    """
+    keys = title_keys(titles)
+    key_numbers, distinct_keys = pd.factorize(pd.Series(keys, dtype=object))
+    parents = list(range(len(distinct_keys)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for i, j in similar_key_pairs(list(distinct_keys), threshold, window):
+        parents[find(i)] = find(j)
+    roots = [find(i) for i in range(len(distinct_keys))]
+    return [roots[number] for number in key_numbers], keys
+
+
+def describe_cluster_member(canonical_title, role):
+    """:return: The text for the Title Cluster column, e.g. "Trip (copy)"."""
+    return f"{canonical_title} ({role})"
+
+
+def find_title_clusters(album_list, threshold=DEFAULT_SIMILARITY_THRESHOLD, window=DEFAULT_WINDOW):
+    """
+    Clusters the album titles and picks what to do with each album in a cluster of two or more:
+    - the album to keep: one with the key most of the cluster shares, preferring a title without copy markers,
+      then the most photos, then the first in the album list;
+    - copies: the other albums with the same key and no more photos than the kept one, which can be deleted;
+    - similar: the rest, which can be renamed to the canonical title (the kept album's title without copy markers).
+
+    :param album_list: DataFrame with the script's short headers.
+    :return: Dictionary of album list index to (canonical title, role), for albums in clusters only.
+    """
+    titles = album_list['Album Title'].fillna('').astype(str).tolist()
+    clusters, keys = cluster_titles(titles, threshold, window)
+    photo_counts = pd.to_numeric(album_list['Photo Count'], errors='coerce').fillna(0).tolist()
+    members = defaultdict(list)
+    for position, cluster in enumerate(clusters):
+        members[cluster].append(position)
+
+    results = {}
+    for positions in members.values():
+        if len(positions) < 2:
+            continue
+        key_counts = Counter(keys[position] for position in positions)
+        canonical_key = max(key_counts, key=lambda key: key_counts[key])
+        same_key = [position for position in positions if keys[position] == canonical_key]
+        # min() keeps the first of equals, which is the first in the album list
+        keeper = min(same_key, key=lambda position: (_normalize(titles[position]) != canonical_key, -photo_counts[position]))
+        canonical_title = strip_copy_markers(titles[keeper])
+        for position in positions:
+            if position == keeper:
+                role = KEEP
+            elif keys[position] == canonical_key and photo_counts[position] <= photo_counts[keeper]:
+                role = COPY
+            else:
+                role = SIMILAR
+            results[album_list.index[position]] = (canonical_title, role)
+    return results
+
+
+def apply_title_clusters(album_list, clusters):
+    """
+    Writes the clusters into the Title Cluster column (clearing results from an earlier run) and suggests the
+    canonical title as the Album New Title of the kept and similar albums whose title differs from it.
+    New titles that are already filled in (e.g. by hand) are kept.
+
+    :param clusters: Dictionary from find_title_clusters.
+    :return: The album list.
+    """
+    album_list[TITLE_CLUSTER_COLUMN] = AlbumSchema.annotation_column(pd.Series([describe_cluster_member(*clusters[index]) if index in clusters else '' for index in album_list.index],
+                                                                               index=album_list.index, dtype=object))
+    titles = album_list['Album Title'].fillna('').astype(str).str.strip()
+    new_titles = album_list['Album New Title'].fillna('').astype(str)
+    canonical = pd.Series({index: title for index, (title, role) in clusters.items() if role != COPY}, dtype=object).reindex(album_list.index)
+    mask = canonical.notna() & (canonical != titles) & (new_titles == '')
+    if mask.any():
+        AlbumSchema.set_values(album_list, mask, 'Album New Title', canonical[mask])
+        AlbumMarkingRules.record_rule(album_list, mask, 'rename: similar title')
+    logging.info(f"Title clustering found {len({title for title, _ in clusters.values()})} groups of similar titles and suggested {int(mask.sum())} new titles")
+    return album_list
+
+
+def compile_title_copy_delete_rules():
+    """:return: Rules for AlbumMarkingRules.apply_delete_rules that mark the copies found by the title clustering."""
+    suffix = f" ({COPY})"
+    return [('delete: copy of a similar title', lambda titles, album_list: album_list[TITLE_CLUSTER_COLUMN].fillna('').astype(str).str.endswith(suffix))]
+
+
+def mark_title_clusters(album_list, threshold=DEFAULT_SIMILARITY_THRESHOLD, delete_copies=False, window=DEFAULT_WINDOW):
+    """
+    Clusters similar album titles, records the clusters, suggests new titles and, with delete_copies, flags the copies.
+
+    :param album_list: DataFrame with the script's short headers.
+    :param threshold: Trigram similarity two titles need to be clustered.
+    :param delete_copies: Set the Delete Flag of the albums found to be copies.
+    :param window: How many neighbours each title is compared with; more finds a few more typos but takes longer.
+    :return: The album list.
+    """
+    album_list = apply_title_clusters(album_list, find_title_clusters(album_list, threshold, window))
+    if delete_copies:
+        album_list = AlbumMarkingRules.apply_delete_rules(album_list, compile_title_copy_delete_rules())
+    return album_list
@@ -0,0 +1,13 @@
+# Values the config file chooses between.  They are kept apart from the modules that use them, which import
+# pandas, so the config file can be read and checked without loading pandas before the menu even shows.
+
+# File formats the album list can be kept in, and the file extension each one uses by default
+FILE_BACKENDS = {'xlsx': '.xlsx', 'csv': '.csv', 'parquet': '.parquet'}
+BACKENDS = ('sqlite', *FILE_BACKENDS)
+# Kinds of duplicate album, in the order they are looked for.  An album only gets the first kind it matches.
+EXACT_DUPLICATE = 'exact duplicate'
+SUBSET = 'subset'
+NEAR_DUPLICATE = 'near duplicate'
+DUPLICATE_KINDS = (EXACT_DUPLICATE, SUBSET, NEAR_DUPLICATE)
+# Albums sharing at least this fraction of their photos (Jaccard similarity) count as near duplicates
+DEFAULT_NEAR_DUPLICATE_THRESHOLD = 0.8
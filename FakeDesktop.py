@@ -0,0 +1,202 @@
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+# pyautogui sleeps this long after every call unless its PAUSE setting is changed
+PYAUTOGUI_PAUSE = 0.1
+
+
+class VirtualClock:
+    """
+    A clock that only moves when something sleeps on it, so the mouse driving code can be run through thousands
+    of albums in a moment while still adding up how long it would have taken for real.
+
+    :param start: Seconds the clock starts at.
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self.sleeps = 0
+        self.lock = threading.Lock()
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.now += max(0.0, seconds)
+            self.sleeps += 1
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def time_module(self):
+        """:return: A stand-in for the time module that runs on this clock (everything else is the real time module)."""
+        return _VirtualTimeModule(self)
+
+
+class _VirtualTimeModule:
+    def __init__(self, clock):
+        self._clock = clock
+        self.sleep = clock.sleep
+        self.monotonic = clock.monotonic
+        self.perf_counter = clock.monotonic
+        self.time = clock.time
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class FakePyAutoGui:
+    """
+    Stands in for the pyautogui module: records every mouse and keyboard call instead of making it, and advances
+    the virtual clock by pyautogui's pause after each one, like the real module sleeps.
+
+    :param clock: The VirtualClock to advance.
+    :param screen_size: Width and height returned by size().
+    """
+
+    def __init__(self, clock, screen_size=(1920, 1080)):
+        self.clock = clock
+        self.PAUSE = PYAUTOGUI_PAUSE
+        self.screen_size = screen_size
+        self.calls = []
+        # What screenshot() shows: (time, PIL image) pairs in time order, each shown from its time on
+        self.frames = []
+        # A FakeTabbedBrowser to tell about the clicks and key shortcuts, if any
+        self.browser = None
+
+    def _record(self, name, *args):
+        self.calls.append((name, args))
+        self.clock.sleep(self.PAUSE)
+
+    def moveTo(self, *args, **kwargs):
+        self._record('moveTo', *args)
+
+    def click(self, *args, **kwargs):
+        if self.browser is not None:
+            self.browser.on_click()
+        self._record('click', *args)
+
+    def hotkey(self, *keys, **kwargs):
+        if self.browser is not None:
+            self.browser.on_hotkey(keys)
+        self._record('hotkey', *keys)
+
+    def press(self, *keys, **kwargs):
+        self._record('press', *keys)
+
+    def write(self, text, interval=0.0, **kwargs):
+        self._record('write', text)
+        self.clock.sleep(interval * len(text))
+
+    typewrite = write
+
+    def size(self):
+        return self.screen_size
+
+    def screenshot(self, region=None):
+        """:return: The frame showing at the current virtual time, cut down to region (left, top, width, height) if given."""
+        self.calls.append(('screenshot', (region,)))
+        current = self.frames[0][1]
+        for frame_time, frame in self.frames:
+            if frame_time > self.clock.monotonic():
+                break
+            current = frame
+        if region is None:
+            return current.copy()
+        left, top, width, height = region
+        return current.crop((left, top, left + width, top + height))
+
+    def count(self, name):
+        """:return: How many times the call name (e.g. 'click') was made."""
+        return sum(1 for call, _ in self.calls if call == name)
+
+
+class FakeWebBrowser:
+    """Stands in for the webbrowser module and keeps the URLs it was asked to open."""
+
+    def __init__(self):
+        self.opened = []
+
+    def open(self, url, new=0, autoraise=True):
+        self.opened.append(url)
+        return True
+
+
+class FakeTabbedBrowser(FakeWebBrowser):
+    """
+    A FakeWebBrowser that also keeps the tabs: every page opens in a new tab at the end, which comes to the front
+    and takes page_load_seconds on the virtual clock to load.  The key shortcuts for closing a tab (which brings up
+    the tab on its right, or else on its left) and going to the previous or next tab work on them, and every click
+    is recorded with the page it landed on, so a run can be checked for clicks on the wrong or an unloaded page.
+
+    :param clock: The VirtualClock pages load on.
+    :param page_load_seconds: How long every page takes to load.
+    """
+
+    def __init__(self, clock, page_load_seconds=5.0):
+        super().__init__()
+        self.clock = clock
+        self.page_load_seconds = page_load_seconds
+        self.tabs = []
+        self.active = None
+        self.closed = []
+        self.clicks = []
+
+    def open(self, url, new=0, autoraise=True):
+        self.tabs.append({'url': url, 'loaded_at': self.clock.monotonic() + self.page_load_seconds})
+        self.active = len(self.tabs) - 1
+        return super().open(url, new, autoraise)
+
+    def on_hotkey(self, keys):
+        if not self.tabs:
+            return
+        keys = [key.lower() for key in keys]
+        if keys[-1] == 'w' and ('ctrl' in keys or 'cmd' in keys):
+            self.closed.append(self.tabs.pop(self.active)['url'])
+            self.active = min(self.active, len(self.tabs) - 1) if self.tabs else None
+        elif keys[-1] == 'tab' and 'ctrl' in keys:
+            self.active = (self.active + (-1 if 'shift' in keys else 1)) % len(self.tabs)
+
+    def on_click(self):
+        tab = self.tabs[self.active] if self.active is not None else None
+        self.clicks.append((tab['url'] if tab else None, tab is not None and self.clock.monotonic() >= tab['loaded_at']))
+
+    def early_clicks(self):
+        """:return: How many clicks were made with no tab open or before the page had loaded."""
+        return sum(1 for _, loaded in self.clicks if not loaded)
+
+
+@contextmanager
+def fake_desktop(*modules, clock=None, page_load_seconds=None):
+    """
+    Swaps the real mouse, browser and clock for fakes while the block runs: pyautogui in sys.modules (the script
+    imports it inside the functions that use it), and the time and webbrowser globals of each of the modules.
+
+    :param modules: Modules whose time and webbrowser globals are replaced, e.g. GooglePhotosAlbumCleanup.
+    :param clock: The VirtualClock to use; a new one by default.
+    :param page_load_seconds: Fake a browser with tabs (FakeTabbedBrowser) whose pages take this long to load.
+    :return: Context manager giving (clock, pyautogui, webbrowser).
+    """
+    clock = clock or VirtualClock()
+    pyautogui = FakePyAutoGui(clock)
+    if page_load_seconds is None:
+        browser = FakeWebBrowser()
+    else:
+        browser = pyautogui.browser = FakeTabbedBrowser(clock, page_load_seconds)
+    saved_pyautogui = sys.modules.get('pyautogui')
+    saved_globals = [(module, name, getattr(module, name)) for module in modules for name in ('time', 'webbrowser') if hasattr(module, name)]
+    sys.modules['pyautogui'] = pyautogui
+    for module, name, _ in saved_globals:
+        setattr(module, name, clock.time_module() if name == 'time' else browser)
+    try:
+        yield clock, pyautogui, browser
+    finally:
+        for module, name, value in saved_globals:
+            setattr(module, name, value)
+        if saved_pyautogui is None:
+            sys.modules.pop('pyautogui', None)
+        else:
+            sys.modules['pyautogui'] = saved_pyautogui
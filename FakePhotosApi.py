@@ -0,0 +1,226 @@
+import json
+import time
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Just enough of the Photos Library API discovery document for the calls the script makes
+_DISCOVERY_DOCUMENT = {
+    'kind': 'discovery#restDescription', 'discoveryVersion': 'v1', 'id': 'photoslibrary:v1', 'name': 'photoslibrary', 'version': 'v1',
+    'rootUrl': '{root}/', 'servicePath': '', 'baseUrl': '{root}/', 'batchPath': 'batch', 'protocol': 'rest', 'parameters': {},
+    'schemas': {'Album': {'id': 'Album', 'type': 'object'}, 'Response': {'id': 'Response', 'type': 'object'}},
+    'resources': {
+        'albums': {'methods': {
+            'list': {'id': 'photoslibrary.albums.list', 'path': 'v1/albums', 'flatPath': 'v1/albums', 'httpMethod': 'GET', 'response': {'$ref': 'Response'},
+                     'parameters': {'pageSize': {'type': 'integer', 'location': 'query'}, 'pageToken': {'type': 'string', 'location': 'query'},
+                                    'excludeNonAppCreatedData': {'type': 'boolean', 'location': 'query'}}},
+            'patch': {'id': 'photoslibrary.albums.patch', 'path': 'v1/albums/{+id}', 'flatPath': 'v1/albums/{albumsId}', 'httpMethod': 'PATCH', 'response': {'$ref': 'Album'},
+                      'parameters': {'id': {'type': 'string', 'location': 'path', 'required': True}, 'updateMask': {'type': 'string', 'location': 'query'}},
+                      'parameterOrder': ['id'], 'request': {'$ref': 'Album'}},
+        }},
+        'mediaItems': {'methods': {
+            'search': {'id': 'photoslibrary.mediaItems.search', 'path': 'v1/mediaItems:search', 'flatPath': 'v1/mediaItems:search', 'httpMethod': 'POST',
+                       'response': {'$ref': 'Response'}, 'parameters': {}, 'request': {'$ref': 'Response'}},
+            'list': {'id': 'photoslibrary.mediaItems.list', 'path': 'v1/mediaItems', 'flatPath': 'v1/mediaItems', 'httpMethod': 'GET', 'response': {'$ref': 'Response'},
+                     'parameters': {'pageSize': {'type': 'integer', 'location': 'query'}, 'pageToken': {'type': 'string', 'location': 'query'}}},
+        }},
+    },
+}
+
+
+class FakePhotosApi:
+    """
+    A local stand-in for the Photos Library API, serving its discovery document and synthetic albums over HTTP,
+    so the API code can be tried and timed without a network or a Google account.
+
+    :param albums: List of album dictionaries as albums().list returns them.
+    :param memberships: Dictionary of album ID to list of media item IDs, for mediaItems().search.
+    :param media_items: List of media item dictionaries in the library, for mediaItems().list; by default the
+                        photos in the albums' memberships.
+    :param latency: Seconds every request takes, to stand in for the network.
+    :param throttle_every: Answer every n-th API request with a 429; 0 to never throttle.
+    :param read_only_album_ids: Albums albums().patch refuses to change, like albums the app didn't create.
+    :param failing_page_tokens: Page tokens albums().list and mediaItems().list answer with a 400 error, to break a
+                                listing partway; change the failing_page_tokens attribute to mend it.
+    :param failing_album_ids: Albums mediaItems().search answers with a 400 error, like albums deleted since they
+                              were listed; change the failing_album_ids attribute to mend them.
+    """
+
+    def __init__(self, albums, memberships=None, latency=0.0, throttle_every=0, read_only_album_ids=(), media_items=None, failing_page_tokens=(),
+                 failing_album_ids=()):
+        self.albums = albums
+        self.album_index = {album['id']: album for album in albums}
+        self.memberships = memberships or {}
+        if media_items is None:
+            media_items = [{'id': media_id} for media_id in sorted({media_id for media_ids in self.memberships.values() for media_id in media_ids})]
+        self.media_items = media_items
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.read_only_album_ids = set(read_only_album_ids)
+        self.failing_page_tokens = set(failing_page_tokens)
+        self.failing_album_ids = set(failing_album_ids)
+        # What the fake has seen, for checking the client's behaviour
+        self.requests = 0
+        self.discovery_requests = 0
+        self.throttled = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    @property
+    def discovery_url(self):
+        return self.url + '/$discovery/rest?version=v1'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-photos-api', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def discovery_document(self):
+        return json.dumps(_DISCOVERY_DOCUMENT).replace('{root}', self.url)
+
+    def _count_request(self, client_address):
+        # Returns True if this request should be throttled
+        with self.lock:
+            self.requests += 1
+            self.connections.add(client_address)
+            if self.throttle_every and self.requests % self.throttle_every == 0:
+                self.throttled += 1
+                return True
+            return False
+
+    def _page(self, items, page_size, page_token):
+        start = int(page_token or 0)
+        page = {'items': items[start:start + page_size]}
+        if start + page_size < len(items):
+            page['nextPageToken'] = str(start + page_size)
+        return page
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real API
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; without this, a reused connection stalls on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body):
+                content = (body if isinstance(body, str) else json.dumps(body)).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def _read_body(self):
+                length = int(self.headers.get('Content-Length', 0))
+                return json.loads(self.rfile.read(length) or b'{}')
+
+            def _start(self):
+                # Returns False if the request has been answered with a 429 already
+                if api.latency:
+                    time.sleep(api.latency)
+                if api._count_request(self.client_address):
+                    self._reply(429, {'error': {'code': 429, 'message': 'Quota exceeded', 'status': 'RESOURCE_EXHAUSTED'}})
+                    return False
+                return True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if url.path.endswith('$discovery/rest'):
+                    if api.latency:
+                        time.sleep(api.latency)
+                    with api.lock:
+                        api.discovery_requests += 1
+                    return self._reply(200, api.discovery_document())
+                if not self._start():
+                    return
+                if url.path == '/v1/albums':
+                    if query.get('pageToken') in api.failing_page_tokens:
+                        return self._reply(400, {'error': {'code': 400, 'message': 'Invalid page token', 'status': 'INVALID_ARGUMENT'}})
+                    page = api._page(api.albums, int(query.get('pageSize', 20)), query.get('pageToken'))
+                    page['albums'] = page.pop('items')
+                    return self._reply(200, page)
+                if url.path == '/v1/mediaItems':
+                    if query.get('pageToken') in api.failing_page_tokens:
+                        return self._reply(400, {'error': {'code': 400, 'message': 'Invalid page token', 'status': 'INVALID_ARGUMENT'}})
+                    page = api._page(api.media_items, int(query.get('pageSize', 25)), query.get('pageToken'))
+                    page['mediaItems'] = page.pop('items')
+                    return self._reply(200, page)
+                self._reply(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+            def do_POST(self):
+                body = self._read_body()
+                if not self._start():
+                    return
+                if urlparse(self.path).path == '/v1/mediaItems:search':
+                    if body.get('albumId') in api.failing_album_ids:
+                        return self._reply(400, {'error': {'code': 400, 'message': 'Invalid album ID', 'status': 'INVALID_ARGUMENT'}})
+                    media_ids = api.memberships.get(body.get('albumId'), [])
+                    page = api._page([{'id': media_id} for media_id in media_ids], int(body.get('pageSize', 25)), body.get('pageToken'))
+                    page['mediaItems'] = page.pop('items')
+                    return self._reply(200, page)
+                self._reply(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+            def do_PATCH(self):
+                body = self._read_body()
+                if not self._start():
+                    return
+                album_id = urlparse(self.path).path.rsplit('/', 1)[-1]
+                if album_id not in api.album_index:
+                    return self._reply(404, {'error': {'code': 404, 'message': 'Album not found'}})
+                if album_id in api.read_only_album_ids:
+                    return self._reply(403, {'error': {'code': 403, 'message': 'No permission to update album', 'status': 'PERMISSION_DENIED'}})
+                with api.lock:
+                    api.album_index[album_id]['title'] = body.get('title', api.album_index[album_id]['title'])
+                self._reply(200, api.album_index[album_id])
+
+        return Handler
+
+
+def make_albums(count, seed_title='Album'):
+    """:return: List of count synthetic album dictionaries like albums().list returns."""
+    return [{'id': f"album-{i}", 'title': f"{seed_title} {i}", 'mediaItemsCount': str(i % 50), 'productUrl': f"https://photos.google.com/lr/album/album-{i}"} for i in range(count)]
+
+
+def make_library(media_count, album_count, photos_per_album=50, seed=0):
+    """
+    Builds a synthetic library: media_count photos, and album_count albums that each hold about photos_per_album
+    of them, so some photos are in several albums and some in none.
+
+    :return: Tuple of (list of media item dictionaries like mediaItems().list returns, dictionary of album ID to media item IDs).
+    """
+    import random
+    rng = random.Random(seed)
+    media_items = [{'id': f"media-{i}", 'filename': f"IMG_{i:07d}.JPG", 'mimeType': 'image/jpeg',
+                    'mediaMetadata': {'creationTime': f"20{i % 24:02d}-01-01T00:00:00Z"}} for i in range(media_count)]
+    memberships = {}
+    for album in range(album_count):
+        # Albums are mostly runs of consecutive photos, like an event, with a few picked from anywhere
+        start = rng.randrange(media_count)
+        size = rng.randint(1, 2 * photos_per_album)
+        run = {f"media-{(start + i) % media_count}" for i in range(size)}
+        run.update(f"media-{rng.randrange(media_count)}" for _ in range(size // 10))
+        memberships[f"album-{album}"] = sorted(run)
+    return media_items, memberships
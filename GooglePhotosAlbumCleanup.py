@@ -1,16 +1,23 @@
 import os
+import sys
 import time
 import logging
-import re
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
+import argparse
 import webbrowser
-import pyautogui
 import configparser
 import platform
-import pandas as pd
+import ScreenReadiness
+import ConfigChoices
+import ActionJournal
+import MouseMacros
+import RunMetrics
+import AccountProfiles
+import HeadlessBrowserDeleter
+import GooglePhotosApi
+from GooglePhotosApi import AdaptiveRateLimiter, fetch_album_pages, fetch_album_memberships, get_photos_service
+# pandas (and the album list modules built on it), pyautogui and the headless browser take a while to import, and
+# pyautogui needs a display, so they are imported by the functions that use them.  That way each command only loads
+# what it needs, and the ones that don't drive the mouse also work on a server without a screen.
 
 # Define a constant for the config file name
 CONFIG_FILENAME = 'GooglePhotosAlbumCleanupConfig.ini'
@@ -24,8 +31,18 @@ LONG_TO_SHORT_HEADERS = {
     "Album URL": "Album URL",
     "Actions Log": "Actions",
 }
+# Columns the script adds itself.  Spreadsheets without them can still be read.
+OPTIONAL_LONG_TO_SHORT_HEADERS = {
+    "Matched Rule (script rule that marked this album)": "Matched Rule",
+    "Duplicate Of (Album ID of the album with the same photos)": "Duplicate Of",
+    "Duplicate Type (exact duplicate, subset or near duplicate)": "Duplicate Type",
+    "Title Cluster (album title this album's title is similar to)": "Title Cluster",
+    "Unique Photos (photos in this album and no other)": "Unique Photos",
+    "Shared Photos (photos also in other albums)": "Shared Photos",
+    "Sharing Albums (number of other albums with some of these photos)": "Sharing Albums",
+}
 # Create an inverse of this dictionary for translating back
-SHORT_TO_LONG_HEADERS = {v: k for k, v in LONG_TO_SHORT_HEADERS.items()}
+SHORT_TO_LONG_HEADERS = {v: k for k, v in {**LONG_TO_SHORT_HEADERS, **OPTIONAL_LONG_TO_SHORT_HEADERS}.items()}
 
 
 def read_config_and_set_up_logging(filename):
@@ -81,9 +98,27 @@ def read_config_and_set_up_logging(filename):
         parameters['rename_button'] = tuple(map(float, config.get('AlbumRenameMouseClicks', 'rename_button').split(',')))
         parameters['rename_textbox'] = tuple(map(float, config.get('AlbumRenameMouseClicks', 'rename_textbox').split(',')))
         parameters['rename_save_button'] = tuple(map(float, config.get('AlbumRenameMouseClicks', 'rename_save_button').split(',')))
+        # Macros recorded with option 4 are kept here; without them the coordinates above are clicked
+        parameters['macro_dir'] = config.get('AlbumWindowMouseClicks', 'macro_dir', fallback='mouse_macros')
+        parameters['macro_speed'] = config.getfloat('AlbumWindowMouseClicks', 'macro_speed', fallback=1.0)
         parameters['album_list_file'] = config.get('AlbumLister', 'album_list_file')
         parameters['album_list_length_limit'] = config.getint('AlbumLister', 'album_list_length_limit')
-        parameters['albums_to_delete_list_file'] = config.get('AlbumDeleteLister', 'albums_to_delete_list_file')
+        parameters['snapshot_db_file'] = config.get('AlbumLister', 'snapshot_db_file', fallback='Google Photos Album Snapshot.db')
+        # Where the working album list is kept; the spreadsheet is only used to import and export it
+        parameters['storage_backend'] = config.get('AlbumStorage', 'backend', fallback='sqlite').strip().lower()
+        if parameters['storage_backend'] == 'sqlite':
+            default_store_file = parameters['snapshot_db_file']
+        else:
+            default_store_file = os.path.splitext(parameters['album_list_file'])[0] + ConfigChoices.FILE_BACKENDS.get(parameters['storage_backend'], '')
+        parameters['album_store_file'] = config.get('AlbumStorage', 'store_file', fallback='') or default_store_file
+        parameters['auto_export_xlsx'] = config.getboolean('AlbumStorage', 'auto_export_xlsx', fallback=False)
+        if parameters['storage_backend'] not in ConfigChoices.BACKENDS:
+            logging.error(f"Unknown [AlbumStorage] backend '{parameters['storage_backend']}' in config file {filename}, expected one of {', '.join(ConfigChoices.BACKENDS)}")
+            return False
+        # Rate limiter settings are optional so older config files keep working
+        parameters['requests_per_second'] = config.getfloat('AlbumLister', 'requests_per_second', fallback=1.0)
+        parameters['max_requests_per_second'] = config.getfloat('AlbumLister', 'max_requests_per_second', fallback=10.0)
+        parameters['max_retries'] = config.getint('AlbumLister', 'max_retries', fallback=5)
         parameters['delete_empty_albums'] = config.getboolean('AlbumDeleteLister', 'delete_empty_albums')
         parameters['delete_albums_that_contain'] = tuple(map(str, config.get('AlbumDeleteLister', 'delete_albums_that_contain').split(',')))
         parameters['delete_albums'] = config.getboolean('AlbumDeleter', 'delete_albums')
@@ -91,9 +126,51 @@ def read_config_and_set_up_logging(filename):
         parameters['page_load_wait_time'] = config.getfloat('AlbumDeleter', 'page_load_wait_time')
         parameters['mouse_move_wait_time'] = config.getfloat('AlbumDeleter', 'mouse_move_wait_time')
         parameters['mouse_click_wait_time'] = config.getfloat('AlbumDeleter', 'mouse_click_wait_time')
+        # Opening the next albums in tabs ahead of time depends on how the browser handles tabs, so it is off by default
+        parameters['prefetch_tabs'] = config.getint('AlbumDeleter', 'prefetch_tabs', fallback=0)
+        parameters['journal_file'] = config.get('AlbumDeleter', 'journal_file', fallback='GooglePhotosAlbumCleanup.journal.jsonl')
+        parameters['readiness_template_dir'] = config.get('AlbumDeleter', 'readiness_template_dir', fallback='readiness_templates')
+        parameters['readiness_poll_interval'] = config.getfloat('AlbumDeleter', 'readiness_poll_interval', fallback=ScreenReadiness.DEFAULT_POLL_INTERVAL)
+        parameters['readiness_match_tolerance'] = config.getfloat('AlbumDeleter', 'readiness_match_tolerance', fallback=ScreenReadiness.DEFAULT_MATCH_TOLERANCE)
+        # Renaming through the API is tried first; albums it isn't allowed to change are renamed with the mouse
+        parameters['max_albums_to_rename'] = config.getint('AlbumRenamer', 'max_albums_to_rename', fallback=parameters['max_albums_to_delete'])
+        parameters['rename_with_api'] = config.getboolean('AlbumRenamer', 'use_api', fallback=True)
+        parameters['rename_with_mouse'] = config.getboolean('AlbumRenamer', 'use_mouse', fallback=True)
+        parameters['rename_workers'] = config.getint('AlbumRenamer', 'workers', fallback=4)
+        # The duplicate finder is optional, so all of its settings have defaults
+        parameters['duplicate_workers'] = config.getint('DuplicateFinder', 'workers', fallback=8)
+        parameters['near_duplicate_threshold'] = config.getfloat('DuplicateFinder', 'near_duplicate_threshold', fallback=ConfigChoices.DEFAULT_NEAR_DUPLICATE_THRESHOLD)
+        parameters['duplicate_kinds_to_delete'] = tuple(kind for kind, option in zip(ConfigChoices.DUPLICATE_KINDS, ('delete_exact_duplicates', 'delete_subset_albums', 'delete_near_duplicates'))
+                                                        if config.getboolean('DuplicateFinder', option, fallback=kind == ConfigChoices.EXACT_DUPLICATE))
+        # The media inventory is optional, so all of its settings have defaults
+        parameters['inventory_db_file'] = config.get('MediaInventory', 'inventory_db_file', fallback='Google Photos Media Inventory.db')
+        parameters['inventory_workers'] = config.getint('MediaInventory', 'workers', fallback=8)
+        parameters['inventory_page_size'] = config.getint('MediaInventory', 'page_size', fallback=100)
+        # Title clustering is optional, so all of its settings have defaults
+        parameters['title_similarity_threshold'] = config.getfloat('TitleClusters', 'similarity_threshold', fallback=0.8)
+        parameters['title_cluster_window'] = config.getint('TitleClusters', 'window', fallback=8)
+        parameters['delete_title_copies'] = config.getboolean('TitleClusters', 'delete_copies', fallback=False)
+        # The headless browser is optional, so all of its settings have defaults
+        parameters['browser_profile_dir'] = config.get('HeadlessBrowser', 'profile_dir', fallback='headless_browser_profile')
+        parameters['browser_workers'] = config.getint('HeadlessBrowser', 'workers', fallback=4)
+        parameters['browser_headless'] = config.getboolean('HeadlessBrowser', 'headless', fallback=True)
+        parameters['browser_channel'] = config.get('HeadlessBrowser', 'channel', fallback='')
+        parameters['browser_step_timeout'] = config.getfloat('HeadlessBrowser', 'step_timeout', fallback=30.0)
+        parameters['browser_selectors'] = {key: config.get('HeadlessBrowser', key, fallback=default) for key, default in HeadlessBrowserDeleter.DEFAULT_SELECTORS.items()}
         parameters['scopes'] = config.get('GooglePhotosAPI', 'scopes')
         parameters['credentials_file'] = config.get('GooglePhotosAPI', 'credentials_file')
         parameters['token_file'] = config.get('GooglePhotosAPI', 'token_file')
+        parameters['discovery_cache_file'] = config.get('GooglePhotosAPI', 'discovery_cache_file', fallback=GooglePhotosApi.DEFAULT_DISCOVERY_CACHE_FILE)
+        parameters['discovery_cache_ttl_hours'] = config.getfloat('GooglePhotosAPI', 'discovery_cache_ttl_hours', fallback=GooglePhotosApi.DEFAULT_DISCOVERY_CACHE_TTL / 3600)
+        parameters['max_connections'] = config.getint('GooglePhotosAPI', 'max_connections', fallback=10)
+        # Metrics are optional; an empty file name switches that output off
+        parameters['metrics_summary_file'] = config.get('Metrics', 'summary_file', fallback='GooglePhotosAlbumCleanup.metrics.json')
+        parameters['metrics_prometheus_file'] = config.get('Metrics', 'prometheus_textfile', fallback='GooglePhotosAlbumCleanup.prom')
+        parameters['metrics_prometheus_interval'] = config.getfloat('Metrics', 'prometheus_interval_seconds', fallback=RunMetrics.DEFAULT_PROMETHEUS_INTERVAL)
+        # Account profiles are optional: one [Account <name>] section per Google account, used with --account
+        parameters['account_workers'] = config.getint('Accounts', 'workers', fallback=4)
+        parameters['consolidated_album_list_file'] = config.get('Accounts', 'consolidated_album_list_file', fallback='Google Photos All Accounts.xlsx')
+        parameters['accounts'] = AccountProfiles.read_account_profiles(config, parameters)
     except (configparser.NoSectionError, configparser.NoOptionError) as e:
         logging.error(f"Failed to get a parameter from config file {filename}: {e}")
         return False
@@ -107,27 +184,8 @@ def read_xlsx_with_renamed_columns(file_path):
     :param file_path: Path to the XLSX file.
     :return: A pandas DataFrame with renamed columns or None if an error occurs.
     """
-    # Check if the file exists
-    if not os.path.exists(file_path):
-        logging.error(f"File not found: {file_path}")
-        return None
-
-    # Read the XLSX file
-    try:
-        df = pd.read_excel(file_path)
-    except Exception as e:
-        logging.error(f"Error reading the Excel file: {e}")
-        return None
-
-    # Check for missing expected columns
-    missing_columns = set(LONG_TO_SHORT_HEADERS.keys()) - set(df.columns)
-    if missing_columns:
-        logging.error(f"Missing expected columns: {missing_columns}")
-        return None
-
-    # Rename columns
-    df.rename(columns=LONG_TO_SHORT_HEADERS, inplace=True)
-    return df
+    import AlbumStorage
+    return AlbumStorage.AlbumFileStore(file_path, 'xlsx', LONG_TO_SHORT_HEADERS, OPTIONAL_LONG_TO_SHORT_HEADERS).read()
 
 def write_xlsx_with_renamed_columns(df, output_file_path):
     """
@@ -136,171 +194,599 @@ def write_xlsx_with_renamed_columns(df, output_file_path):
     :param df: The DataFrame to write.
     :param output_file_path: The path to the output XLSX file.
     """
+    import AlbumStorage
+    AlbumStorage.AlbumFileStore(output_file_path, 'xlsx', LONG_TO_SHORT_HEADERS, OPTIONAL_LONG_TO_SHORT_HEADERS).write(df)
 
-    # Check if the file already exists
-    if os.path.exists(output_file_path):
-        logging.info(f"Overwriting existing file: {output_file_path}")
-    # Rename columns
-    df.rename(columns=SHORT_TO_LONG_HEADERS, inplace=True)
-    # Write DataFrame to an XLSX file
-    df.to_excel(output_file_path, index=False)
-    logging.info(f"Data written to {output_file_path}")
+def open_album_store(parameters):
+    """
+    Opens the album list store selected by the [AlbumStorage] section of the config file.
 
+    :param parameters: The parameters from read_config_and_set_up_logging.
+    :return: An AlbumStorage store or None if the backend is unknown.
+    """
+    import AlbumStorage
+    return AlbumStorage.open_album_store(parameters['storage_backend'], parameters['album_store_file'], LONG_TO_SHORT_HEADERS, OPTIONAL_LONG_TO_SHORT_HEADERS)
 
-def google_photos_album_lister(scope, credentials_file, token_file, album_list_length_limit):
-    # Define the scope for the access request
-    SCOPES = [scope]
 
-    creds = None
-    # The file token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first time.
-    if os.path.exists(token_file):
-        try:
-            creds = Credentials.from_authorized_user_file(token_file, SCOPES)
-        except Exception as e:
-            logging.error(f"Error using token file to authorize: {e}")
-
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(credentials_file, SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open(token_file, 'w') as token:
-            token.write(creds.to_json())
-
-    # Build the Google Photos API service
-    # Note: static_discovery=False is required to avoid an error
-    service = build('photoslibrary', 'v1', credentials=creds,static_discovery=False)
-
-    # Initialize a dictionary to hold album data
-    album_data = {'Album Title': [], 'Album New Title': [], 'Photo Count': [], 'Delete Flag': [], 'Album ID': [], 'Album URL': [], 'Actions': []}
-
-    # Call the Photo v1 API
-    logging.info('Polling Google Photos and Listing albums...If you have a lot, this may take a while.')
-    page_token = None
-    page_count = 0
-    while True:
-        try:
-            results = service.albums().list(pageSize=50, pageToken=page_token, excludeNonAppCreatedData=False).execute()
-            albums = results.get('albums', [])
-        except Exception as e:
-            logging.error(f"Error listing albums: {e}")
-            break
+def limit_album_pages(pages, album_list_length_limit=0):
+    """
+    Passes album pages through, logging progress, until album_list_length_limit albums have been seen.
+    The listing stops after the whole page that reaches the limit, and that page keeps its nextPageToken, so the
+    album store sees a listing that hasn't finished: nothing is dropped for not being listed, and the next sync
+    carries on from there.
+
+    :param pages: Iterable of albums().list responses.
+    :param album_list_length_limit: Maximum number of albums; 0 for no limit.
+    :return: A generator of response dictionaries.
+    """
+    album_count = 0
+    for page_count, results in enumerate(pages, 1):
+        albums = results.get('albums', [])
         if not albums:
             logging.info('No albums found.')
         else:
-            page_count += 1
             logging.info(f"Page {page_count} of albums found (up to 50 albums per page)")
-            for album in albums:
-                try:
-                    title = album.get('title', 'Untitled')
-                    mediaItemsCount = album.get('mediaItemsCount', 0)
-                    albumId = album.get('id', 'No ID')
-                    url = album.get('productUrl', 'No URL')
-                    # Append album details to the dictionary
-                    album_data['Album Title'].append(title)
-                    album_data['Album New Title'].append('')  # Placeholder value
-                    album_data['Photo Count'].append(mediaItemsCount)
-                    album_data['Delete Flag'].append('')  # Placeholder value
-                    album_data['Album ID'].append(albumId)
-                    album_data['Album URL'].append(url)
-                    album_data['Actions'].append('')  # Placeholder value
-                except Exception as e:
-                    logging.error(f"Error processing album: {e}")
-        page_token = results.get('nextPageToken')
-        # if len(album_data['Album Title']) > album_list_length_limit: 
-        #     break
-        if not page_token:
-            break
-        time.sleep(1) # Sleep for 1 second to avoid rate limiting
-    # Convert the dictionary to a DataFrame
-    df_albums = pd.DataFrame(album_data)
-    # Ensure 'Album New Title' column is of type object (string)
-    # df_albums['Album New Title'] = df_albums['Album New Title'].astype(str)
-    return df_albums
+        album_count += len(albums)
+        RunMetrics.metrics.increment('albums_listed_total', len(albums))
+        yield results
+        if album_list_length_limit and album_count >= album_list_length_limit and results.get('nextPageToken'):
+            logging.info(f"Reached the album list length limit ({album_list_length_limit}), stopping the listing. The next sync carries on from here.")
+            return
+
+def photos_service_factory(parameters):
+    """
+    Returns the API service factory shared by everything in this run, set up with the discovery cache and
+    connection pool settings from the config file.  Nothing is loaded or downloaded until the API is first used.
+    """
+    return GooglePhotosApi.get_service_factory(parameters['scopes'], parameters['credentials_file'], parameters['token_file'],
+                                               discovery_cache_file=parameters['discovery_cache_file'], discovery_cache_ttl=parameters['discovery_cache_ttl_hours'] * 3600,
+                                               max_connections=parameters['max_connections'])
 
-def mark_albums_to_delete(album_list, delete_empty_albums, delete_albums_that_contain):
-    # convert delete_albums_that_contain to a list if it's just a simple string
-    if isinstance(delete_albums_that_contain, str):
-        delete_albums_that_contain = [delete_albums_that_contain]
-    for index, album in album_list.iterrows():
-        # Find albums with no photos
-        if delete_empty_albums and album['Photo Count'] == '0':
-            album_list.at[index, 'Delete Flag'] = True
-        # Find albums that contain any of the specified strings
-        elif delete_albums_that_contain[0] and any(s in album['Album Title'] for s in delete_albums_that_contain):
-            album_list.at[index, 'Delete Flag'] = True
-        # Find albums with 'iPhoto Events' and a date in the name
-        elif 'iPhoto Events' in album['Album Title'] and re.search(r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\b \d{1,2}, \d{4}', album['Album Title']):
-            album_list.at[index, 'Delete Flag'] = True
-        # Add your own criteria here!  Replace the 'False' with your own criteria
-        elif False:
-            album_list.at[index, 'Delete Flag'] = True
+def google_photos_album_sync(scope, credentials_file, token_file, album_store, requests_per_second=1.0, max_requests_per_second=10.0, max_retries=5, full_refresh=False, album_list_length_limit=0):
+    """
+    Lists the albums from Google Photos into the album store page by page, so memory use stays flat and an
+    interrupted listing picks up from its last checkpoint next time.  Local annotations (new title, delete flag,
+    actions) of albums already in the store are kept; the SQLite store only writes albums that are new or changed.
+
+    :param album_store: The store from open_album_store.
+    :param full_refresh: Forget the annotations in the store and list every album again (the same as downloading the
+                         album list from scratch).  The albums already stored stay until a listing that finishes
+                         replaces them, and a listing that is still in progress is carried on rather than started
+                         again, so repeating a limited listing gets further each time.
+    :param album_list_length_limit: Stop after about this many albums (at the end of a page); 0 for no limit.  The
+                                    albums listed so far are saved, and the next sync carries on from there.
+    :return: The up to date album list as a DataFrame, or None if the listing failed or didn't finish.
+    """
+    service = get_photos_service(scope, credentials_file, token_file)
+    rate_limiter = AdaptiveRateLimiter(initial_rate=requests_per_second, max_rate=max_requests_per_second)
+    page_token = album_store.checkpoint()
+    if page_token:
+        # Even for a full refresh: starting a limited listing over again would never get further than the last one
+        logging.info('Carrying on with the album listing that was interrupted last time.')
+    elif full_refresh:
+        album_store.reset()
+    logging.info('Polling Google Photos and syncing albums...If you have a lot, this may take a while.')
+    pages = fetch_album_pages(service, rate_limiter, max_retries=max_retries, page_token=page_token)
+    # Note the limit counts from where a resumed listing carries on
+    try:
+        album_list = album_store.sync(limit_album_pages(pages, album_list_length_limit))
+    except Exception as e:
+        # Every page before the one that failed is saved with its checkpoint
+        logging.error(f"The album listing failed: {e}")
+        return None
+    if album_list is None and album_list_length_limit and album_store.checkpoint() is not None:
+        # Stopped at the limit: the store has every album it had before, with the ones listed so far brought up to date
+        return album_store.read()
     return album_list
 
-def delete_albums(album_list, max_albums_to_delete, macos_scale_factor, three_dots_coordinates, delete_coordinates, confirm_coordinates, page_load_wait_time=1.0, mouse_move_wait_time=1.0, mouse_click_wait_time=1.0):
-    albums_deleted = 0
+def is_auto_exporting_xlsx(parameters):
+    # No point exporting the spreadsheet on top of itself when it is the store
+    return parameters['auto_export_xlsx'] and os.path.abspath(parameters['album_list_file']) != os.path.abspath(parameters['album_store_file'])
+
+def import_album_list_xlsx(parameters, album_store=None):
+    """
+    Imports the album list spreadsheet (e.g. after editing it by hand) into the album store.
+
+    :param parameters: The parameters from read_config_and_set_up_logging.
+    :param album_store: The store to import into, opened from the config when not given.
+    :return: The album list as now in the store, or None if an error occurs.
+    """
+    album_store = album_store or open_album_store(parameters)
+    edited = read_xlsx_with_renamed_columns(parameters['album_list_file'])
+    if edited is None:
+        return None
+    if album_store.file_format == 'sqlite' and album_store.exists():
+        import AlbumSnapshotStore
+        # Only the annotations can be edited; the listing data comes from Google Photos
+        conn = AlbumSnapshotStore.open_snapshot_store(album_store.file_path)
+        try:
+            AlbumSnapshotStore.save_annotations(conn, edited)
+        finally:
+            conn.close()
+    else:
+        album_store.write(edited)
+    logging.info(f"Imported {parameters['album_list_file']} into {album_store.file_path}")
+    return album_store.read()
+
+def export_album_list_xlsx(album_list, parameters):
+    """
+    Exports the album list to the album list spreadsheet for review.
+
+    :param album_list: The DataFrame to export (short headers).
+    :param parameters: The parameters from read_config_and_set_up_logging.
+    """
+    write_xlsx_with_renamed_columns(album_list, parameters['album_list_file'])
+
+def load_album_list(parameters):
+    """
+    Loads the album list from the album store.  When there is no store yet, the album list spreadsheet is imported to start one.
+    With auto_export_xlsx, a spreadsheet that was edited by hand since it was last exported is imported first.
+
+    :param parameters: The parameters from read_config_and_set_up_logging.
+    :return: A pandas DataFrame with short headers or None if an error occurs.
+    """
+    album_store = open_album_store(parameters)
+    if album_store is None:
+        return None
+    album_list_file = parameters['album_list_file']
+    if not album_store.exists():
+        return import_album_list_xlsx(parameters, album_store)
+    # save_album_list writes the store after the spreadsheet, so a newer spreadsheet means it was edited
+    if is_auto_exporting_xlsx(parameters) and os.path.exists(album_list_file) and os.path.getmtime(album_list_file) > os.path.getmtime(album_store.file_path):
+        logging.info(f"{album_list_file} was changed outside the script, importing it")
+        return import_album_list_xlsx(parameters, album_store)
+    return album_store.read()
+
+def save_album_list(album_list, parameters):
+    """
+    Saves the album list to the album store, and exports the album list spreadsheet for review when auto_export_xlsx is on.
+
+    :param album_list: The DataFrame to save (short headers).
+    :param parameters: The parameters from read_config_and_set_up_logging.
+    """
+    album_store = open_album_store(parameters)
+    if album_store is None:
+        return
+    if is_auto_exporting_xlsx(parameters):
+        export_album_list_xlsx(album_list, parameters)
+    album_store.write(album_list)
+    # Make sure the store is newer than the export even on file systems with coarse timestamps
+    os.utime(album_store.file_path)
+
+def save_consolidated_album_list(parameters):
+    """
+    Writes the album lists of all the accounts in the config file into the consolidated album list, with an
+    Account column.  Accounts that haven't been listed yet are left out.
+
+    :param parameters: The parameters from read_config_and_set_up_logging.
+    :return: True if it was written.
+    """
+    import AlbumStorage
+    file_path = parameters['consolidated_album_list_file']
+    # The format comes from the file extension, e.g. .xlsx to review it or .parquet for big libraries
+    file_format = os.path.splitext(file_path)[1].lstrip('.').lower()
+    if file_format not in AlbumStorage.FILE_BACKENDS:
+        logging.error(f"Can't write the consolidated album list {file_path}: the file name must end in one of {', '.join(AlbumStorage.FILE_BACKENDS.values())}")
+        return False
+    album_lists = {}
+    for account in parameters['accounts']:
+        account_parameters = AccountProfiles.parameters_for_account(parameters, account)
+        if not open_album_store(account_parameters).exists():
+            logging.info(f"Account {account} has no album list yet, leaving it out of {file_path}")
+            continue
+        album_list = load_album_list(account_parameters)
+        if album_list is not None:
+            album_lists[account] = album_list
+    store = AlbumStorage.AlbumFileStore(file_path, file_format, {AccountProfiles.ACCOUNT_HEADER: AccountProfiles.ACCOUNT_HEADER, **LONG_TO_SHORT_HEADERS}, OPTIONAL_LONG_TO_SHORT_HEADERS)
+    store.write(AccountProfiles.consolidate_album_lists(album_lists))
+    return True
+
+def run_journaled(album_list, parameters, run):
+    """
+    Runs a delete or rename pass with the action journal, so an interrupted run can be resumed.
+    Albums the journal already shows as done (from a run that crashed or was stopped) are merged into the
+    album list first, so they are skipped.  At the end the journal is merged and the album list saved once.
+
+    :param album_list: DataFrame with the script's short headers.
+    :param parameters: The parameters from read_config_and_set_up_logging.
+    :param run: Function taking (album_list, journal) and returning the album list.
+    :return: The album list.
+    """
+    journal_file = parameters['journal_file']
+    if os.path.exists(journal_file):
+        logging.info(f"Resuming from journal {journal_file}")
+        ActionJournal.merge_journal(album_list, journal_file)
+    try:
+        with ActionJournal.ActionJournal(journal_file) as journal:
+            album_list = run(album_list, journal)
+    except KeyboardInterrupt:
+        logging.warning('Stopped by user. The albums done so far are kept.')
+    ActionJournal.merge_journal(album_list, journal_file)
+    save_album_list(album_list, parameters)
+    # Everything in the journal is in the saved album list now
+    ActionJournal.archive_journal(journal_file)
+    return album_list
+
+def mark_albums_to_delete(album_list, delete_empty_albums, delete_albums_that_contain):
+    import AlbumMarkingRules
+    # Compile the config criteria (and any custom rules in AlbumMarkingRules.CUSTOM_DELETE_RULES) into vectorized rules
+    rules = AlbumMarkingRules.compile_delete_rules(delete_empty_albums, delete_albums_that_contain)
+    return AlbumMarkingRules.apply_delete_rules(album_list, rules)
+
+def mark_duplicate_albums(album_list, parameters):
+    """
+    Lists the photos in every album through the API and marks albums with the same photos as another album
+    (exact duplicates, subsets and near duplicates) in the Duplicate Of and Duplicate Type columns.
+
+    :param album_list: DataFrame with the script's short headers.
+    :param parameters: The parameters from read_config_and_set_up_logging.
+    :return: The album list.
+    """
+    import pandas as pd
+    import AlbumDuplicates
+    # Empty and already deleted albums have no photos to compare
+    has_photos = pd.to_numeric(album_list['Photo Count'], errors='coerce').fillna(0).gt(0)
+    not_deleted = ~album_list['Actions'].fillna('').astype(str).str.contains('Deleted', regex=False)
+    album_ids = album_list.loc[has_photos & not_deleted, 'Album ID']
+    logging.info(f"Listing the photos of {len(album_ids)} albums with {parameters['duplicate_workers']} workers...If you have a lot, this may take a while.")
+    rate_limiter = AdaptiveRateLimiter(initial_rate=parameters['requests_per_second'], max_rate=parameters['max_requests_per_second'])
+    memberships = fetch_album_memberships(photos_service_factory(parameters), album_ids, rate_limiter, parameters['duplicate_workers'], parameters['max_retries'])
+    return AlbumDuplicates.mark_duplicate_albums(album_list, memberships, parameters['duplicate_kinds_to_delete'], parameters['near_duplicate_threshold'])
+
+def take_media_inventory(album_list, parameters, restart=False):
+    """
+    Lists every photo and video in the library and the photos of every album into the media inventory database,
+    then fills in how many of each album's photos are in no other album (Unique Photos), how many are also in other
+    albums (Shared Photos) and how many other albums those are in (Sharing Albums).  An inventory that was
+    interrupted is carried on from where it stopped.
+
+    :param album_list: DataFrame with the script's short headers.
+    :param parameters: The parameters from read_config_and_set_up_logging.
+    :param restart: Start a new inventory even if the last one didn't finish.
+    :return: The album list, or None if the inventory didn't finish.
+    """
+    import pandas as pd
+    import MediaInventory
+    # Empty and already deleted albums have no photos to list
+    has_photos = pd.to_numeric(album_list['Photo Count'], errors='coerce').fillna(0).gt(0)
+    not_deleted = ~album_list['Actions'].fillna('').astype(str).str.contains('Deleted', regex=False)
+    album_ids = album_list.loc[has_photos & not_deleted, 'Album ID'].astype(str).tolist()
+    rate_limiter = AdaptiveRateLimiter(initial_rate=parameters['requests_per_second'], max_rate=parameters['max_requests_per_second'])
+    conn = MediaInventory.open_inventory(parameters['inventory_db_file'])
+    try:
+        if not MediaInventory.take_inventory(conn, photos_service_factory(parameters), album_ids, rate_limiter, parameters['inventory_workers'],
+                                             parameters['max_retries'], parameters['inventory_page_size'], restart):
+            return None
+        summary = MediaInventory.library_summary(conn)
+        logging.info(f"Media inventory: {summary['items']} photos and videos, {summary['in_no_album']} of them in no album")
+        return MediaInventory.apply_inventory(album_list, MediaInventory.album_photo_counts(conn))
+    finally:
+        conn.close()
+
+def mark_title_clusters(album_list, parameters):
+    """
+    Groups albums with the same or nearly the same title ("Trip", "Copy of Trip", "Trip (1)", "trip!") in the
+    Title Cluster column, suggests one new title for each group and, if configured, flags the copies to delete.
+
+    :param album_list: DataFrame with the script's short headers.
+    :param parameters: The parameters from read_config_and_set_up_logging.
+    :return: The album list.
+    """
+    import AlbumTitleClusters
+    return AlbumTitleClusters.mark_title_clusters(album_list, parameters['title_similarity_threshold'], parameters['delete_title_copies'], parameters['title_cluster_window'])
+
+def load_mouse_macro(parameters, name):
+    """
+    Loads the macro recorded with MouseClickFinderScript (menu option 4) for name, or builds one from the click
+    positions and wait times in the config file if none has been recorded.
+
+    :param name: MouseMacros.DELETE_MACRO or MouseMacros.RENAME_MACRO.
+    :return: The macro dictionary.
+    """
+    macro = MouseMacros.load_macro(parameters['macro_dir'], name)
+    if macro is not None:
+        logging.info(f"Using the recorded mouse macro {MouseMacros.macro_path(parameters['macro_dir'], name)} at {parameters['macro_speed']:g}x speed")
+        return macro
+    # The click tags are also the names of the coordinates in the config file
+    coordinates = {tag: parameters[tag] for tag in MouseMacros.click_tags(name)}
+    return MouseMacros.macro_from_config(name, coordinates, parameters['page_load_wait_time'], parameters['mouse_move_wait_time'], parameters['mouse_click_wait_time'])
+
+def delete_albums(album_list, max_albums_to_delete, macos_scale_factor, three_dots_coordinates, delete_coordinates, confirm_coordinates, page_load_wait_time=1.0, mouse_move_wait_time=1.0, mouse_click_wait_time=1.0, waiter=None, templates=None, journal=None,
+                  macro=None, speed=1.0, prefetch_tabs=0):
+    """
+    Drives the browser and the mouse to delete every album flagged for deletion, by playing the delete macro for
+    each.  When a waiter and the pictures recorded by MouseClickFinderScript are given, each step goes ahead as
+    soon as its button is on screen; the wait times are then only upper bounds.  With prefetch_tabs, the next
+    albums are opened in tabs while the current one is deleted, so their pages have loaded by the time they're up.
+
+    :param waiter: A ScreenReadiness.ReadinessWaiter, or None to always sleep the full wait times.
+    :param templates: Dictionary of recorded pictures from ScreenReadiness.load_templates.
+    :param journal: ActionJournal to record every album in as soon as it is deleted, or None.
+    :param macro: Recorded delete macro (see MouseMacros); None to click the coordinates with the wait times given.
+    :param speed: How many times faster than recorded the macro's waits go.
+    :param prefetch_tabs: How many albums ahead to open in tabs; 0 opens each album when its turn comes.
+    """
+    import pyautogui
     if platform.system() == 'Darwin':  # Darwin is the name for the macOS operating system
         scale_factor = macos_scale_factor
     else:
         scale_factor = 1.0
-    for index, album in album_list.iterrows():
-        if bool(album['Delete Flag']) != True:
-            continue
-        if bool(album['Delete Flag']) == True and 'Deleted' in str(album['Actions']):
+    if macro is None:
+        coordinates = dict(zip(MouseMacros.click_tags(MouseMacros.DELETE_MACRO), (three_dots_coordinates, delete_coordinates, confirm_coordinates)))
+        macro = MouseMacros.macro_from_config(MouseMacros.DELETE_MACRO, coordinates, page_load_wait_time, mouse_move_wait_time, mouse_click_wait_time)
+    # The browser and sleep are this module's, so they can be swapped for fakes like pyautogui
+    player = MouseMacros.MacroPlayer(pyautogui, webbrowser, scale_factor, speed, waiter, templates, sleep=time.sleep)
+    metrics = RunMetrics.metrics
+    import AlbumSchema
+    # The albums to delete, in order, so the ones after the current album can be opened ahead of time
+    flagged, _ = AlbumSchema.delete_flags(album_list['Delete Flag'])
+    pending = flagged & ~album_list['Actions'].astype(str).str.contains('Deleted', regex=False)
+    reached_max = int(pending.sum()) > max_albums_to_delete
+    albums = list(album_list[pending].head(max(0, max_albums_to_delete)).iterrows())
+    metrics.start_progress('delete', len(albums))
+    tabs = None
+    if prefetch_tabs > 0 and albums:
+        tabs = MouseMacros.TabPrefetcher(pyautogui, webbrowser, [album['Album URL'] for _, album in albums], prefetch_tabs, mouse_click_wait_time / speed,
+                                         clock=time.monotonic, sleep=time.sleep)
+        tabs.start()
+    for index, album in albums:
+        logging.info(f"Deleting album: {album['Album Title']} at {album['Album URL']} ({metrics.progress_text('delete')})")
+        if journal is not None:
+            journal.record(album['Album ID'], ActionJournal.STARTED, title=album['Album Title'])
+        start = time.monotonic()
+        # Open the album (unless it is already loading in a tab), click the three dots, 'Delete album' and the
+        # confirmation, then close the tab
+        if tabs is None:
+            player.play(macro, url=album['Album URL'])
+        else:
+            player.play(macro, opened=tabs.seconds_loading(), url=album['Album URL'])
+        action = 'Deleted on ' + time.strftime('%Y-%m-%d %H:%M:%S')
+        AlbumSchema.set_values(album_list, index, 'Actions', action)
+        if journal is not None:
+            journal.record(album['Album ID'], ActionJournal.DELETED, action, title=album['Album Title'], seconds=round(time.monotonic() - start, 3))
+        if tabs is not None:
+            # Closing the tab brought up the next album; start loading the one after it
+            tabs.advance()
+        metrics.observe('album_seconds', time.monotonic() - start, action='delete', method='mouse')
+        metrics.increment('albums_deleted_total', method='mouse')
+        metrics.advance('delete')
+    if reached_max:
+        logging.info(f"Reached maximum number of albums to delete ({max_albums_to_delete}). Exiting.")
+    return album_list
+
+def mark_albums_to_rename(album_list):
+    import AlbumMarkingRules
+    # Find albums with 'Copy of 'in the name
+    return AlbumMarkingRules.apply_rename_rules(album_list)
+
+def albums_to_rename(album_list, max_albums_to_rename):
+    """
+    Picks the albums with a new title that haven't been renamed (or deleted) yet, up to the limit.
+
+    :return: List of (index, album ID, title, new title, URL) tuples.
+    """
+    import pandas as pd
+    jobs = []
+    # Only the albums with a new title are looked at one by one
+    candidates = album_list[album_list['Album New Title'].fillna('').astype(str).str.strip() != '']
+    for index, album_id, title, new_title, actions, url in zip(candidates.index, candidates['Album ID'], candidates['Album Title'], candidates['Album New Title'], candidates['Actions'], candidates['Album URL']):
+        new_title = '' if pd.isna(new_title) else str(new_title).strip()
+        if not new_title or new_title == title or 'Renamed' in str(actions) or 'Deleted' in str(actions):
             continue
-        if albums_deleted >= max_albums_to_delete:
-            logging.info(f"Reached maximum number of albums to delete ({max_albums_to_delete}). Exiting.")
+        if len(jobs) >= max_albums_to_rename:
+            logging.info(f"Reached maximum number of albums to rename ({max_albums_to_rename}).")
             break
-        logging.info(f"Deleting album: {album['Album Title']} at {album['Album URL']}")
-        # First let's open the web browser to the Google Photos Album page
-        webbrowser.open(album['Album URL'])
-        time.sleep(page_load_wait_time) # Sleep to allow the page to load
-        # Now let's click the three dots at the top right of the page
-        pyautogui.moveTo(three_dots_coordinates*scale_factor)
-        time.sleep(mouse_move_wait_time)
-        pyautogui.click(three_dots_coordinates*scale_factor)
-        time.sleep(mouse_click_wait_time) # Sleep for 1 second to allow the menu to load
-        # Now let's click the 'Delete' button
-        pyautogui.moveTo(delete_coordinates*scale_factor)
-        time.sleep(mouse_move_wait_time)
-        pyautogui.click(delete_coordinates*scale_factor)
-        time.sleep(mouse_click_wait_time)
-        # Now let's confirm the deletion in the dialog box
-        pyautogui.moveTo(confirm_coordinates*scale_factor)
-        time.sleep(mouse_move_wait_time)
-        pyautogui.click(confirm_coordinates*scale_factor)
-        time.sleep(mouse_click_wait_time)
-        album['Actions'] = ['Deleted on ' + time.strftime('%Y-%m-%d %H:%M:%S')]
-        # Finally, lets close the web browser tab
-        if platform.system() == 'Darwin':  # Darwin is the name for the macOS operating system
-            pyautogui.hotkey('cmd', 'w')
+        jobs.append((index, album_id, title, new_title, url))
+    return jobs
+
+def rename_albums(album_list, max_albums_to_rename, three_dots, rename_button, rename_textbox, rename_save_button, macos_scale_factor=1.0,
+                  page_load_wait_time=1.0, mouse_move_wait_time=1.0, mouse_click_wait_time=1.0, waiter=None, templates=None, journal=None,
+                  service_factory=None, rate_limiter=None, workers=4, max_retries=5, use_mouse=True, macro=None, speed=1.0):
+    """
+    Renames every album with an Album New Title.  Albums are renamed through the API first, several at a time;
+    the API can only rename albums this app created, so the others are renamed with the mouse afterwards.
+    Each album's outcome and how long it took go in its Actions column.
+
+    :param service_factory: Function returning a Google Photos API service, or None to only use the mouse.
+    :param rate_limiter: The AdaptiveRateLimiter for the API renames.
+    :param workers: Number of albums renamed through the API at the same time.
+    :param use_mouse: Rename the albums the API can't with the mouse.
+    :param journal: ActionJournal to record every album in as soon as it is done, or None.
+    :param macro: Recorded rename macro (see MouseMacros); None to click the coordinates with the wait times given.
+    See delete_albums for the other parameters.
+    """
+    jobs = albums_to_rename(album_list, max_albums_to_rename)
+    if not jobs:
+        logging.info('No albums to rename.')
+        return album_list
+    import AlbumSchema
+
+    def record(index, album_id, title, status, action, seconds, method):
+        AlbumSchema.set_values(album_list, index, 'Actions', action)
+        if journal is not None:
+            journal.record(album_id, status, action, title=title, seconds=round(seconds, 3))
+        RunMetrics.metrics.observe('album_seconds', seconds, action='rename', method=method)
+        if status == ActionJournal.RENAMED:
+            RunMetrics.metrics.increment('albums_renamed_total', method=method)
         else:
-            pyautogui.hotkey('ctrl', 'w')
-        time.sleep(mouse_click_wait_time)
-        albums_deleted += 1
+            RunMetrics.metrics.increment('album_failures_total', action='rename', method=method)
+
+    mouse_jobs = jobs
+    if service_factory is not None:
+        jobs_by_id = {job[1]: job for job in jobs}
+        needs_mouse = set()
+        logging.info(f"Renaming {len(jobs)} albums through the API with {workers} workers")
+        for (album_id, new_title), error, seconds in GooglePhotosApi.rename_albums(service_factory, [(job[1], job[3]) for job in jobs], rate_limiter, workers, max_retries):
+            index, _, title, _, _ = jobs_by_id[album_id]
+            if error is None:
+                logging.info(f"Renamed album {title} to {new_title}")
+                record(index, album_id, title, ActionJournal.RENAMED, f"Renamed to '{new_title}' on {time.strftime('%Y-%m-%d %H:%M:%S')} (API, {seconds:.1f}s)", seconds, 'api')
+            elif GooglePhotosApi.is_not_modifiable_error(error):
+                # Not created by this app, so only the web page can rename it
+                needs_mouse.add(album_id)
+            else:
+                # HttpError's reason is the API's message without the request URL
+                reason = getattr(error, 'reason', None) or error
+                logging.error(f"Error renaming album {title}: {reason}")
+                record(index, album_id, title, ActionJournal.FAILED, f"Rename failed on {time.strftime('%Y-%m-%d %H:%M:%S')}: {reason}", seconds, 'api')
+        # Rename the rest with the mouse in album list order
+        mouse_jobs = [job for job in jobs if job[1] in needs_mouse]
+    if mouse_jobs and not use_mouse:
+        logging.info(f"{len(mouse_jobs)} albums can only be renamed with the mouse, which is switched off")
         return album_list
 
-def mark_albums_to_rename(album_list):
-    for index, album in album_list.iterrows():
-        # Find albums with 'Copy of 'in the name
-        if 'Copy of ' in album['Album Title']:
-            album_list.at[index, 'Album New Title'] = album['Album Title'].replace('Copy of ', '')
+    import pyautogui
+    scale_factor = macos_scale_factor if platform.system() == 'Darwin' else 1.0  # Darwin is the name for the macOS operating system
+    if macro is None:
+        coordinates = dict(zip(MouseMacros.click_tags(MouseMacros.RENAME_MACRO), (three_dots, rename_button, rename_textbox, rename_save_button)))
+        macro = MouseMacros.macro_from_config(MouseMacros.RENAME_MACRO, coordinates, page_load_wait_time, mouse_move_wait_time, mouse_click_wait_time)
+    player = MouseMacros.MacroPlayer(pyautogui, webbrowser, scale_factor, speed, waiter, templates, sleep=time.sleep)
+    RunMetrics.metrics.start_progress('rename', len(mouse_jobs))
+    for index, album_id, title, new_title, url in mouse_jobs:
+        logging.info(f"Renaming album: {title} to {new_title} at {url} ({RunMetrics.metrics.progress_text('rename')})")
+        if journal is not None:
+            journal.record(album_id, ActionJournal.STARTED, title=title)
+        start = time.monotonic()
+        # Open the album, pick 'Edit album', replace the title, save with the checkmark and close the tab
+        played = player.play(macro, url=url, new_title=new_title)
+        seconds = time.monotonic() - start
+        if played:
+            record(index, album_id, title, ActionJournal.RENAMED, f"Renamed to '{new_title}' on {time.strftime('%Y-%m-%d %H:%M:%S')} (mouse, {seconds:.1f}s)", seconds, 'mouse')
+        else:
+            record(index, album_id, title, ActionJournal.FAILED, f"Rename failed on {time.strftime('%Y-%m-%d %H:%M:%S')}: the new title can't be typed", seconds, 'mouse')
+        RunMetrics.metrics.advance('rename')
     return album_list
 
-def rename_albums(album_list, max_albums_to_delete, three_dots, rename_button, rename_textbox, rename_save_button):
+def command_list(parameters, full_refresh=True):
+    """
+    Downloads the album list from Google Photos into the album store (menu options 1 and 7).
+
+    :param full_refresh: Start the listing from scratch instead of syncing with the album list already stored.
+    :return: True if the listing finished and the album list was saved.
+    """
+    album_store = open_album_store(parameters)
+    album_list = google_photos_album_sync(parameters['scopes'], parameters['credentials_file'], parameters['token_file'], album_store, parameters['requests_per_second'],
+                                          parameters['max_requests_per_second'], parameters['max_retries'], full_refresh=full_refresh, album_list_length_limit=parameters['album_list_length_limit'])
+    if album_list is None:
+        print('The album listing did not finish. Sync again (option 7) to carry on from where it stopped.')
+        return False
+    save_album_list(album_list, parameters)
+    if album_store.checkpoint() is not None:
+        print(f"The album list is not complete: the listing stopped after about {parameters['album_list_length_limit']} albums (album_list_length_limit in the config file). "
+              'Sync (option 7) to carry on from where it stopped.')
+        return False
+    return True
+
+
+def _load_album_list_or_explain(parameters):
+    album_list = load_album_list(parameters)
+    if album_list is None:
+        print('No album list found. Please download the album list first (menu option 1).')
     return album_list
 
-def main():
-    # Read the configuration file into memory
-    parameters = read_config_and_set_up_logging(CONFIG_FILENAME)
-    if parameters == False:
-        logging.error(f"Failed to read config file {CONFIG_FILENAME}. Exiting.")
-        exit()
 
+def command_mark_rename(parameters):
+    """Marks the albums to rename with the script criteria (menu option 2).  :return: True on success."""
+    album_list = _load_album_list_or_explain(parameters)
+    if album_list is None:
+        return False
+    save_album_list(mark_albums_to_rename(album_list), parameters)
+    return True
+
+
+def command_mark_delete(parameters):
+    """Marks the albums to delete with the criteria from the config file (menu option 3).  :return: True on success."""
+    album_list = _load_album_list_or_explain(parameters)
+    if album_list is None:
+        return False
+    save_album_list(mark_albums_to_delete(album_list, parameters['delete_empty_albums'], parameters['delete_albums_that_contain']), parameters)
+    return True
+
+
+def command_find_duplicates(parameters):
+    """Finds and marks albums with the same photos as another album (menu option 12).  :return: True on success."""
+    album_list = _load_album_list_or_explain(parameters)
+    if album_list is None:
+        return False
+    save_album_list(mark_duplicate_albums(album_list, parameters), parameters)
+    return True
+
+
+def command_cluster_titles(parameters):
+    """Groups albums with similar titles and suggests new titles for them (menu option 13).  :return: True on success."""
+    album_list = _load_album_list_or_explain(parameters)
+    if album_list is None:
+        return False
+    save_album_list(mark_title_clusters(album_list, parameters), parameters)
+    return True
+
+
+def command_inventory(parameters, restart=False):
+    """Takes the media inventory and adds the photo counts it finds to the album list (menu option 14).  :return: True on success."""
+    album_list = _load_album_list_or_explain(parameters)
+    if album_list is None:
+        return False
+    album_list = take_media_inventory(album_list, parameters, restart)
+    if album_list is None:
+        return False
+    save_album_list(album_list, parameters)
+    return True
+
+
+def command_rename(parameters, use_mouse=None):
+    """
+    Renames the albums that have a new title, through the API and then with the mouse (menu option 5).
+
+    :param use_mouse: Rename the albums the API can't change with the mouse; None to use rename_with_mouse from the config.
+    :return: True if the album list could be loaded.
+    """
+    if use_mouse is None:
+        use_mouse = parameters['rename_with_mouse']
+    album_list = _load_album_list_or_explain(parameters)
+    if album_list is None:
+        return False
+    service_factory = None
+    if parameters['rename_with_api']:
+        service_factory = photos_service_factory(parameters)
+    rate_limiter = AdaptiveRateLimiter(initial_rate=parameters['requests_per_second'], max_rate=parameters['max_requests_per_second'])
+    waiter, templates = None, None
+    if use_mouse:
+        templates = ScreenReadiness.load_templates(parameters['readiness_template_dir'], ['three_dots', 'rename_button', 'rename_textbox', 'rename_save_button'])
+        waiter = ScreenReadiness.ReadinessWaiter(ScreenReadiness.PyAutoGuiScreenGrabber(), poll_interval=parameters['readiness_poll_interval'], tolerance=parameters['readiness_match_tolerance'])
+    run_journaled(album_list, parameters, lambda album_list, journal: rename_albums(album_list, parameters['max_albums_to_rename'], parameters['three_dots'], parameters['rename_button'], parameters['rename_textbox'], parameters['rename_save_button'],
+                                                                                   parameters['macos_scale_factor'], parameters['page_load_wait_time'], parameters['mouse_move_wait_time'], parameters['mouse_click_wait_time'], waiter, templates, journal,
+                                                                                   service_factory, rate_limiter, parameters['rename_workers'], parameters['max_retries'], use_mouse,
+                                                                                   load_mouse_macro(parameters, MouseMacros.RENAME_MACRO), parameters['macro_speed']))
+    return True
+
+
+def command_delete(parameters, method='mouse'):
+    """
+    Deletes the albums flagged for deletion (menu options 6 and 11).
+
+    :param method: 'mouse' to drive the mouse in your own browser, 'browser' to use the headless browser.
+    :return: True if the album list could be loaded.
+    """
+    album_list = _load_album_list_or_explain(parameters)
+    if album_list is None:
+        return False
+    if method == 'mouse':
+        # Wait for the buttons recorded in option 4 to show up instead of sleeping the full wait times
+        templates = ScreenReadiness.load_templates(parameters['readiness_template_dir'], ['three_dots', 'delete_button', 'confirm_delete_button'])
+        waiter = ScreenReadiness.ReadinessWaiter(ScreenReadiness.PyAutoGuiScreenGrabber(), poll_interval=parameters['readiness_poll_interval'], tolerance=parameters['readiness_match_tolerance'])
+        run_journaled(album_list, parameters, lambda album_list, journal: delete_albums(album_list, parameters['max_albums_to_delete'], parameters['macos_scale_factor'], parameters['three_dots'], parameters['delete_button'], parameters['confirm_delete_button'],
+                                                                                       parameters['page_load_wait_time'], parameters['mouse_move_wait_time'], parameters['mouse_click_wait_time'], waiter, templates, journal,
+                                                                                       load_mouse_macro(parameters, MouseMacros.DELETE_MACRO), parameters['macro_speed'], parameters['prefetch_tabs']))
+    else:
+        run_journaled(album_list, parameters, lambda album_list, journal: HeadlessBrowserDeleter.delete_albums_headless(album_list, parameters['max_albums_to_delete'], parameters['browser_profile_dir'], parameters['browser_workers'],
+                                                                                                                        parameters['browser_headless'], parameters['browser_selectors'], parameters['browser_step_timeout'], parameters['browser_channel'], journal))
+    return True
+
+
+MENU_OPTIONS = [str(option) for option in range(1, 15)]
+
+
+def interactive_menu(parameters):
     while True:
         print("\nGoogle Photos Album Cleanup Menu:")
         print("1. Download the full album list from Google Photos and save to a file in the current directory")
@@ -309,62 +795,224 @@ def main():
         print("4. Record mouse movements for deleting and renaming albums")
         print("5. Drive the mouse and rename albums based on the list of albums to rename")
         print("6. Drive the mouse and delete albums based on the list of albums to delete")
+        print("7. Sync the album list with Google Photos (only new and changed albums are updated, your flags and actions are kept)")
+        print("8. Export the album list to the XLSX file for review")
+        print("9. Import the XLSX file (after editing it yourself) into the album list")
+        print("10. Log in to Google Photos in the headless browser (needed once before option 11)")
+        print("11. Delete albums with the headless browser, several at a time (doesn't use your mouse)")
+        print("12. Find albums with the same photos as another album (exact duplicates, subsets and near duplicates) and mark them")
+        print("13. Find albums with similar titles (copies like 'Copy of Trip' or 'Trip (1)', and typos) and suggest one title for each group")
+        print("14. Take an inventory of every photo and video and count, for each album, the photos that are in no other album")
         print("Q. Quit")
 
         option = input("Please select an option: ")
 
-        if option == '1':
-            # Check if the file exists
-            if os.path.exists(parameters['album_list_file']):
-                # Ask the user if they want to overwrite the file
-                overwrite = input('Album list file already exists. Do you want to overwrite it? (y/n): ')
-                if overwrite.lower() != 'y':
-                    print('File not overwritten. Going back to main menu.')
-                    continue
-            # Call the function to download the album list and write to a file
-            album_list = google_photos_album_lister(parameters['scopes'], parameters['credentials_file'], parameters['token_file'], parameters['album_list_length_limit'])
-            write_xlsx_with_renamed_columns(album_list, parameters['album_list_file'])
-            print('The file can be further processed by the script in options 2 and 3, or you can edit the file yourself and use options 4, then 5 and 6.')
-        elif option == '2':
-            if not os.path.exists(parameters['album_list_file']):
-                print('No album list file found. Please run option 1 first.')
-                continue
-            album_list = read_xlsx_with_renamed_columns(parameters['album_list_file'])
-            album_list = mark_albums_to_rename(album_list)
-            write_xlsx_with_renamed_columns(album_list, parameters['album_list_file'])
-
-        elif option == '3':
-            if not os.path.exists(parameters['album_list_file']):
-                print('No album list file found. Please run option 1 first.')
-                continue
-            album_list = read_xlsx_with_renamed_columns(parameters['album_list_file'])
-            album_list = mark_albums_to_delete(album_list, parameters['delete_empty_albums'], parameters['delete_albums_that_contain'])
-            write_xlsx_with_renamed_columns(album_list, parameters['album_list_file'])
-
-        elif option == '4':
-            # Assuming MouseClickFinderScript.py is in the same directory and has a main() function
-            import MouseClickFinderScript
-            MouseClickFinderScript.main()
-
-        elif option == '5':
-            confirm = input('You will not be able to use your computer during this time. Continue? (y/n): ')
-            if confirm.lower() != 'y':
-                continue
-            album_list = read_xlsx_with_renamed_columns(parameters['album_list_file'])
-            album_list = rename_albums(album_list, parameters['max_albums_to_delete'], parameters['three_dots'], parameters['rename_button'], parameters['rename_textbox'], parameters['rename_save_button'])
-            write_xlsx_with_renamed_columns(album_list, parameters['album_list_file'])
-
-        elif option == '6':
-            confirm = input('You will not be able to use your computer during this time. Continue? (y/n): ')
-            if confirm.lower() != 'y':
-                continue
-            album_list = read_xlsx_with_renamed_columns(parameters['album_list_file'])
-            album_list = delete_albums(album_list, parameters['max_albums_to_delete'], parameters['macos_scale_factor'], parameters['three_dots'], parameters['delete_button'], parameters['confirm_delete_button'])
-            write_xlsx_with_renamed_columns(album_list, parameters['album_list_file'])
-        elif option.lower() == 'q':
+        if option.lower() == 'q':
             break
-        else:
+        if option not in MENU_OPTIONS:
             print("Invalid option. Please try again.")
+            continue
+        # Where the time of the run goes, for the metrics summary
+        with RunMetrics.metrics.timer('stage_seconds', stage=f"menu option {option}"):
+            if option == '1':
+                # Check if the file exists
+                if open_album_store(parameters).exists():
+                    # Ask the user if they want to overwrite the file
+                    overwrite = input('Album list file already exists. Do you want to overwrite it? (y/n): ')
+                    if overwrite.lower() != 'y':
+                        print('File not overwritten. Going back to main menu.')
+                        continue
+                # Download the album list from scratch and write to a file
+                if command_list(parameters, full_refresh=True):
+                    print('The file can be further processed by the script in options 2 and 3, or you can edit the file yourself and use options 4, then 5 and 6.')
+
+            elif option == '2':
+                command_mark_rename(parameters)
+
+            elif option == '3':
+                command_mark_delete(parameters)
+
+            elif option == '4':
+                # Assuming MouseClickFinderScript.py is in the same directory and has a main() function
+                import MouseClickFinderScript
+                MouseClickFinderScript.main()
+
+            elif option == '5':
+                if parameters['rename_with_mouse']:
+                    confirm = input('Albums the API cannot rename are renamed with the mouse; you will not be able to use your computer during that time. Continue? (y/n): ')
+                    if confirm.lower() != 'y':
+                        continue
+                command_rename(parameters)
+
+            elif option == '6':
+                confirm = input('You will not be able to use your computer during this time. Continue? (y/n): ')
+                if confirm.lower() != 'y':
+                    continue
+                command_delete(parameters, method='mouse')
+
+            elif option == '7':
+                command_list(parameters, full_refresh=False)
+
+            elif option == '8':
+                album_list = _load_album_list_or_explain(parameters)
+                if album_list is not None:
+                    export_album_list_xlsx(album_list, parameters)
+
+            elif option == '9':
+                if not os.path.exists(parameters['album_list_file']):
+                    print('No album list file found. Please run option 8 first.')
+                    continue
+                album_list = import_album_list_xlsx(parameters)
+                if album_list is not None and is_auto_exporting_xlsx(parameters):
+                    # Keep the store newer than the spreadsheet so the import isn't repeated
+                    os.utime(parameters['album_store_file'])
+
+            elif option == '10':
+                HeadlessBrowserDeleter.log_in(parameters['browser_profile_dir'], channel=parameters['browser_channel'])
+
+            elif option == '11':
+                command_delete(parameters, method='browser')
+
+            elif option == '12':
+                command_find_duplicates(parameters)
+
+            elif option == '13':
+                command_cluster_titles(parameters)
+
+            elif option == '14':
+                command_inventory(parameters)
+
+
+# Commands that can run for several accounts at the same time.  Deleting and renaming use the mouse or a browser
+# logged in to one account, so they (and the menu) work on one account at a time.
+ACCOUNT_PARALLEL_COMMANDS = ('list', 'sync', 'mark-delete', 'mark-rename', 'find-duplicates', 'cluster-titles', 'inventory')
+# Commands that use the API, and so may need to log in
+ACCOUNT_API_COMMANDS = ('list', 'sync', 'find-duplicates', 'inventory')
+
+
+def build_argument_parser():
+    parser = argparse.ArgumentParser(description='Clean up Google Photos albums.  Run without a command for the interactive menu.')
+    parser.add_argument('--config', default=CONFIG_FILENAME, help=f"Config file to use (default: {CONFIG_FILENAME})")
+    parser.add_argument('--account', action='append', help="Work on the account from this [Account <name>] config section; give it more than once, "
+                                                           "or 'all', to list and mark several accounts at the same time")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    list_command = commands.add_parser('list', help='Download the full album list from Google Photos (menu option 1)')
+    list_command.add_argument('--overwrite', action='store_true', help='Replace an album list that already exists')
+    commands.add_parser('sync', help='Sync the album list with Google Photos, keeping your flags and actions (menu option 7)')
+    commands.add_parser('mark-delete', help='Mark albums to delete with the criteria from the config file (menu option 3)')
+    commands.add_parser('mark-rename', help='Mark albums to rename with the script criteria (menu option 2)')
+    commands.add_parser('find-duplicates', help='Find and mark albums with the same photos as another album (menu option 12)')
+    commands.add_parser('cluster-titles', help='Group albums with similar titles and suggest new titles for them (menu option 13)')
+    inventory_command = commands.add_parser('inventory', help='Count the photos of each album that are in no other album (menu option 14)')
+    inventory_command.add_argument('--restart', action='store_true', help="Start a new inventory instead of carrying on with one that didn't finish")
+    delete_command = commands.add_parser('delete', help='Delete the albums flagged for deletion (menu options 6 and 11)')
+    delete_command.add_argument('--method', choices=('mouse', 'browser'), default='mouse',
+                                help='Your mouse (the default, like menu option 6) or the headless browser (like option 11, after logging in to it with option 10)')
+    delete_command.add_argument('--max', type=int, help='Delete at most this many albums (default: max_albums_to_delete from the config)')
+    rename_command = commands.add_parser('rename', help='Rename the albums that have a new title (menu option 5)')
+    rename_command.add_argument('--no-mouse', action='store_true', help="Only use the API; skip the albums it isn't allowed to rename")
+    rename_command.add_argument('--max', type=int, help='Rename at most this many albums (default: max_albums_to_rename from the config)')
+    return parser
+
+
+def main(argv=None):
+    """
+    Runs one command from the command line without asking anything, or the interactive menu if no command is given.
+
+    :param argv: Command line arguments; None for sys.argv.
+    :return: Exit status, 0 on success.
+    """
+    arguments = build_argument_parser().parse_args(argv)
+    # Read the configuration file into memory
+    parameters = read_config_and_set_up_logging(arguments.config)
+    if parameters == False:
+        logging.error(f"Failed to read config file {arguments.config}. Exiting.")
+        return 1
+    accounts = None
+    if arguments.account:
+        accounts = AccountProfiles.select_accounts(parameters, arguments.account)
+        if accounts is None:
+            return 1
+        if not accounts:
+            logging.error('No account to work on. Add an [Account <name>] section to the config file for each of your accounts.')
+            return 1
+        if arguments.command not in ACCOUNT_PARALLEL_COMMANDS:
+            if len(accounts) > 1:
+                logging.error(f"{'The menu' if arguments.command is None else 'The ' + arguments.command + ' command'} works on one account at a time; pick one with --account.")
+                return 1
+            # Everything the command does then uses that account's files and login
+            parameters = AccountProfiles.parameters_for_account(parameters, accounts[0])
+            accounts = None
+    # Set up the API service factory now, so every option that uses the API shares its session and cached discovery document
+    photos_service_factory(parameters)
+    metrics = RunMetrics.configure(parameters['metrics_prometheus_file'] or None, parameters['metrics_prometheus_interval'])
+    try:
+        if accounts:
+            with metrics.timer('stage_seconds', stage=arguments.command):
+                return 0 if run_command_for_accounts(arguments, parameters, accounts) else 1
+        if arguments.command is None:
+            interactive_menu(parameters)
+            return 0
+        with metrics.timer('stage_seconds', stage=arguments.command):
+            return 0 if run_command(arguments, parameters) else 1
+    finally:
+        # The textfile is only written every so often during the run, so bring it up to date
+        metrics.maybe_write_prometheus(force=True)
+        if parameters['metrics_summary_file']:
+            metrics.write_summary(parameters['metrics_summary_file'])
+
+
+def run_command_for_accounts(arguments, parameters, accounts):
+    """
+    Runs a listing or marking command for several accounts at the same time, each with its own files, login and
+    API rate limit, then writes the consolidated album list of all the accounts.
+
+    :param accounts: Names of the accounts to run the command for.
+    :return: True if the command succeeded for every account.
+    """
+    logged_in = []
+    if arguments.command in ACCOUNT_API_COMMANDS:
+        # Log in one account at a time first, so the browser windows asking to log in don't all open at once
+        for account in accounts:
+            try:
+                photos_service_factory(AccountProfiles.parameters_for_account(parameters, account))()
+                logged_in.append(account)
+            except Exception as e:
+                logging.error(f"Couldn't log in to account {account}, skipping it: {e}")
+    else:
+        logged_in = list(accounts)
+    logging.info(f"Running {arguments.command} for {len(logged_in)} accounts, {parameters['account_workers']} at a time: {', '.join(logged_in)}")
+    results = AccountProfiles.run_for_accounts(parameters, logged_in, lambda account_parameters: run_command(arguments, account_parameters), parameters['account_workers'])
+    saved = save_consolidated_album_list(parameters)
+    return saved and len(logged_in) == len(accounts) and all(results.values())
+
+
+def run_command(arguments, parameters):
+    """Runs the command given on the command line.  :return: True on success."""
+    if arguments.command == 'list':
+        if open_album_store(parameters).exists() and not arguments.overwrite:
+            logging.error('The album list already exists. Use --overwrite to replace it, or the sync command to update it.')
+            return False
+        return command_list(parameters, full_refresh=True)
+    if arguments.command == 'sync':
+        return command_list(parameters, full_refresh=False)
+    if arguments.command == 'mark-delete':
+        return command_mark_delete(parameters)
+    if arguments.command == 'mark-rename':
+        return command_mark_rename(parameters)
+    if arguments.command == 'find-duplicates':
+        return command_find_duplicates(parameters)
+    if arguments.command == 'cluster-titles':
+        return command_cluster_titles(parameters)
+    if arguments.command == 'inventory':
+        return command_inventory(parameters, restart=arguments.restart)
+    if arguments.command == 'delete':
+        if arguments.max is not None:
+            parameters['max_albums_to_delete'] = arguments.max
+        return command_delete(parameters, method=arguments.method)
+    if arguments.max is not None:
+        parameters['max_albums_to_rename'] = arguments.max
+    return command_rename(parameters, use_mouse=False if arguments.no_mouse else None)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,691 @@
+import os
+import re
+import json
+import sys
+import time
+import tempfile
+import subprocess
+import random
+import itertools
+import argparse
+import logging
+import tracemalloc
+import pandas as pd
+import AlbumMarkingRules
+import FakePhotosApi
+import FakeDesktop
+import MouseMacros
+import AlbumTitleClusters
+import AlbumSchema
+import MediaInventory
+import GooglePhotosAlbumCleanup
+import GooglePhotosApi
+
+# Album library sizes to benchmark by default
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+STAGE_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+# Where --save-baselines keeps the stage results that --check-baselines compares against
+DEFAULT_BASELINES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baselines.json')
+# Mouse positions for the deleter stage; only the number of calls matters
+FAKE_COORDINATES = ((1700.0, 145.0), (1600.0, 200.0), (1000.0, 600.0))
+# Seconds between the clicks of a recorded delete, and how long the pointer rested on each button first
+RECORDED_DELETE_TIMING = ((None, 0.3), (1.4, 0.3), (1.1, 0.2))
+# Speed the recorded macro is played at in the stage benchmark
+MACRO_SPEED = 2.0
+# How long the fake browser takes to load an album page, and how many albums ahead the prefetching stage opens
+PAGE_LOAD_SECONDS = 5.0
+PREFETCH_TABS = 1
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+PLACES = ['Beach', 'Paris', 'Grandma', 'Birthday', 'Hiking', 'Christmas', 'School Play', 'Road Trip', 'Wedding', 'Camping']
+
+
+def make_synthetic_album_list(rows, seed=0):
+    """
+    Builds an album list that looks like a migrated iCloud library: lots of "iPhoto Events" albums with dates,
+    some "Copy of" duplicates, some empty albums and ordinary titles.
+
+    :param rows: Number of albums.
+    :param seed: Random seed so runs are comparable.
+    :return: A DataFrame with the script's short headers, with the column types the API listing produces.
+    """
+    rng = random.Random(seed)
+    titles, counts = [], []
+    for i in range(rows):
+        kind = rng.random()
+        if kind < 0.35:
+            title = f"iPhoto Events {rng.choice(MONTHS)} {rng.randint(1, 28)}, {rng.randint(1998, 2015)}"
+        elif kind < 0.45:
+            title = f"Copy of {rng.choice(PLACES)} {rng.randint(1998, 2023)}"
+        else:
+            title = f"{rng.choice(PLACES)} {rng.randint(1998, 2023)}"
+        titles.append(title)
+        # The API returns mediaItemsCount as a string
+        counts.append(str(0 if rng.random() < 0.1 else rng.randint(1, 500)))
+    return pd.DataFrame({
+        'Album Title': titles,
+        'Album New Title': [''] * rows,
+        'Photo Count': counts,
+        'Delete Flag': [''] * rows,
+        'Album ID': [f"album-{i}" for i in range(rows)],
+        'Album URL': [f"https://photos.google.com/lr/album/album-{i}" for i in range(rows)],
+        'Actions': [''] * rows,
+    })
+
+
+def iterrows_mark_albums_to_delete(album_list, delete_empty_albums, delete_albums_that_contain):
+    # The row by row implementation the rule engine replaced, kept as the benchmark reference
+    if isinstance(delete_albums_that_contain, str):
+        delete_albums_that_contain = [delete_albums_that_contain]
+    for index, album in album_list.iterrows():
+        if delete_empty_albums and album['Photo Count'] == '0':
+            album_list.at[index, 'Delete Flag'] = True
+        elif delete_albums_that_contain[0] and any(s in album['Album Title'] for s in delete_albums_that_contain):
+            album_list.at[index, 'Delete Flag'] = True
+        elif 'iPhoto Events' in album['Album Title'] and re.search(r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\b \d{1,2}, \d{4}', album['Album Title']):
+            album_list.at[index, 'Delete Flag'] = True
+    return album_list
+
+
+def rule_engine_mark_albums_to_delete(album_list, delete_empty_albums, delete_albums_that_contain):
+    rules = AlbumMarkingRules.compile_delete_rules(delete_empty_albums, delete_albums_that_contain)
+    return AlbumMarkingRules.apply_delete_rules(album_list, rules)
+
+
+def time_call(function, *args):
+    """Returns the wall-clock seconds function(*args) takes, and its result."""
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def benchmark_marking(sizes, legacy_max_rows):
+    """
+    Times the row by row marking against the rule engine and prints a table with the speedup.
+    Above legacy_max_rows the row by row time is extrapolated from the largest size that was measured.
+    """
+    settings = (True, ('Wedding', 'Camping'))
+    legacy_seconds_per_row = None
+    print(f"{'albums':>10} {'iterrows (s)':>14} {'rule engine (s)':>16} {'speedup':>9}")
+    for rows in sizes:
+        album_list = make_synthetic_album_list(rows)
+        engine_seconds, engine_result = time_call(rule_engine_mark_albums_to_delete, album_list.copy(), *settings)
+        if rows <= legacy_max_rows:
+            legacy_seconds, legacy_result = time_call(iterrows_mark_albums_to_delete, album_list.copy(), *settings)
+            legacy_seconds_per_row = legacy_seconds / rows
+            # Both implementations must flag exactly the same albums
+            assert (legacy_result['Delete Flag'] == True).equals(engine_result['Delete Flag'] == True)
+            legacy_label = f"{legacy_seconds:14.2f}"
+        elif legacy_seconds_per_row is not None:
+            legacy_seconds = legacy_seconds_per_row * rows
+            legacy_label = f"{legacy_seconds:9.2f} est."
+        else:
+            legacy_seconds = None
+            legacy_label = f"{'skipped':>14}"
+        speedup = f"{legacy_seconds / engine_seconds:8.0f}x" if legacy_seconds else f"{'-':>9}"
+        print(f"{rows:>10} {legacy_label} {engine_seconds:16.3f} {speedup}")
+
+
+def time_to_first_album_page(service_factory):
+    """Returns the seconds from asking for the API service to having the first page of albums."""
+    start = time.perf_counter()
+    service = service_factory()
+    service.albums().list(pageSize=50).execute()
+    return time.perf_counter() - start
+
+
+def benchmark_api_startup(latency, runs):
+    """
+    Times how long it takes to get the first page of albums from a local fake of the API (with latency seconds
+    added to every request to stand in for the network): building the service the old way, with a download of the
+    discovery document every time, against the service factory starting cold (nothing cached), warm (discovery
+    document cached on disk, as in a new run of the script) and reused (later callers in the same process).
+    """
+    # Imported here because only this benchmark needs them
+    from google.auth.credentials import AnonymousCredentials
+    from googleapiclient.discovery import build
+
+    with FakePhotosApi.FakePhotosApi(FakePhotosApi.make_albums(200), latency=latency) as fake, tempfile.TemporaryDirectory() as cache_dir:
+        cache_file = os.path.join(cache_dir, 'discovery.json')
+        new_factory = lambda: GooglePhotosApi.PhotosServiceFactory('', '', '', discovery_cache_file=cache_file, discovery_url=fake.discovery_url, credentials=AnonymousCredentials())
+        uncached = lambda: build('photoslibrary', 'v1', credentials=AnonymousCredentials(), static_discovery=False, discoveryServiceUrl=fake.discovery_url)
+        results = {'build() every time': [], 'factory, cold': [], 'factory, warm': [], 'factory, reused': []}
+        for _ in range(runs):
+            results['build() every time'].append(time_to_first_album_page(uncached))
+            os.remove(cache_file) if os.path.exists(cache_file) else None
+            results['factory, cold'].append(time_to_first_album_page(new_factory()))
+            factory = new_factory()
+            results['factory, warm'].append(time_to_first_album_page(factory))
+            results['factory, reused'].append(time_to_first_album_page(factory))
+        print(f"Time to the first album page with {latency * 1000:.0f}ms of latency per request (median of {runs} runs):")
+        for label, seconds in results.items():
+            print(f"{label:>20} {sorted(seconds)[len(seconds) // 2] * 1000:8.1f} ms")
+        print(f"{fake.discovery_requests} discovery downloads for {4 * runs} services")
+
+
+TITLE_WORDS = ['Summer', 'Winter', 'Trip', 'to', 'the', 'Lake', 'Mountains', 'Party', 'Family', 'Reunion', 'Graduation', 'Soccer', 'Game',
+               'Visit', 'Grandma\'s', 'House', 'Weekend', 'Vacation', 'Zoo', 'Museum', 'Concert', 'Garden', 'New', 'Puppy', 'Kitchen', 'Remodel']
+COPY_VARIANTS = ['Copy of {}', '{} (1)', '{} (2)', '{} copy', '{} - Copy', '{} 2']
+
+
+def make_noisy_titles(rows, seed=0):
+    """
+    Builds album titles the way a migrated library has them: distinct titles, and copies of them with "Copy of",
+    " (1)", " copy" or " 2" added, or with a typo.
+
+    :return: List of rows titles.
+    """
+    rng = random.Random(seed)
+    titles = []
+    while len(titles) < rows:
+        title = ' '.join(rng.sample(TITLE_WORDS, rng.randint(2, 5)))
+        if rng.random() < 0.5:
+            title += f" {rng.randint(1998, 2023)}"
+        titles.append(title)
+        for _ in range(rng.choice([0, 0, 0, 1, 1, 2])):
+            if rng.random() < 0.8:
+                titles.append(rng.choice(COPY_VARIANTS).format(title))
+            else:
+                # Drop a letter
+                cut = rng.randrange(len(title))
+                titles.append(title[:cut] + title[cut + 1:])
+    return titles[:rows]
+
+
+def benchmark_title_clusters(sizes):
+    """Times clustering similar album titles (AlbumTitleClusters.mark_title_clusters) on noisy synthetic titles."""
+    print(f"{'albums':>10} {'seconds':>9} {'clustered':>10} {'copies':>8}")
+    for rows in sizes:
+        titles = make_noisy_titles(rows)
+        album_list = make_synthetic_album_list(rows).assign(**{'Album Title': titles})
+        seconds, result = time_call(AlbumTitleClusters.mark_title_clusters, album_list, AlbumTitleClusters.DEFAULT_SIMILARITY_THRESHOLD, True)
+        roles = result[AlbumTitleClusters.TITLE_CLUSTER_COLUMN]
+        print(f"{rows:>10} {seconds:9.2f} {int((roles != '').sum()):>10} {int(roles.str.endswith('(copy)').sum()):>8}")
+
+
+def column_bytes(series):
+    """
+    :return: Bytes a column takes.  pandas' memory_usage(deep=True) counts a Python object again for every row it
+             is in, like the empty string shared by every row of an empty column, so object columns are counted
+             here with each distinct object once.
+    """
+    if series.dtype == object:
+        distinct = {id(value): value for value in series}
+        return 8 * len(series) + sum(sys.getsizeof(value) for value in distinct.values())
+    return int(series.memory_usage(index=False, deep=True))
+
+
+def benchmark_memory(sizes):
+    """
+    Measures the memory of a marked album list with every column held as Python objects, the way the script kept
+    it before the typed schema, against the same list after AlbumSchema.apply_schema, column by column.
+
+    :return: True if the typed list is smaller at every size and flags the same albums.
+    """
+    succeeded = True
+    for rows in sizes:
+        album_list = make_synthetic_album_list(rows)
+        # The columns the script adds, empty like a freshly listed album had them
+        album_list = album_list.assign(**{column: '' for column in AlbumSchema.COLUMN_KINDS if column not in album_list.columns})
+        before = GooglePhotosAlbumCleanup.mark_albums_to_delete(album_list, True, ['Wedding', 'Camping'])
+        seconds, after = time_call(AlbumSchema.apply_schema, before, 'the benchmark')
+        assert (after['Delete Flag'] == (before['Delete Flag'] == True)).all()
+        print(f"{rows} albums, typed in {seconds:.2f}s")
+        print(f"{'column':>16} {'objects (MB)':>13} {'typed (MB)':>11}  typed as")
+        totals = [0, 0]
+        for column in after.columns:
+            sizes_mb = [column_bytes(before[column]) / 2 ** 20, column_bytes(after[column]) / 2 ** 20]
+            totals = [total + size for total, size in zip(totals, sizes_mb)]
+            print(f"{column:>16} {sizes_mb[0]:13.1f} {sizes_mb[1]:11.1f}  {after[column].dtype}")
+        print(f"{'total':>16} {totals[0]:13.1f} {totals[1]:11.1f}  ({totals[0] / totals[1]:.1f}x smaller)")
+        succeeded = succeeded and totals[1] < totals[0]
+    return succeeded
+
+
+def reference_photo_counts(memberships):
+    """:return: DataFrame of the MediaInventory columns worked out in memory from the memberships, to check the inventory against."""
+    albums_of = {}
+    for album_id, media_ids in memberships.items():
+        for media_id in media_ids:
+            albums_of.setdefault(media_id, set()).add(album_id)
+    rows = {}
+    for album_id, media_ids in memberships.items():
+        shared = [media_id for media_id in media_ids if len(albums_of[media_id]) > 1]
+        sharing = set().union(*(albums_of[media_id] for media_id in shared)) - {album_id}
+        rows[album_id] = (len(media_ids) - len(shared), len(shared), len(sharing))
+    return pd.DataFrame.from_dict(rows, orient='index', columns=list(MediaInventory.INVENTORY_COLUMNS)).astype('Int32').sort_index()
+
+
+def benchmark_inventory(sizes, photos_per_album=50):
+    """
+    Takes the media inventory of synthetic libraries served by a local fake of the API: once in one go, and once
+    interrupted halfway through the media listing and again halfway through the albums, then carried on.  Both must
+    give the same per-album counts as working them out in memory.  The peak memory of taking the inventory (under
+    tracemalloc) should stay about the same however big the library is, as everything goes to the database as it comes.
+
+    :param sizes: Numbers of media items in the libraries; each has one album per 50 of them.
+    :return: True if every inventory gave the right counts.
+    """
+    # Imported here because only this benchmark needs it
+    from google.auth.credentials import AnonymousCredentials
+
+    succeeded = True
+    print(f"{'media items':>12} {'albums':>7} {'seconds':>8} {'items/s':>9} {'peak (MB)':>10} {'counts (s)':>11}  resumed")
+    for size in sizes:
+        media_items, memberships = FakePhotosApi.make_library(size, max(1, size // 50), photos_per_album)
+        expected = reference_photo_counts(memberships)
+        album_ids = list(memberships)
+        with FakePhotosApi.FakePhotosApi([], memberships, media_items=media_items) as fake, tempfile.TemporaryDirectory() as work_dir:
+            factory = GooglePhotosApi.PhotosServiceFactory('', '', '', discovery_cache_file=os.path.join(work_dir, 'discovery.json'),
+                                                           discovery_url=fake.discovery_url, credentials=AnonymousCredentials())
+            rate_limiter = lambda: GooglePhotosApi.AdaptiveRateLimiter(initial_rate=10_000, max_rate=10_000)
+
+            def take_inventory(db_file):
+                conn = MediaInventory.open_inventory(os.path.join(work_dir, db_file))
+                try:
+                    return MediaInventory.take_inventory(conn, factory, album_ids, rate_limiter(), restart=True)
+                finally:
+                    conn.close()
+
+            seconds, finished = time_call(take_inventory, 'straight.db')
+            conn = MediaInventory.open_inventory(os.path.join(work_dir, 'straight.db'))
+            counts_seconds, counts = time_call(MediaInventory.album_photo_counts, conn)
+            conn.close()
+            correct = finished and counts.sort_index().equals(expected)
+
+            # Stop halfway through the media listing and halfway through the albums, as if the run had been
+            # interrupted, then carry on
+            conn = MediaInventory.open_inventory(os.path.join(work_dir, 'resumed.db'))
+            MediaInventory.start_inventory(conn, restart=True)
+            pages = GooglePhotosApi.fetch_media_item_pages(factory(), rate_limiter())
+            MediaInventory.store_media_pages(conn, itertools.islice(pages, max(1, size // 200)))
+            pages.close()
+            albums = GooglePhotosApi.iter_album_memberships(factory, album_ids, rate_limiter())
+            MediaInventory.store_memberships(conn, itertools.islice(albums, len(album_ids) // 2))
+            albums.close()
+            resumed = MediaInventory.take_inventory(conn, factory, album_ids, rate_limiter()) and MediaInventory.album_photo_counts(conn).sort_index().equals(expected)
+            conn.close()
+
+            tracemalloc.start()
+            try:
+                take_inventory('traced.db')
+                peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            finally:
+                tracemalloc.stop()
+        succeeded = succeeded and correct and resumed
+        print(f"{size:>12} {len(album_ids):>7} {seconds:8.2f} {size / seconds:9.0f} {peak_mb:10.1f} {counts_seconds:11.2f}  "
+              f"{'same counts' if resumed else 'DIFFERENT COUNTS'}{'' if correct else '  WRONG COUNTS'}")
+    return succeeded
+
+
+def benchmark_accounts(accounts, albums_per_account, latency, rate):
+    """
+    Lists several accounts, each served by its own local fake of the API, through the script's command line
+    (list --account all), one account at a time and then all at the same time, and checks the consolidated album list.
+    Every account has its own rate limit of rate requests per second, so listing them together should take about
+    as long as the slowest one.
+
+    :return: True if the consolidated album list has every album of every account.
+    """
+    import configparser
+    from contextlib import ExitStack
+    from google.auth.credentials import AnonymousCredentials
+
+    names = [f"account{i}" for i in range(1, accounts + 1)]
+    with tempfile.TemporaryDirectory() as work_dir, ExitStack() as stack:
+        config = configparser.ConfigParser()
+        config.read(os.path.join(os.path.dirname(os.path.abspath(__file__)), GooglePhotosAlbumCleanup.CONFIG_FILENAME))
+        config['logging']['file'] = os.path.join(work_dir, 'benchmark.log')
+        config['AlbumLister'].update({'album_list_file': os.path.join(work_dir, 'albums.xlsx'), 'album_list_length_limit': '0',
+                                      'snapshot_db_file': os.path.join(work_dir, 'albums.db'), 'requests_per_second': str(rate), 'max_requests_per_second': str(rate)})
+        config['AlbumStorage'].update({'store_file': '', 'auto_export_xlsx': 'false'})
+        config['AlbumDeleter']['journal_file'] = os.path.join(work_dir, 'journal.jsonl')
+        config['Metrics'].update({'summary_file': '', 'prometheus_textfile': ''})
+        consolidated_file = os.path.join(work_dir, 'all accounts.csv')
+        config['Accounts'] = {'workers': str(accounts), 'consolidated_album_list_file': consolidated_file}
+        fakes = {}
+        for name in names:
+            token_file = os.path.join(work_dir, f"token - {name}.json")
+            config[f"Account {name}"] = {'token_file': token_file}
+            albums = [{**album, 'id': f"{name}-{album['id']}"} for album in FakePhotosApi.make_albums(albums_per_account, seed_title=name)]
+            fakes[name] = fake = stack.enter_context(FakePhotosApi.FakePhotosApi(albums, latency=latency))
+            # The script logs in through the shared service factory of each account, so set them up for the fakes first
+            GooglePhotosApi.get_service_factory(config['GooglePhotosAPI']['scopes'], config['GooglePhotosAPI']['credentials_file'], token_file,
+                                                discovery_url=fake.discovery_url, credentials=AnonymousCredentials(), discovery_cache_file='')
+        config_files = {}
+        for workers in (1, accounts):
+            config['Accounts']['workers'] = str(workers)
+            config_files[workers] = os.path.join(work_dir, f"config {workers}.ini")
+            with open(config_files[workers], 'w') as file:
+                config.write(file)
+
+        print(f"Listing {accounts} accounts of {albums_per_account} albums, {latency * 1000:.0f}ms of latency and {rate:g} requests per second each:")
+        succeeded = True
+        for label, workers in (('one at a time', 1), ('all at once', accounts)):
+            seconds, status = time_call(GooglePhotosAlbumCleanup.main, ['--config', config_files[workers], '--account', 'all', 'list', '--overwrite'])
+            consolidated = pd.read_csv(consolidated_file, keep_default_na=False)
+            per_account = consolidated['Account'].value_counts()
+            complete = status == 0 and all(per_account.get(name, 0) == albums_per_account for name in names)
+            succeeded = succeeded and complete
+            print(f"{label:>15} {seconds:8.2f} s  {len(consolidated)} albums in the consolidated list{'' if complete else '  INCOMPLETE'}")
+        print(f"API requests per account: {', '.join(str(fake.requests) for fake in fakes.values())}")
+    return succeeded
+
+
+def album_list_to_api_albums(album_list):
+    """:return: The album list as album dictionaries like albums().list returns them, to serve from FakePhotosApi."""
+    return [{'id': album_id, 'title': title, 'mediaItemsCount': count, 'productUrl': url}
+            for album_id, title, count, url in zip(album_list['Album ID'], album_list['Album Title'], album_list['Photo Count'], album_list['Album URL'])]
+
+
+def measure_stage(function, measure_memory=True, min_seconds=1.0, max_runs=5):
+    """
+    Times function() and, with measure_memory, runs it once more under tracemalloc for its peak memory (tracing
+    slows Python down too much to time the same run).  Quick stages are run again until min_seconds have passed
+    (at most max_runs times) and the fastest run counts, so the baseline check isn't thrown by noise.  Memory that
+    was allocated before the stage, like its input, isn't counted.
+
+    :return: Tuple of seconds, peak memory in MB (None without measure_memory) and the result of the last timed run.
+    """
+    runs = []
+    while not runs or (sum(runs) < min_seconds and len(runs) < max_runs):
+        start = time.perf_counter()
+        result = function()
+        runs.append(time.perf_counter() - start)
+    seconds = min(runs)
+    peak_mb = None
+    if measure_memory:
+        del result
+        tracemalloc.start()
+        try:
+            result = function()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return seconds, peak_mb, result
+
+
+def make_recorded_delete_macro():
+    """:return: A delete macro recorded from synthetic clicks (RECORDED_DELETE_TIMING) on a virtual clock."""
+    clock = FakeDesktop.VirtualClock()
+    recorder = MouseMacros.MacroRecorder(MouseMacros.DELETE_MACRO, page_load_wait_time=7, mouse_click_wait_time=1, screen=(1920, 1080), clock=clock.monotonic)
+    for (x, y), (gap, rested) in zip(FAKE_COORDINATES, RECORDED_DELETE_TIMING):
+        clock.sleep((gap or rested) - rested)
+        recorder.on_move(x, y)
+        clock.sleep(rested)
+        recorder.on_click(x, y)
+    return recorder.macro()
+
+
+def stage_functions(album_list, work_dir, limits):
+    """
+    Builds the stages of a run of the script on one album list, each a function that runs it from scratch.
+
+    :param album_list: Synthetic album list from make_synthetic_album_list.
+    :param work_dir: Folder for the files the stages write.
+    :param limits: Dictionary of stage name to the largest album list it is run on (the slow stages would take minutes on 1M albums).
+    :return: Dictionary of stage name to (function, albums it handles); stages over their limit are left out.
+    """
+    rows = len(album_list)
+    stages = {}
+    if rows <= limits['list']:
+        def list_albums():
+            # The sync authenticates through the shared service factory, so give it one for the fake API first
+            from google.auth.credentials import AnonymousCredentials
+            # Listed from scratch into the snapshot database, the way option 1 does it
+            store_file = os.path.join(work_dir, 'albums.db')
+            for path in (store_file, store_file + '-wal', store_file + '-shm'):
+                if os.path.exists(path):
+                    os.remove(path)
+            store = GooglePhotosAlbumCleanup.open_album_store({'storage_backend': 'sqlite', 'album_store_file': store_file})
+            with FakePhotosApi.FakePhotosApi(album_list_to_api_albums(album_list)) as fake:
+                GooglePhotosApi.get_service_factory(fake.url, '', '', discovery_url=fake.discovery_url, credentials=AnonymousCredentials(),
+                                                    discovery_cache_file=os.path.join(work_dir, 'discovery.json'))
+                return GooglePhotosAlbumCleanup.google_photos_album_sync(fake.url, '', '', store, requests_per_second=10_000, max_requests_per_second=10_000, full_refresh=True)
+        stages['list'] = (list_albums, rows)
+    # mark_albums_to_delete changes the list it is given
+    stages['mark'] = (lambda: GooglePhotosAlbumCleanup.mark_albums_to_delete(album_list.copy(), True, ['Wedding', 'Camping']), rows)
+    marked = stages['mark'][0]()
+    xlsx_file = os.path.join(work_dir, 'albums.xlsx')
+    if rows <= limits['xlsx']:
+        stages['xlsx write'] = (lambda: GooglePhotosAlbumCleanup.write_xlsx_with_renamed_columns(marked, xlsx_file), rows)
+        stages['xlsx read'] = (lambda: GooglePhotosAlbumCleanup.read_xlsx_with_renamed_columns(xlsx_file), rows)
+    if rows <= limits['delete']:
+        flagged = int((marked['Delete Flag'] == True).sum())
+
+        def delete_albums():
+            with FakeDesktop.fake_desktop(GooglePhotosAlbumCleanup) as (clock, pyautogui, browser):
+                GooglePhotosAlbumCleanup.delete_albums(marked.copy(), flagged, 1.0, *FAKE_COORDINATES, page_load_wait_time=7, mouse_move_wait_time=1, mouse_click_wait_time=1)
+            assert len(browser.opened) == flagged
+            return clock.now
+        stages['delete (mouse)'] = (delete_albums, flagged)
+        macro = make_recorded_delete_macro()
+
+        def delete_albums_with_macro():
+            with FakeDesktop.fake_desktop(GooglePhotosAlbumCleanup) as (clock, pyautogui, browser):
+                GooglePhotosAlbumCleanup.delete_albums(marked.copy(), flagged, 1.0, *FAKE_COORDINATES, macro=macro, speed=MACRO_SPEED)
+            assert len(browser.opened) == flagged
+            return clock.now
+        stages['delete (macro)'] = (delete_albums_with_macro, flagged)
+        urls = marked.loc[marked['Delete Flag'] == True, 'Album URL'].tolist()
+
+        def delete_albums_in_tabs():
+            with FakeDesktop.fake_desktop(GooglePhotosAlbumCleanup, page_load_seconds=PAGE_LOAD_SECONDS) as (clock, pyautogui, browser):
+                GooglePhotosAlbumCleanup.delete_albums(marked.copy(), flagged, 1.0, *FAKE_COORDINATES, page_load_wait_time=7, mouse_move_wait_time=1, mouse_click_wait_time=1,
+                                                       prefetch_tabs=PREFETCH_TABS)
+            # Every album was deleted in its own tab, in order, and no click came before its page had loaded
+            assert browser.closed == urls and not browser.early_clicks()
+            return clock.now
+        stages['delete (tabs)'] = (delete_albums_in_tabs, flagged)
+    return stages
+
+
+def benchmark_stages(sizes, limits, measure_memory=True):
+    """
+    Times each stage of the script (listing from the fake API, marking, writing and reading the spreadsheet and
+    deleting with the mouse, clicking the config coordinates, playing a recorded macro at MACRO_SPEED and opening
+    PREFETCH_TABS albums ahead in tabs of a fake browser, with pyautogui, webbrowser and time.sleep faked on a
+    virtual clock) on synthetic libraries, and prints the throughput and peak memory of each.
+
+    :return: Dictionary of 'stage@albums' to {'rows_per_second': ..., 'peak_mb': ...}.
+    """
+    results = {}
+    print(f"{'stage':>16} {'albums':>10} {'seconds':>9} {'albums/s':>12} {'peak MB':>9}")
+    for rows in sizes:
+        album_list = make_synthetic_album_list(rows)
+        with tempfile.TemporaryDirectory() as work_dir:
+            for stage, (function, handled) in stage_functions(album_list, work_dir, limits).items():
+                seconds, peak_mb, result = measure_stage(function, measure_memory)
+                results[f"{stage}@{rows}"] = {'rows_per_second': handled / seconds, 'peak_mb': peak_mb}
+                peak_label = f"{peak_mb:9.1f}" if peak_mb is not None else f"{'-':>9}"
+                print(f"{stage:>16} {handled:>10} {seconds:9.3f} {handled / seconds:12.0f} {peak_label}")
+                if stage.startswith('delete') and handled:
+                    print(f"{'':>16} {'':>10} the real deletions would take {result / handled:.1f}s per album ({result / 3600:.1f} hours in all)")
+    return results
+
+
+def save_baselines(results, baselines_file):
+    with open(baselines_file, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+    print(f"Saved {len(results)} baselines to {baselines_file}")
+
+
+def check_baselines(results, baselines_file, tolerance):
+    """
+    Compares stage results with the saved baselines.  A stage regresses when its throughput drops, or its peak
+    memory grows, by more than tolerance (a fraction, 0.3 for 30%).  Stages without a baseline are skipped.
+
+    :return: True if nothing regressed.
+    """
+    try:
+        with open(baselines_file, encoding='utf-8') as file:
+            baselines = json.load(file)
+    except (OSError, ValueError) as e:
+        print(f"Can't read the baselines in {baselines_file}: {e}")
+        return False
+    regressions = []
+    for key, result in results.items():
+        baseline = baselines.get(key)
+        if baseline is None:
+            continue
+        if result['rows_per_second'] < baseline['rows_per_second'] * (1 - tolerance):
+            regressions.append(f"{key}: {result['rows_per_second']:.0f} albums/s, baseline {baseline['rows_per_second']:.0f}")
+        # A megabyte of slack so tiny stages don't fail on noise
+        if result['peak_mb'] is not None and baseline.get('peak_mb') is not None and result['peak_mb'] > baseline['peak_mb'] * (1 + tolerance) + 1:
+            regressions.append(f"{key}: {result['peak_mb']:.1f} MB peak, baseline {baseline['peak_mb']:.1f}")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    print(f"{len(regressions)} regressions against {baselines_file}")
+    return not regressions
+
+
+# Modules that make the script slow to start; none of them should be imported just to start it
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'googleapiclient', 'google_auth_oauthlib', 'pyautogui', 'PIL', 'playwright')
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def parse_import_times(output, module=None):
+    """
+    Reads the -X importtime report a Python process wrote to stderr.
+
+    :return: Tuple of module's cumulative import time in seconds (None if not given or not imported) and the set of
+             top level packages that were imported.
+    """
+    cumulative, packages = None, set()
+    for line in output.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        packages.add(match.group(4).split('.')[0])
+        if match.group(4) == module and not match.group(3):
+            cumulative = int(match.group(2)) / 1e6
+    return cumulative, packages
+
+
+def import_times(module):
+    """
+    Imports module in a new Python process with -X importtime.
+
+    :return: Tuple of the module's cumulative import time in seconds and the set of top level packages that were imported.
+    """
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stderr
+    return parse_import_times(output, module)
+
+
+def menu_startup(script, config_file, work_dir):
+    """
+    Starts the script without a command in a new Python process (with -X importtime), the way the menu is opened:
+    it reads the config file, sets up logging, metrics and the API service factory, shows the menu, and is told to
+    quit straight away.  The log and metrics files go to work_dir.
+
+    :return: Tuple of the seconds the whole process took and the set of top level packages that were imported.
+    """
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', script, '--config', config_file], input='q\n', capture_output=True, text=True, cwd=work_dir, check=True)
+    seconds = time.perf_counter() - start
+    if 'Google Photos Album Cleanup Menu' not in process.stdout:
+        raise RuntimeError(f"The menu didn't show: {process.stdout[-500:]}")
+    return seconds, parse_import_times(process.stderr)[1]
+
+
+def benchmark_startup(budget_ms, runs, menu_budget_ms):
+    """
+    Times how long the script takes to start, each in a new Python process: importing it (with -X importtime),
+    running --help, and reading the config file up to the menu.  Checks the import and the menu against their
+    budgets and that none of HEAVY_MODULES is loaded on the way to either.
+
+    :return: True if both stayed within budget and imported none of the heavy modules.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'GooglePhotosAlbumCleanup.py')
+    config_file = os.path.join(os.path.dirname(script), GooglePhotosAlbumCleanup.CONFIG_FILENAME)
+    imports, helps, menus, packages = [], [], [], set()
+    with tempfile.TemporaryDirectory() as work_dir:
+        for _ in range(runs):
+            seconds, loaded = import_times('GooglePhotosAlbumCleanup')
+            imports.append(seconds)
+            packages |= loaded
+            start = time.perf_counter()
+            subprocess.run([sys.executable, script, '--help'], capture_output=True, check=True)
+            helps.append(time.perf_counter() - start)
+            seconds, loaded = menu_startup(script, config_file, work_dir)
+            menus.append(seconds)
+            packages |= loaded
+    import_ms = sorted(imports)[len(imports) // 2] * 1000
+    menu_ms = sorted(menus)[len(menus) // 2] * 1000
+    heavy = sorted(packages.intersection(HEAVY_MODULES))
+    print(f"Script startup (median of {runs} runs):")
+    print(f"{'import':>20} {import_ms:8.1f} ms (budget {budget_ms:.0f} ms)")
+    print(f"{'--help':>20} {sorted(helps)[len(helps) // 2] * 1000:8.1f} ms (whole process)")
+    print(f"{'config and menu':>20} {menu_ms:8.1f} ms (whole process, budget {menu_budget_ms:.0f} ms)")
+    print(f"{'heavy modules':>20} {', '.join(heavy) if heavy else 'none'}")
+    within_budget = import_ms <= budget_ms and menu_ms <= menu_budget_ms and not heavy
+    print('Startup is within budget.' if within_budget else 'Startup is OVER BUDGET.')
+    return within_budget
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for the Google Photos Album Cleanup script.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Album list sizes to benchmark.')
+    parser.add_argument('--legacy-max-rows', type=int, default=100_000, help='Largest size to run the slow row by row reference on; larger sizes are extrapolated.')
+    parser.add_argument('--api-latency', type=float, default=0.05, help='Seconds of latency the fake API adds to every request in the startup benchmark.')
+    parser.add_argument('--api-runs', type=int, default=5, help='Runs of the API startup benchmark.')
+    parser.add_argument('--import-budget-ms', type=float, default=200.0, help='Most milliseconds importing the script may take before the startup benchmark fails.')
+    parser.add_argument('--menu-budget-ms', type=float, default=400.0, help='Most milliseconds reading the config file up to the menu may take (whole process) before the startup benchmark fails.')
+    parser.add_argument('--stage-sizes', type=int, nargs='+', default=STAGE_SIZES, help='Album library sizes for the stage benchmark.')
+    parser.add_argument('--list-max-rows', type=int, default=100_000, help='Largest library to list from the fake API in the stage benchmark.')
+    parser.add_argument('--xlsx-max-rows', type=int, default=100_000, help='Largest library to write and read as XLSX in the stage benchmark.')
+    parser.add_argument('--delete-max-rows', type=int, default=100_000, help='Largest library to run the mouse deleter on in the stage benchmark.')
+    parser.add_argument('--no-memory', action='store_true', help="Don't measure peak memory (halves the time the stage benchmark takes).")
+    parser.add_argument('--save-baselines', action='store_true', help='Save the stage results as the baselines to check against.')
+    parser.add_argument('--check-baselines', action='store_true', help='Fail if a stage is slower or uses more memory than its baseline.')
+    parser.add_argument('--baselines-file', default=DEFAULT_BASELINES_FILE, help='Where the stage baselines are kept.')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='Fraction a stage may be slower or bigger than its baseline before the check fails.')
+    parser.add_argument('--cluster-sizes', type=int, nargs='+', default=[10_000, 100_000], help='Album library sizes for the title clustering benchmark.')
+    parser.add_argument('--memory-sizes', type=int, nargs='+', default=[1_000_000], help='Album list sizes for the memory benchmark.')
+    parser.add_argument('--inventory-sizes', type=int, nargs='+', default=[10_000, 100_000], help='Media items in the libraries of the inventory benchmark.')
+    parser.add_argument('--accounts', type=int, default=4, help='Accounts (each with its own fake API) in the multi-account benchmark.')
+    parser.add_argument('--account-albums', type=int, default=500, help='Albums per account in the multi-account benchmark.')
+    parser.add_argument('--account-rate', type=float, default=5.0, help='Requests per second each account may make in the multi-account benchmark.')
+    parser.add_argument('--only', choices=('marking', 'clusters', 'memory', 'inventory', 'api', 'accounts', 'stages', 'startup'), help='Run only one of the benchmarks.')
+    args = parser.parse_args()
+    if args.check_baselines and args.only in (None, 'stages') and not os.path.exists(args.baselines_file):
+        # Baselines depend on the computer, so none come with the repository: fail now rather than after the stages have run
+        print(f"There are no baselines in {args.baselines_file} to check against.  Run the stage benchmark with --save-baselines "
+              f"(python GooglePhotosAlbumCleanupBenchmark.py --only stages --save-baselines) before the change to make them.")
+        return 2
+    # The rule engine logs a line per rule, which would drown out the table
+    logging.disable(logging.INFO)
+    succeeded = True
+    if args.only in (None, 'marking'):
+        benchmark_marking(args.sizes, args.legacy_max_rows)
+        print()
+    if args.only in (None, 'clusters'):
+        benchmark_title_clusters(args.cluster_sizes)
+        print()
+    if args.only in (None, 'memory'):
+        succeeded = benchmark_memory(args.memory_sizes) and succeeded
+        print()
+    if args.only in (None, 'inventory'):
+        succeeded = benchmark_inventory(args.inventory_sizes) and succeeded
+        print()
+    if args.only in (None, 'api'):
+        benchmark_api_startup(args.api_latency, args.api_runs)
+        print()
+    if args.only in (None, 'accounts'):
+        succeeded = benchmark_accounts(args.accounts, args.account_albums, args.api_latency, args.account_rate) and succeeded
+        print()
+    if args.only in (None, 'stages'):
+        limits = {'list': args.list_max_rows, 'xlsx': args.xlsx_max_rows, 'delete': args.delete_max_rows}
+        results = benchmark_stages(args.stage_sizes, limits, measure_memory=not args.no_memory)
+        if args.check_baselines:
+            succeeded = check_baselines(results, args.baselines_file, args.tolerance) and succeeded
+        if args.save_baselines:
+            save_baselines(results, args.baselines_file)
+        print()
+    if args.only in (None, 'startup'):
+        succeeded = benchmark_startup(args.import_budget_ms, args.api_runs, args.menu_budget_ms) and succeeded
+    return 0 if succeeded else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,549 @@
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import RunMetrics
+# The Google client libraries take a good part of a second to import, so they are imported by the functions
+# that use them; commands that never talk to the API don't pay for them.
+
+# Where the API's discovery document comes from, and how long a downloaded copy is used before downloading it again
+DISCOVERY_URL = 'https://photoslibrary.googleapis.com/$discovery/rest?version=v1'
+DEFAULT_DISCOVERY_CACHE_FILE = 'photoslibrary_v1_discovery.json'
+DEFAULT_DISCOVERY_CACHE_TTL = 24 * 60 * 60
+# HTTP status codes that mean "slow down and try again" rather than a real failure
+RETRYABLE_HTTP_STATUSES = {429, 500, 502, 503, 504}
+# Seconds to wait for the page fetching thread once the caller has stopped reading pages
+PAGE_FETCHER_JOIN_TIMEOUT = 1.0
+# HTTP status codes albums().patch answers with for albums the app isn't allowed to change (ones it didn't create)
+NOT_MODIFIABLE_HTTP_STATUSES = {400, 403}
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket rate limiter for the Google Photos API.  The rate creeps up while requests succeed
+    and is cut back, with an exponential backoff pause, whenever the API throttles us (429/5xx).
+
+    :param initial_rate: Requests per second to start at.
+    :param min_rate: The rate will never be cut below this.
+    :param max_rate: The rate will never grow above this.
+    :param increase_step: Requests per second added after each successful request.
+    :param backoff_factor: Divisor applied to the rate after a throttling error.
+    :param base_backoff: Seconds to pause after the first throttling error; doubles for each one in a row.
+    :param max_backoff: Upper bound for the backoff pause in seconds.
+    :param clock: Function returning the current time in seconds (replaceable for testing).
+    :param sleep: Function used to wait (replaceable for testing).
+    """
+
+    def __init__(self, initial_rate=1.0, min_rate=0.2, max_rate=10.0, increase_step=0.5, backoff_factor=2.0,
+                 base_backoff=1.0, max_backoff=64.0, clock=time.monotonic, sleep=time.sleep):
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, initial_rate)
+        self.increase_step = increase_step
+        self.backoff_factor = backoff_factor
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = 1.0
+        self.consecutive_throttles = 0
+        self.last_refill = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request is allowed under the current rate."""
+        with self.lock:
+            now = self.clock()
+            # Refill the bucket; capacity is one second's worth of requests
+            self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            wait = 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+            self.tokens -= 1.0
+        if wait > 0:
+            self.sleep(wait)
+
+    def record_success(self):
+        """Speeds up a little after a request that went through fine."""
+        with self.lock:
+            self.consecutive_throttles = 0
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def record_throttle(self, sleep=None):
+        """
+        Slows down after a 429/5xx response and pauses for an exponentially growing backoff.
+
+        :param sleep: Function to pause with instead of the limiter's own, e.g. the wait of a threading.Event so the
+                      pause can be cut short.
+        :return: The number of seconds the pause was meant to last.
+        """
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / self.backoff_factor)
+            delay = min(self.max_backoff, self.base_backoff * (2 ** self.consecutive_throttles))
+            # Add some jitter so parallel clients don't retry in lock step
+            delay = delay * (0.5 + random.random() / 2)
+            self.consecutive_throttles += 1
+            # Empty the bucket so the next request waits for the new, slower rate
+            self.tokens = 0.0
+            self.last_refill = self.clock()
+        (sleep or self.sleep)(delay)
+        return delay
+
+
+def execute_with_backoff(request, rate_limiter, max_retries=5, stop=None):
+    """
+    Executes a Google API request under the rate limiter, retrying throttling errors with backoff.
+
+    :param request: A googleapiclient request object (anything with an execute() method).
+    :param rate_limiter: The AdaptiveRateLimiter shared by all requests to the API.
+    :param max_retries: How many times to retry a 429/5xx response before giving up.
+    :param stop: A threading.Event that, once set, ends a backoff pause straight away and gives up the request
+                 with its last error instead of retrying it.
+    :return: The decoded response.
+    """
+    from googleapiclient.errors import HttpError
+    # e.g. photoslibrary.albums.list
+    method = getattr(request, 'methodId', None) or 'unknown'
+    attempt = 0
+    while True:
+        rate_limiter.acquire()
+        start = time.monotonic()
+        try:
+            response = request.execute()
+        except HttpError as e:
+            RunMetrics.metrics.observe('api_request_seconds', time.monotonic() - start, method=method)
+            RunMetrics.metrics.increment('api_requests_total', method=method, status=e.resp.status)
+            if e.resp.status not in RETRYABLE_HTTP_STATUSES or attempt >= max_retries:
+                raise
+            attempt += 1
+            delay = rate_limiter.record_throttle(sleep=stop.wait if stop is not None else None)
+            RunMetrics.metrics.increment('api_throttled_total', method=method)
+            if stop is not None and stop.is_set():
+                # Whoever wanted the response has stopped waiting for it
+                raise
+            logging.warning(f"API returned {e.resp.status}, backing off {delay:.1f}s (retry {attempt} of {max_retries})")
+            continue
+        RunMetrics.metrics.observe('api_request_seconds', time.monotonic() - start, method=method)
+        RunMetrics.metrics.increment('api_requests_total', method=method, status=200)
+        rate_limiter.record_success()
+        return response
+
+
+def fetch_album_pages(service, rate_limiter, page_size=50, max_retries=5, prefetch_pages=2, page_token=None):
+    """
+    Yields pages of the albums().list response.  A background thread fetches the following pages
+    while the caller is still working on the current one, so parsing and network time overlap.  If a page
+    can't be fetched, the error is raised to the caller after the pages before it, so a listing that failed
+    is never mistaken for one that finished.
+
+    :param service: The Google Photos API service (or anything with the same albums().list interface).
+    :param rate_limiter: The AdaptiveRateLimiter to pace the requests with.
+    :param page_size: Albums per page (the API allows up to 50).
+    :param max_retries: Retries per page for throttling errors.
+    :param prefetch_pages: How many pages may be fetched ahead of the caller.
+    :param page_token: Page to start from, e.g. a checkpoint saved by an interrupted sync.
+    :return: A generator of response dictionaries.
+    """
+    request = lambda page_token: service.albums().list(pageSize=page_size, pageToken=page_token, excludeNonAppCreatedData=False)
+    return _prefetch_pages(request, 'albums', rate_limiter, max_retries, prefetch_pages, page_token)
+
+
+def fetch_media_item_pages(service, rate_limiter, page_size=100, max_retries=5, prefetch_pages=2, page_token=None):
+    """
+    Yields pages of the mediaItems().list response: every photo and video in the library, whether it is in an
+    album or not.  Pages are fetched ahead in the background like fetch_album_pages.
+
+    :param page_size: Media items per page (the API allows up to 100).
+    :param page_token: Page to start from, e.g. a checkpoint saved by an interrupted inventory.
+    See fetch_album_pages for the other parameters.
+    :return: A generator of response dictionaries (with 'mediaItems' and 'nextPageToken').
+    """
+    request = lambda page_token: service.mediaItems().list(pageSize=page_size, pageToken=page_token)
+    return _prefetch_pages(request, 'media items', rate_limiter, max_retries, prefetch_pages, page_token)
+
+
+class _PageError:
+    # An exception from the page fetching thread, on its way to the caller
+    def __init__(self, error):
+        self.error = error
+
+
+def _prefetch_pages(request, what, rate_limiter, max_retries, prefetch_pages, page_token):
+    # request(page_token) makes the request for one page; the pages are fetched by a background thread
+    pages = queue.Queue(maxsize=prefetch_pages)
+    stop = threading.Event()
+    end_of_pages = object()
+
+    def put(item):
+        # Don't block forever if the caller has stopped reading
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def producer(page_token):
+        try:
+            while not stop.is_set():
+                results = execute_with_backoff(request(page_token), rate_limiter, max_retries, stop=stop)
+                put(results)
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+        except Exception as e:
+            if stop.is_set():
+                # The caller stopped reading (e.g. a limited sync or Ctrl-C), so nobody is waiting for this page
+                return
+            logging.error(f"Error listing {what}: {e}")
+            # Handed to the caller, which raises it in its own thread
+            put(_PageError(e))
+        finally:
+            put(end_of_pages)
+
+    thread = threading.Thread(target=producer, args=(page_token,), name=f"{what.replace(' ', '-')}-page-fetcher", daemon=True)
+    thread.start()
+    try:
+        while True:
+            results = pages.get()
+            if results is end_of_pages:
+                break
+            if isinstance(results, _PageError):
+                raise results.error
+            yield results
+    finally:
+        # A backoff pause ends as soon as stop is set, but a request that's already been sent is left to finish
+        # on its own (the thread is a daemon), so a caller that stops early is never held up by the network
+        stop.set()
+        thread.join(timeout=PAGE_FETCHER_JOIN_TIMEOUT)
+
+
+def fetch_album_media_ids(service, album_id, rate_limiter, max_retries=5, page_size=100):
+    """
+    Lists the IDs of every photo and video in an album with mediaItems().search.
+
+    :param service: The Google Photos API service.
+    :param album_id: The album's ID.
+    :param rate_limiter: The AdaptiveRateLimiter to pace the requests with.
+    :param max_retries: Retries per page for throttling errors.
+    :param page_size: Media items per page (the API allows up to 100).
+    :return: List of media item IDs.
+    """
+    media_ids = []
+    page_token = None
+    while True:
+        body = {'albumId': album_id, 'pageSize': page_size}
+        if page_token:
+            body['pageToken'] = page_token
+        results = execute_with_backoff(service.mediaItems().search(body=body), rate_limiter, max_retries)
+        media_ids.extend(item['id'] for item in results.get('mediaItems', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return media_ids
+
+
+def map_with_thread_services(service_factory, function, items, workers=8):
+    """
+    Runs function(service, item) for every item on a bounded pool of threads.  Each thread asks the factory for
+    a service once and keeps it for all the items it works on.  A PhotosServiceFactory gives every thread the same
+    service over its thread-safe connection pool; a factory of plain httplib2 services must build one per call,
+    as an httplib2 connection can't be shared between threads.
+
+    :param service_factory: Function returning a Google Photos API service (see above).
+    :param function: Function taking (service, item).
+    :param items: Iterable of items to work on.  Only a few more than workers are taken from it at a time, so
+                  neither the items waiting their turn nor the finished results pile up in memory.
+    :param workers: Number of items worked on at the same time.
+    :return: A generator of (item, result, exception, seconds) as each item finishes; exception is None on success.
+    """
+    thread_state = threading.local()
+
+    def run(item):
+        start = time.monotonic()
+        try:
+            if not hasattr(thread_state, 'service'):
+                thread_state.service = service_factory()
+            return function(thread_state.service, item), None, time.monotonic() - start
+        except Exception as e:
+            return None, e, time.monotonic() - start
+
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='photos-api-worker') as pool:
+        futures = {pool.submit(run, item): item for item in itertools.islice(items, 2 * max(1, workers))}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = futures.pop(future)
+                # Keep the pool busy with the next item before handing over this one's result
+                for next_item in itertools.islice(items, 1):
+                    futures[pool.submit(run, next_item)] = next_item
+                yield (item, *future.result())
+
+
+def fetch_album_memberships(service_factory, album_ids, rate_limiter, workers=8, max_retries=5):
+    """
+    Fetches the media item IDs of many albums with a bounded pool of threads.  All threads share the rate
+    limiter, so more workers hide network latency without going over the API's rate.
+
+    :param service_factory: Function returning a Google Photos API service (see map_with_thread_services).
+    :param album_ids: IDs of the albums to fetch.
+    :param rate_limiter: The AdaptiveRateLimiter shared by all threads.
+    :param workers: Number of albums fetched at the same time.
+    :param max_retries: Retries per page for throttling errors.
+    :return: Dictionary of album ID to list of media item IDs.  Albums that couldn't be fetched are left out.
+    """
+    return dict(iter_album_memberships(service_factory, album_ids, rate_limiter, workers, max_retries))
+
+
+def iter_album_memberships(service_factory, album_ids, rate_limiter, workers=8, max_retries=5):
+    """
+    Fetches the media item IDs of many albums like fetch_album_memberships, handing each album over as soon as it
+    is done instead of keeping them all, so the caller can store them as they come.
+
+    :return: A generator of (album ID, list of media item IDs).  Albums that couldn't be fetched are logged and left out.
+    """
+    album_ids = list(album_ids)
+    fetch = lambda service, album_id: fetch_album_media_ids(service, album_id, rate_limiter, max_retries)
+    for done, (album_id, media_ids, error, seconds) in enumerate(map_with_thread_services(service_factory, fetch, album_ids, workers), 1):
+        if error is not None:
+            logging.error(f"Error listing the photos of album {album_id}: {error}")
+        else:
+            yield album_id, media_ids
+        if done % 100 == 0:
+            logging.info(f"Listed the photos of {done} of {len(album_ids)} albums")
+
+
+def rename_album(service, album_id, new_title, rate_limiter, max_retries=5):
+    """
+    Renames an album with albums().patch.  Google only lets an app change albums the app created itself.
+
+    :return: The updated album dictionary.
+    """
+    request = service.albums().patch(id=album_id, updateMask='title', body={'title': new_title})
+    return execute_with_backoff(request, rate_limiter, max_retries)
+
+
+def is_not_modifiable_error(error):
+    """:return: True if error is the API refusing to change an album the app didn't create."""
+    from googleapiclient.errors import HttpError
+    return isinstance(error, HttpError) and error.resp.status in NOT_MODIFIABLE_HTTP_STATUSES
+
+
+def rename_albums(service_factory, renames, rate_limiter, workers=4, max_retries=5):
+    """
+    Renames many albums through the API with a bounded pool of threads sharing the rate limiter.
+
+    :param service_factory: Function returning a Google Photos API service (see map_with_thread_services).
+    :param renames: Iterable of (album ID, new title) pairs.
+    :param rate_limiter: The AdaptiveRateLimiter shared by all threads.
+    :param workers: Number of albums renamed at the same time.
+    :param max_retries: Retries per album for throttling errors.
+    :return: A generator of ((album ID, new title), exception, seconds) as each album finishes; exception is None
+             on success, and an HttpError with a status in NOT_MODIFIABLE_HTTP_STATUSES if the app can't rename it.
+    """
+    rename = lambda service, job: rename_album(service, job[0], job[1], rate_limiter, max_retries)
+    for job, _, error, seconds in map_with_thread_services(service_factory, rename, renames, workers):
+        yield job, error, seconds
+
+
+def load_credentials(scope, credentials_file, token_file):
+    """
+    Authorizes with Google, using the saved token when possible and refreshing it if it has expired.
+
+    :param scope: The OAuth scope to request.
+    :param credentials_file: The client_secret JSON file from the Google Cloud console.
+    :param token_file: Where the user's access and refresh tokens are kept between runs.
+    :return: Valid google.oauth2 credentials.
+    """
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
+    # Define the scope for the access request
+    SCOPES = [scope]
+
+    creds = None
+    # The file token.json stores the user's access and refresh tokens, and is
+    # created automatically when the authorization flow completes for the first time.
+    if os.path.exists(token_file):
+        try:
+            creds = Credentials.from_authorized_user_file(token_file, SCOPES)
+        except Exception as e:
+            logging.error(f"Error using token file to authorize: {e}")
+
+    # If there are no (valid) credentials available, let the user log in.
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(credentials_file, SCOPES)
+            creds = flow.run_local_server(port=0)
+        # Save the credentials for the next run
+        with open(token_file, 'w') as token:
+            token.write(creds.to_json())
+    return creds
+
+
+class SessionHttp:
+    """
+    Lets googleapiclient send its requests through a requests session (and so its connection pool) instead of
+    httplib2, which keeps one connection per object and can't be shared between threads.
+
+    :param session: A requests.Session, usually a google.auth AuthorizedSession.
+    :param timeout: Seconds to wait for the API before giving up on a request.
+    """
+
+    def __init__(self, session, timeout=60.0):
+        self.session = session
+        self.timeout = timeout
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        # Same signature and return value as httplib2.Http.request
+        import httplib2
+        response = self.session.request(method, uri, data=body, headers=headers, timeout=self.timeout, allow_redirects=redirections > 0)
+        info = {key: value for key, value in response.headers.items() if key.lower() != 'content-encoding'}
+        info['status'] = response.status_code
+        resp = httplib2.Response(info)
+        resp.reason = response.reason
+        return resp, response.content
+
+    def close(self):
+        # The session is shared, so it is closed by its owner
+        pass
+
+
+class PhotosServiceFactory:
+    """
+    Hands out the Google Photos API service.  Everything it needs is set up once per process and only when it's
+    first used: the credentials are checked (and refreshed) once, the discovery document is read from a cache file
+    while it is younger than the TTL instead of being downloaded every time, and every service shares one
+    thread-safe pool of keep-alive connections.  Calling the factory returns the shared service.
+
+    :param scope: The OAuth scope to request.
+    :param credentials_file: The client_secret JSON file from the Google Cloud console.
+    :param token_file: Where the user's access and refresh tokens are kept between runs.
+    :param discovery_cache_file: Where the discovery document is cached; empty to download it every time.
+    :param discovery_cache_ttl: Seconds the cached discovery document is used for.
+    :param discovery_url: Where the discovery document is downloaded from.
+    :param max_connections: Most connections kept open to the API at once; should be at least the number of workers.
+    :param credentials: Credentials to use instead of the token file (e.g. for a local test server).
+    :param clock: Function returning the current time in seconds, used for the startup timings.
+    """
+
+    def __init__(self, scope, credentials_file, token_file, discovery_cache_file=DEFAULT_DISCOVERY_CACHE_FILE, discovery_cache_ttl=DEFAULT_DISCOVERY_CACHE_TTL,
+                 discovery_url=DISCOVERY_URL, max_connections=10, credentials=None, clock=time.perf_counter):
+        self.scope = scope
+        self.credentials_file = credentials_file
+        self.token_file = token_file
+        self.discovery_cache_file = discovery_cache_file
+        self.discovery_cache_ttl = discovery_cache_ttl
+        self.discovery_url = discovery_url
+        self.max_connections = max_connections
+        self.credentials = credentials
+        self.clock = clock
+        self.session = None
+        self.service = None
+        # Seconds spent on each startup step, and where the discovery document came from
+        self.timings = {}
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            if self.service is None:
+                self.service = self._build_service()
+            return self.service
+
+    def _build_service(self):
+        from requests.adapters import HTTPAdapter
+        from googleapiclient.discovery import build_from_document
+        from google.auth.transport.requests import AuthorizedSession
+        start = self.clock()
+        if self.credentials is None:
+            self.credentials = load_credentials(self.scope, self.credentials_file, self.token_file)
+        self.timings['credentials'] = self.clock() - start
+        # AuthorizedSession refreshes the token by itself when it expires during a long run
+        self.session = AuthorizedSession(self.credentials)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(1, self.max_connections))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        step = self.clock()
+        document = self.discovery_document()
+        self.timings['discovery'] = self.clock() - step
+        step = self.clock()
+        service = build_from_document(document, http=SessionHttp(self.session))
+        self.timings['build'] = self.clock() - step
+        self.timings['total'] = self.clock() - start
+        logging.info(f"Google Photos API ready in {self.timings['total']:.2f}s (credentials {self.timings['credentials']:.2f}s, "
+                     f"discovery document from {self.timings['discovery_source']} {self.timings['discovery']:.2f}s, build {self.timings['build']:.2f}s)")
+        return service
+
+    def discovery_document(self):
+        """
+        :return: The discovery document as a string, from the cache file if it is recent enough and came from the same
+                 URL, otherwise downloaded (and cached).  If the download fails, an expired cache is better than nothing.
+        """
+        cached = None
+        if self.discovery_cache_file and os.path.exists(self.discovery_cache_file):
+            try:
+                with open(self.discovery_cache_file, encoding='utf-8') as cache:
+                    entry = json.load(cache)
+                if entry.get('discovery_url') == self.discovery_url:
+                    cached = entry.get('document')
+            except (OSError, ValueError) as e:
+                logging.error(f"Error reading discovery cache {self.discovery_cache_file}: {e}")
+            if cached and time.time() - os.path.getmtime(self.discovery_cache_file) < self.discovery_cache_ttl:
+                self.timings['discovery_source'] = 'cache'
+                return cached
+        try:
+            response = self.session.get(self.discovery_url, timeout=60)
+            response.raise_for_status()
+            document = response.text
+        except Exception as e:
+            if not cached:
+                raise
+            logging.warning(f"Couldn't download the discovery document ({e}), using the expired cache")
+            self.timings['discovery_source'] = 'expired cache'
+            return cached
+        self.timings['discovery_source'] = 'network'
+        if self.discovery_cache_file:
+            # Write and rename, so a crash never leaves half a document behind
+            temporary_path = self.discovery_cache_file + '.tmp'
+            with open(temporary_path, 'w', encoding='utf-8') as cache:
+                json.dump({'discovery_url': self.discovery_url, 'document': document}, cache)
+            os.replace(temporary_path, self.discovery_cache_file)
+        return document
+
+
+# One factory per set of credentials, so everything in the process shares the same session
+_service_factories = {}
+_service_factories_lock = threading.Lock()
+
+
+def get_service_factory(scope, credentials_file, token_file, **options):
+    """
+    Returns the process-wide PhotosServiceFactory for these credentials, creating it on first use.
+
+    :param options: PhotosServiceFactory settings; only used when the factory is created.
+    """
+    with _service_factories_lock:
+        key = (scope, credentials_file, token_file)
+        if key not in _service_factories:
+            _service_factories[key] = PhotosServiceFactory(scope, credentials_file, token_file, **options)
+        return _service_factories[key]
+
+
+def get_photos_service(scope, credentials_file, token_file):
+    """
+    Authorizes with Google (using the saved token when possible) and returns the Google Photos API service.
+    The service, its session and the discovery document are shared by every caller in the process.
+
+    :param scope: The OAuth scope to request.
+    :param credentials_file: The client_secret JSON file from the Google Cloud console.
+    :param token_file: Where the user's access and refresh tokens are kept between runs.
+    :return: The Google Photos API service.
+    """
+    return get_service_factory(scope, credentials_file, token_file)()
@@ -0,0 +1,188 @@
+import time
+import asyncio
+import logging
+import ActionJournal
+import RunMetrics
+
+# Where the albums are deleted from when the list is run from the menu
+GOOGLE_PHOTOS_URL = 'https://photos.google.com'
+# How the album page's buttons are found.  These are Playwright selectors and can be overridden in the
+# [HeadlessBrowser] section of the config file if Google changes the page.
+DEFAULT_SELECTORS = {
+    'menu_button_selector': 'button[aria-label="More options"]',
+    'delete_menu_item_selector': '[role="menuitem"]:has-text("Delete album")',
+    'confirm_button_selector': '[role="dialog"] button:has-text("Delete")',
+}
+
+
+def _import_playwright():
+    # Playwright is only needed for the headless browser, so it is imported when that is used
+    try:
+        from playwright.async_api import async_playwright
+    except ImportError:
+        logging.error("The headless browser needs Playwright: run 'pip install playwright' and then 'playwright install chromium'")
+        return None
+    return async_playwright
+
+
+def albums_to_delete(album_list, max_albums_to_delete):
+    """
+    Picks the albums that are flagged for deletion and haven't been deleted yet, up to the limit.
+
+    :return: List of (index, album ID, title, URL) tuples.
+    """
+    import AlbumSchema
+    jobs = []
+    # Only the flagged albums are looked at one by one
+    flags, _ = AlbumSchema.delete_flags(album_list['Delete Flag'])
+    flagged = album_list[flags]
+    for index, album_id, actions, title, url in zip(flagged.index, flagged['Album ID'], flagged['Actions'], flagged['Album Title'], flagged['Album URL']):
+        if 'Deleted' in str(actions):
+            continue
+        if len(jobs) >= max_albums_to_delete:
+            logging.info(f"Reached maximum number of albums to delete ({max_albums_to_delete}).")
+            break
+        jobs.append((index, album_id, title, url))
+    return jobs
+
+
+async def delete_album_on_page(page, url, selectors, timeout):
+    """
+    Deletes one album on a browser page: opens it, opens the menu, picks "Delete album" and confirms.
+
+    :param page: A Playwright page.
+    :param url: The album's URL.
+    :param selectors: Dictionary like DEFAULT_SELECTORS.
+    :param timeout: Seconds to wait for each step.
+    """
+    timeout_ms = timeout * 1000
+    await page.goto(url, wait_until='domcontentloaded', timeout=timeout_ms)
+    await page.click(selectors['menu_button_selector'], timeout=timeout_ms)
+    await page.click(selectors['delete_menu_item_selector'], timeout=timeout_ms)
+    await page.click(selectors['confirm_button_selector'], timeout=timeout_ms)
+    # The confirmation dialog goes away once the album has been deleted
+    await page.wait_for_selector(selectors['confirm_button_selector'], state='detached', timeout=timeout_ms)
+
+
+async def _delete_worker(context, jobs, results, selectors, timeout, journal):
+    # Each worker has its own page (tab) in the shared, logged in browser profile
+    page = await context.new_page()
+    try:
+        while True:
+            try:
+                index, album_id, title, url = jobs.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            logging.info(f"Deleting album: {title} at {url} ({RunMetrics.metrics.progress_text('delete')})")
+            if journal is not None:
+                journal.record(album_id, ActionJournal.STARTED, title=title)
+            start = time.monotonic()
+            try:
+                await delete_album_on_page(page, url, selectors, timeout)
+                results[index] = f"Deleted on {time.strftime('%Y-%m-%d %H:%M:%S')} (headless browser, {time.monotonic() - start:.1f}s)"
+                status = ActionJournal.DELETED
+            except Exception as e:
+                # Only the first line; Playwright errors include a long call log
+                reason = str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__
+                logging.error(f"Error deleting album {title}: {reason}")
+                results[index] = f"Delete failed on {time.strftime('%Y-%m-%d %H:%M:%S')}: {reason}"
+                status = ActionJournal.FAILED
+            if journal is not None:
+                journal.record(album_id, status, results[index], title=title, seconds=round(time.monotonic() - start, 3))
+            RunMetrics.metrics.observe('album_seconds', time.monotonic() - start, action='delete', method='headless')
+            if status == ActionJournal.DELETED:
+                RunMetrics.metrics.increment('albums_deleted_total', method='headless')
+            else:
+                RunMetrics.metrics.increment('album_failures_total', action='delete', method='headless')
+            RunMetrics.metrics.advance('delete')
+    finally:
+        await page.close()
+
+
+async def run_delete_jobs(context, jobs, workers, selectors, timeout, journal=None):
+    """
+    Runs the delete jobs on a browser context with a number of pages working in parallel.
+
+    :param context: A Playwright browser context (anything with an async new_page()).
+    :param jobs: List from albums_to_delete.
+    :param workers: Number of pages working at the same time.
+    :param journal: ActionJournal to record every album in as it is done, or None.
+    :return: Dictionary of album list index to the action to record.
+    """
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    results = {}
+    await asyncio.gather(*(_delete_worker(context, queue, results, selectors, timeout, journal) for _ in range(max(1, min(workers, len(jobs))))))
+    return results
+
+
+async def _delete_albums_async(jobs, profile_dir, workers, headless, selectors, timeout, channel, journal):
+    async_playwright = _import_playwright()
+    if async_playwright is None:
+        return {}
+    async with async_playwright() as playwright:
+        # A persistent context keeps the Google login from log_in() between runs
+        context = await playwright.chromium.launch_persistent_context(profile_dir, headless=headless, channel=channel or None)
+        try:
+            return await run_delete_jobs(context, jobs, workers, selectors, timeout, journal)
+        finally:
+            await context.close()
+
+
+def delete_albums_headless(album_list, max_albums_to_delete, profile_dir, workers=4, headless=True, selectors=None, timeout=30.0, channel=None, journal=None):
+    """
+    Deletes the albums flagged for deletion with a headless browser, several at a time, without touching the
+    mouse or keyboard.  The browser profile has to be logged in to Google first (see log_in).
+
+    :param album_list: DataFrame with the script's short headers.
+    :param max_albums_to_delete: Upper limit for this run.
+    :param profile_dir: Folder of the browser profile that is logged in to Google Photos.
+    :param workers: Number of albums deleted at the same time.
+    :param headless: Run the browser without a window.
+    :param selectors: Dictionary like DEFAULT_SELECTORS; missing entries use the defaults.
+    :param timeout: Seconds to wait for each step of a deletion.
+    :param channel: Browser to use instead of Playwright's Chromium, e.g. 'chrome'.
+    :param journal: ActionJournal to record every album in as it is done, or None.
+    :return: The album list with the outcome of each album in its Actions column.
+    """
+    selectors = {**DEFAULT_SELECTORS, **(selectors or {})}
+    jobs = albums_to_delete(album_list, max_albums_to_delete)
+    if not jobs:
+        logging.info('No albums to delete.')
+        return album_list
+    logging.info(f"Deleting {len(jobs)} albums with {workers} headless browser pages")
+    RunMetrics.metrics.start_progress('delete', len(jobs))
+    start = time.monotonic()
+    results = asyncio.run(_delete_albums_async(jobs, profile_dir, workers, headless, selectors, timeout, channel, journal))
+    import AlbumSchema
+    AlbumSchema.set_values(album_list, list(results), 'Actions', list(results.values()))
+    deleted = sum(1 for action in results.values() if action.startswith('Deleted'))
+    logging.info(f"Deleted {deleted} of {len(jobs)} albums in {time.monotonic() - start:.1f}s")
+    return album_list
+
+
+async def _log_in_async(profile_dir, start_url, channel):
+    async_playwright = _import_playwright()
+    if async_playwright is None:
+        return False
+    async with async_playwright() as playwright:
+        context = await playwright.chromium.launch_persistent_context(profile_dir, headless=False, channel=channel or None)
+        try:
+            page = await context.new_page()
+            await page.goto(start_url)
+            # input() blocks, so run it off the event loop while the browser stays responsive
+            await asyncio.get_running_loop().run_in_executor(None, input, '\nLog in to Google Photos in the browser window that just opened, then press <enter> here.\n')
+        finally:
+            await context.close()
+    return True
+
+
+def log_in(profile_dir, start_url=GOOGLE_PHOTOS_URL, channel=None):
+    """
+    Opens a visible browser with the headless browser's profile so you can log in to Google once.
+    The login is kept in profile_dir for later headless runs.
+
+    :return: True if the browser could be started.
+    """
+    return asyncio.run(_log_in_async(profile_dir, start_url, channel))
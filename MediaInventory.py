@@ -0,0 +1,213 @@
+import sqlite3
+import datetime
+import logging
+import pandas as pd
+import AlbumSnapshotStore
+import GooglePhotosApi
+import RunMetrics
+
+# Columns the inventory adds to the album list
+UNIQUE_PHOTOS_COLUMN = 'Unique Photos'
+SHARED_PHOTOS_COLUMN = 'Shared Photos'
+SHARING_ALBUMS_COLUMN = 'Sharing Albums'
+INVENTORY_COLUMNS = (UNIQUE_PHOTOS_COLUMN, SHARED_PHOTOS_COLUMN, SHARING_ALBUMS_COLUMN)
+
+# Everything in the library (mediaItems().list), which albums each photo is in (mediaItems().search by album),
+# and the albums whose photos have been listed, so an interrupted inventory can carry on where it stopped.
+# album_media is the index from photo to albums; it is kept on disk so memory doesn't grow with the library.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media_items (
+    media_id      TEXT PRIMARY KEY,
+    filename      TEXT,
+    mime_type     TEXT,
+    creation_time TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS album_media (
+    album_id TEXT,
+    media_id TEXT,
+    PRIMARY KEY (album_id, media_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS album_media_by_media ON album_media (media_id, album_id);
+CREATE TABLE IF NOT EXISTS albums_done (
+    album_id    TEXT PRIMARY KEY,
+    media_count INTEGER
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def open_inventory(db_file):
+    """
+    Opens (and creates if needed) the media inventory database.
+
+    :param db_file: Path to the SQLite file.
+    :return: An open sqlite3 connection.
+    """
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def reset_inventory(conn):
+    """Forgets everything in the inventory, to take a new one."""
+    with conn:
+        for table in ('media_items', 'album_media', 'albums_done', 'meta'):
+            conn.execute(f"DELETE FROM {table}")
+
+
+def start_inventory(conn, restart=False):
+    """
+    Starts a new inventory, unless the last one didn't finish, which is then carried on with.
+
+    :param restart: Start a new inventory even if the last one didn't finish.
+    :return: True if an unfinished inventory is carried on with.
+    """
+    started = AlbumSnapshotStore.get_meta(conn, 'inventory_started')
+    if started and not AlbumSnapshotStore.get_meta(conn, 'inventory_finished') and not restart:
+        logging.info(f"Carrying on with the media inventory started at {started}")
+        return True
+    reset_inventory(conn)
+    AlbumSnapshotStore.set_meta(conn, 'inventory_started', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    return False
+
+
+def store_media_pages(conn, pages):
+    """
+    Writes pages of the mediaItems().list response to the inventory.  Each page is committed together with the
+    token of the next page, so an interrupted listing is carried on from the page after the last one stored, and
+    only one page is ever held in memory.
+
+    :param pages: Iterable of mediaItems().list responses.
+    :return: A dictionary with the number of media items stored and whether the listing finished.
+    """
+    summary = {'items': 0, 'finished': False}
+    for results in pages:
+        items = results.get('mediaItems', [])
+        rows = [(item['id'], item.get('filename'), item.get('mimeType'), item.get('mediaMetadata', {}).get('creationTime')) for item in items]
+        next_page_token = results.get('nextPageToken')
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO media_items (media_id, filename, mime_type, creation_time) VALUES (?, ?, ?, ?)", rows)
+            if next_page_token:
+                conn.execute("INSERT INTO meta (key, value) VALUES ('media_page_token', ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value", (next_page_token,))
+            else:
+                conn.execute("DELETE FROM meta WHERE key = 'media_page_token'")
+                conn.execute("INSERT INTO meta (key, value) VALUES ('media_listed', '1') ON CONFLICT(key) DO UPDATE SET value = excluded.value")
+                summary['finished'] = True
+        summary['items'] += len(rows)
+        RunMetrics.metrics.increment('media_items_listed_total', len(rows))
+        if summary['items'] % 10_000 < len(rows):
+            logging.info(f"Listed {summary['items']} media items")
+    return summary
+
+
+def store_memberships(conn, memberships):
+    """
+    Writes which photos each album has to the inventory, one album per transaction as it comes in.
+
+    :param memberships: Iterable of (album ID, list of media item IDs), e.g. from GooglePhotosApi.iter_album_memberships.
+    :return: Number of albums stored.
+    """
+    stored = 0
+    for album_id, media_ids in memberships:
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO album_media (album_id, media_id) VALUES (?, ?)", ((album_id, media_id) for media_id in media_ids))
+            conn.execute("INSERT OR REPLACE INTO albums_done (album_id, media_count) VALUES (?, ?)", (album_id, len(media_ids)))
+        stored += 1
+    return stored
+
+
+def albums_left(conn, album_ids):
+    """:return: The album IDs whose photos haven't been stored in the inventory yet, in the order given."""
+    done = {row[0] for row in conn.execute("SELECT album_id FROM albums_done")}
+    return [album_id for album_id in album_ids if album_id not in done]
+
+
+def take_inventory(conn, service_factory, album_ids, rate_limiter, workers=8, max_retries=5, page_size=100, restart=False):
+    """
+    Lists every photo and video in the library, then the photos of every album, several albums at a time, into
+    the inventory.  Both are stored as they arrive, so memory stays flat however big the library is, and an
+    interrupted inventory is carried on from where it stopped the next time.
+
+    :param conn: Connection from open_inventory.
+    :param service_factory: Function returning a Google Photos API service (see GooglePhotosApi.map_with_thread_services).
+    :param album_ids: IDs of the albums to list the photos of.
+    :param rate_limiter: The AdaptiveRateLimiter shared by all requests.
+    :param workers: Number of albums listed at the same time.
+    :param max_retries: Retries per page for throttling errors.
+    :param page_size: Media items per page of the library listing (the API allows up to 100).
+    :param restart: Start over even if the last inventory didn't finish.
+    :return: True if the inventory is complete.
+    """
+    start_inventory(conn, restart)
+    if not AlbumSnapshotStore.get_meta(conn, 'media_listed'):
+        logging.info('Listing every photo and video in the library...If you have a lot, this may take a while.')
+        pages = GooglePhotosApi.fetch_media_item_pages(service_factory(), rate_limiter, page_size, max_retries, page_token=AlbumSnapshotStore.get_meta(conn, 'media_page_token'))
+        try:
+            finished = store_media_pages(conn, pages)['finished']
+        except Exception as e:
+            logging.error(f"The media item listing failed: {e}")
+            finished = False
+        if not finished:
+            logging.warning('The media item listing stopped before the last page. Run the inventory again to carry on from where it stopped.')
+            return False
+    left = albums_left(conn, album_ids)
+    logging.info(f"Listing the photos of {len(left)} albums with {workers} workers ({len(album_ids) - len(left)} already done)")
+    stored = store_memberships(conn, GooglePhotosApi.iter_album_memberships(service_factory, left, rate_limiter, workers, max_retries))
+    if stored < len(left):
+        logging.warning(f"The photos of {len(left) - stored} albums couldn't be listed. Run the inventory again to carry on with them.")
+        return False
+    AlbumSnapshotStore.set_meta(conn, 'inventory_finished', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    return True
+
+
+def album_photo_counts(conn):
+    """
+    Works out, for every album in the inventory, how many of its photos are in no other album, how many are also in
+    other albums and how many other albums those are in.  The counting is done by SQLite on the disk index.
+
+    :return: DataFrame indexed by album ID, with the INVENTORY_COLUMNS.
+    """
+    counts = pd.read_sql_query("""
+        WITH media_albums AS (SELECT media_id, COUNT(*) AS albums FROM album_media GROUP BY media_id)
+        SELECT d.album_id AS album_id, COALESCE(SUM(m.albums = 1), 0) AS unique_photos, COALESCE(SUM(m.albums > 1), 0) AS shared_photos
+        FROM albums_done d LEFT JOIN album_media a ON a.album_id = d.album_id LEFT JOIN media_albums m ON m.media_id = a.media_id
+        GROUP BY d.album_id""", conn, index_col='album_id')
+    # Only photos in more than one album can join an album to another
+    sharing = pd.read_sql_query("""
+        WITH shared AS (SELECT media_id FROM album_media GROUP BY media_id HAVING COUNT(*) > 1)
+        SELECT a.album_id AS album_id, COUNT(DISTINCT b.album_id) AS sharing_albums
+        FROM album_media a JOIN shared s ON s.media_id = a.media_id JOIN album_media b ON b.media_id = a.media_id AND b.album_id != a.album_id
+        GROUP BY a.album_id""", conn, index_col='album_id')
+    counts['sharing_albums'] = sharing['sharing_albums'].reindex(counts.index).fillna(0)
+    counts.columns = list(INVENTORY_COLUMNS)
+    return counts.astype('Int32')
+
+
+def library_summary(conn):
+    """:return: A dictionary with the number of media items in the library and how many of them are in no album."""
+    items = conn.execute("SELECT COUNT(*) FROM media_items").fetchone()[0]
+    in_no_album = conn.execute("SELECT COUNT(*) FROM media_items m WHERE NOT EXISTS (SELECT 1 FROM album_media a WHERE a.media_id = m.media_id)").fetchone()[0]
+    return {'items': items, 'in_no_album': in_no_album}
+
+
+def apply_inventory(album_list, counts):
+    """
+    Fills in the inventory columns of the album list.  Albums with no photos get 0; albums that weren't in the
+    inventory (e.g. already deleted) are left empty.
+
+    :param album_list: DataFrame with the script's short headers.
+    :param counts: DataFrame from album_photo_counts.
+    :return: The album list.
+    """
+    album_ids = album_list['Album ID'].astype(str)
+    empty = pd.to_numeric(album_list['Photo Count'], errors='coerce').eq(0).fillna(False).astype(bool)
+    for column in INVENTORY_COLUMNS:
+        album_list[column] = album_ids.map(counts[column]).astype('Int32').mask(empty, 0)
+    with_unique = album_list[UNIQUE_PHOTOS_COLUMN].fillna(0).gt(0)
+    logging.info(f"{int(with_unique.sum())} albums have photos that are in no other album ({int(album_list[UNIQUE_PHOTOS_COLUMN].fillna(0).sum())} photos); "
+                 f"{int(album_list[SHARED_PHOTOS_COLUMN].fillna(0).gt(0).sum())} albums share photos with other albums")
+    return album_list
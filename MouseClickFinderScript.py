@@ -1,135 +1,160 @@
 import time
-from pynput.mouse import Listener
+from pynput import mouse, keyboard
 import webbrowser
 import configparser
+import ScreenReadiness
+import MouseMacros
 
 # Define a constant for the config file name
 CONFIG_FILENAME = 'GooglePhotosAlbumCleanupConfig.ini'
+# Config section each recorded click's coordinates are saved in
+CLICK_SECTIONS = {
+    'three_dots': 'AlbumWindowMouseClicks',
+    'delete_button': 'AlbumDeleteMouseClicks',
+    'confirm_delete_button': 'AlbumDeleteMouseClicks',
+    'rename_button': 'AlbumRenameMouseClicks',
+    'rename_textbox': 'AlbumRenameMouseClicks',
+    'rename_save_button': 'AlbumRenameMouseClicks',
+}
 
-listening = False
-click_coordinates = []
+# The macro being recorded, while the clicks are being made
+recorder = None
+
+def capture_template(x, y):
+    # Take a small picture of the button while it is being pressed, before the page reacts to the click.
+    # The deleter waits for this picture to show up instead of sleeping a fixed time.
+    try:
+        return ScreenReadiness.PyAutoGuiScreenGrabber().grab(x, y)
+    except Exception as e:
+        print(f'Could not take a picture of the click location ({e}), the fixed wait times will be used for it.')
+        return None
+
+def active_window():
+    # Where the browser window is, on systems where pyautogui can tell (Windows); otherwise positions are kept
+    # relative to the whole display
+    try:
+        import pyautogui
+        window = pyautogui.getActiveWindow()
+        if window is not None and window.width > 0:
+            return window.left, window.top, window.width, window.height
+    except Exception:
+        pass
+    return None
+
+def screen_size():
+    try:
+        import pyautogui
+        return tuple(pyautogui.size())
+    except Exception:
+        return None
+
+def on_move(x, y):
+    if recorder is not None:
+        recorder.on_move(x, y)
 
 def on_click(x, y, button, pressed):
-    global listening
-    if listening and pressed:
-        print('Mouse clicked at ({0}, {1})'.format(x, y))
-        click_coordinates.append(('category','tag', x, y))
-        listening = False  # Turn off listening
-
-def prompt_to_memorize_coordinates(coordinate_category, coordinate_tag, prompt):
-    global listening
-    listening = True
+    if recorder is None or not pressed or recorder.done:
+        return
+    tag = recorder.on_click(x, y, capture_template(x, y), active_window())
+    print('Mouse clicked at ({0}, {1}), recorded as {2}'.format(x, y, tag))
+    if not recorder.done:
+        print(f'Now click {recorder.next_prompt()}.')
+
+def on_press(key):
+    if recorder is not None:
+        recorder.on_key()
+
+def record_macro(name, page_load_wait_time, mouse_click_wait_time):
+    """
+    Records the clicks of the macro name in one go, with their timing, so it can be played back the way it was done.
+
+    :return: The MacroRecorder with the recording, or None if cancelled.
+    """
+    global recorder
     while True:
-        print(
-"""\nPlease note the very next click will be the one recorded.
+        print('\nDo these clicks one after the other, at the speed that works for you:')
+        for number, step in enumerate(step for step in MouseMacros.MACRO_STEPS[name] if step['action'] == 'click'):
+            print(f'{number + 1}) Click {step["prompt"]}')
+        input(
+"""\nThe very next click after you press <enter> is the first one recorded.
 If you click somewhere else (say to select the browser window), you will have to start over.
-It's recommended to use alt-tab on windows or command-tab on mac to switch to the browser window.\n""")
-        print(prompt)
-        while listening:
+It's recommended to use alt-tab on windows or command-tab on mac to switch to the browser window.
+Press <enter> when ready.""")
+        recorder = MouseMacros.MacroRecorder(name, page_load_wait_time, mouse_click_wait_time, screen_size())
+        print(f'Recording. Click {recorder.next_prompt()}.')
+        while not recorder.done:
             time.sleep(0.1)  # Sleep for a short time to prevent high CPU usage
-        # Label the coordinates with the tag
-        click_coordinates[-1] = (coordinate_category, coordinate_tag, click_coordinates[-1][2], click_coordinates[-1][3])
-        print(f'Click recorded as {click_coordinates[-1]}')
-        response = input('\nWas that the click you wanted? ("y" for yes, "c" to cancel, and anything else for "no keep monitoring"):\n')
+        recording, recorder = recorder, None
+        steps = [step for step in recording.macro()['steps'] if step['action'] == 'click']
+        for step in steps:
+            rested = f", resting {step['hover']:.1f}s on it first" if step['hover'] else ''
+            print(f"{step['tag']}: clicked {step['delay']:.1f}s after the previous step{rested}")
+        response = input('\nWas that what you wanted? ("y" for yes, "c" to cancel, and anything else to record it again):\n')
         if response.lower() == 'y':
-            return True
-        elif response.lower() == 'c':
-            # Delete the last coordinates
-            click_coordinates.pop()
-            return False
-        else:
-            # Delete the last coordinates
-            click_coordinates.pop()
-            print('Ok, try again.')
-            listening = True
-
-def update_config_file(config_filename):
+            return recording
+        if response.lower() == 'c':
+            return None
+        print('Ok, try again.')
+
+def save_recording(recording, config_filename):
     config = configparser.ConfigParser()
     config.read(config_filename)
-    # Iterate over the click_coordinates list
-    for coordinate in click_coordinates:
-        # Extract the category, tag, and coordinates
-        category, tag, x, y = coordinate
-        # Update the coordinates in the config file
-        config.set(category, tag, f'{x}, {y}')
+    template_dir = config.get('AlbumDeleter', 'readiness_template_dir', fallback='readiness_templates')
+    macro_dir = config.get('AlbumWindowMouseClicks', 'macro_dir', fallback='mouse_macros')
+    templates = recording.templates()
+    for tag, click in zip(MouseMacros.click_tags(recording.name), recording.clicks):
+        # The coordinates are still saved, for when the macro file is removed
+        config.set(CLICK_SECTIONS[tag], tag, f'{click["x"]}, {click["y"]}')
+        # Save the picture of the button so the deleter can wait for it
+        if templates[tag] is not None:
+            ScreenReadiness.save_template(templates[tag], template_dir, tag)
     # Write the changes back to the file
     with open(config_filename, 'w') as configfile:
         config.write(configfile)
+    MouseMacros.save_macro(recording.macro(), macro_dir)
+    print(f'Saved the recording to {MouseMacros.macro_path(macro_dir, recording.name)}')
 
-def main():
-    global listening
-    listening = False
-    with Listener(on_click=on_click) as listener:
-        response = input(
-"""\nWould you like to record mouse clicks so you can use the album delete function?
+def record_action(name, action, config_filename):
+    response = input(
+f"""\nWould you like to record mouse clicks so you can use the album {action} function?
 ("y" for yes, and anything else to skip)\n""")
-        if response.lower() == 'y':
-            print(
+    if response.lower() != 'y':
+        print(f'Ok, we will skip saving the {action} coordinates.')
+        return
+    print(
 """\nI will perform the following steps:
 1) Open your system default web browser
-2) Open photos.google.com"""                
-            )
-            time.sleep(3)
-            webbrowser.open('https://photos.google.com')
-            response = input(
-"""\nYou will need to perform the following steps:
+2) Open photos.google.com"""
+    )
+    time.sleep(3)
+    webbrowser.open('https://photos.google.com')
+    response = input(
+f"""\nYou will need to perform the following steps:
 3) Make sure you are logged in to your Google account
-4) Click on the Albums tab and open an album you can delete (make a new one if you don't have one).
+4) Click on the Albums tab and open an album you can {action} (make a new one if you don't have one).
 
 When you're ready, click here on the Python console then ("y" for yes, and anything else to skip) and press <enter> when ready.""")
-            if response.lower() == 'y':
-                if prompt_to_memorize_coordinates('AlbumWindowMouseClicks','three_dots', 'Recording location of next click.\nPlease click the three dots at the top right of the album page you just opened.'):
-                    if prompt_to_memorize_coordinates('AlbumDeleteMouseClicks','delete_button', 'Please click the "Delete Album" menu item.'):
-                        if prompt_to_memorize_coordinates('AlbumDeleteMouseClicks','confirm_delete_button', 'Please click the "Delete" button in the confirmation dialog.'):
-                            print('Great! Now we will save those coordinates.')
-                            update_config_file(CONFIG_FILENAME)
-                        else:
-                            print('Ok, we will skip saving the coordinates.')
-                    else:
-                        print('Ok, we will skip saving the coordinates.')                        
-                else:
-                    print('Ok, we will skip saving the coordinates.')
-        else:
-            print('Ok, we will skip saving the delete coordinates.')
-        
-        response = input(
-"""\nWould you like to record mouse clicks so you can use the album rename function?
-("y" for yes, and anything else to skip)""")
-        if response.lower() == 'y':
-            print(
-"""\nI will perform the following steps:
-1) Open your system default web browser
-2) Open photos.google.com"""                
-            )
-            time.sleep(3)
-            webbrowser.open('https://photos.google.com')          
-            response = input(
-"""\nYou will need to perform the following steps:
-3) Make sure you are logged in to your Google account
-4) Click on the Albums tab and open an album you can rename (make a new one if you don't have one).
+    if response.lower() != 'y':
+        print('Ok, we will skip saving the coordinates.')
+        return
+    config = configparser.ConfigParser()
+    config.read(config_filename)
+    # How long the album page takes to load can't be seen in the recording, nor can the waits after keyboard shortcuts
+    recording = record_macro(name, config.getfloat('AlbumDeleter', 'page_load_wait_time', fallback=7.0), config.getfloat('AlbumDeleter', 'mouse_click_wait_time', fallback=1.0))
+    if recording is None:
+        print('Ok, we will skip saving the coordinates.')
+        return
+    print('Great! Now we will save that recording.')
+    save_recording(recording, config_filename)
+
+def main():
+    with mouse.Listener(on_click=on_click, on_move=on_move), keyboard.Listener(on_press=on_press):
+        record_action(MouseMacros.DELETE_MACRO, 'delete', CONFIG_FILENAME)
+        record_action(MouseMacros.RENAME_MACRO, 'rename', CONFIG_FILENAME)
 
-When you're ready, click here on the Python console then ("y" for yes, and anything else to skip) and press <enter> when ready.""")
-            if response.lower() == 'y':
-                if prompt_to_memorize_coordinates('AlbumWindowMouseClicks','three_dots', 'Recording location of next click.\nPlease click the three dots at the top right of the album page you just opened.'):
-                    if prompt_to_memorize_coordinates('AlbumRenameMouseClicks','rename_button', 'Please click the "Edit album" menu item.'):
-                        if prompt_to_memorize_coordinates('AlbumRenameMouseClicks','rename_textbox', 'Please click the album name field at or near the beginning.'):
-                            if prompt_to_memorize_coordinates('AlbumRenameMouseClicks','rename_save_button', 'Please click the checkmark button at the top left of the screen (confirms edit).'):
-                                print('Great! Now we will save those coordinates.')
-                                update_config_file(CONFIG_FILENAME)
-                            else:
-                                print('Ok, we will skip saving the coordinates.')
-                        else:
-                            print('Ok, we will skip saving the coordinates.')
-                    else:
-                        print('Ok, we will skip saving the coordinates.')                        
-                else:
-                    print('Ok, we will skip saving the coordinates.')
-        else:
-            print('Ok, we will skip saving the rename coordinates.')
-        
 
 if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
-        print("\nProgram stopped by user.")
\ No newline at end of file
+        print("\nProgram stopped by user.")
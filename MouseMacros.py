@@ -0,0 +1,410 @@
+import os
+import json
+import time
+import logging
+import platform
+import RunMetrics
+
+# Names of the macros the script plays, also the names of their files in the macro folder
+DELETE_MACRO = 'delete_album'
+RENAME_MACRO = 'rename_album'
+# Stands for the key shortcuts are made with: cmd on macOS, ctrl everywhere else
+COMMAND_KEY = '{command}'
+# A recorded click the pointer rested on its target for less time than this before didn't need the rest, so the
+# replay clicks straight away instead of moving there, waiting and then clicking
+MIN_HOVER_SECONDS = 1.0
+# Goes to the tab on the left, in Chrome, Edge, Firefox and Safari alike
+PREVIOUS_TAB_KEYS = ['ctrl', 'shift', 'tab']
+# Steps that type; what is typed goes in at once on replay
+KEYBOARD_ACTIONS = ('hotkey', 'write')
+
+# The steps of each macro.  Clicks are what gets recorded (with the prompt shown while recording); the keyboard
+# steps and waits are filled in from the config.  'wait' names the config wait time a step waits for before it
+# runs: page_load (page_load_wait_time), click (mouse_click_wait_time) or none.
+MACRO_STEPS = {
+    DELETE_MACRO: [
+        {'action': 'open', 'text': '{url}', 'wait': 'none'},
+        {'action': 'click', 'tag': 'three_dots', 'wait': 'page_load', 'prompt': 'the three dots at the top right of the album page'},
+        {'action': 'click', 'tag': 'delete_button', 'wait': 'click', 'prompt': 'the "Delete album" menu item'},
+        {'action': 'click', 'tag': 'confirm_delete_button', 'wait': 'click', 'prompt': 'the "Delete" button in the confirmation dialog'},
+        # The dialog closing means the album is gone
+        {'action': 'hotkey', 'keys': [COMMAND_KEY, 'w'], 'wait': 'click', 'wait_until_gone': 'confirm_delete_button'},
+        # Waiting for the next album's page to load covers the tab closing, if there's a picture to wait for
+        {'action': 'wait', 'wait': 'click', 'skip_with_template': 'three_dots'},
+    ],
+    RENAME_MACRO: [
+        {'action': 'open', 'text': '{url}', 'wait': 'none'},
+        {'action': 'click', 'tag': 'three_dots', 'wait': 'page_load', 'prompt': 'the three dots at the top right of the album page'},
+        {'action': 'click', 'tag': 'rename_button', 'wait': 'click', 'prompt': 'the "Edit album" menu item'},
+        {'action': 'click', 'tag': 'rename_textbox', 'wait': 'click', 'prompt': 'the album name field, at or near its beginning'},
+        {'action': 'hotkey', 'keys': [COMMAND_KEY, 'a'], 'wait': 'none'},
+        {'action': 'write', 'text': '{new_title}', 'wait': 'none'},
+        {'action': 'click', 'tag': 'rename_save_button', 'wait': 'none', 'prompt': 'the checkmark at the top left of the page (after typing a new name)'},
+        {'action': 'wait', 'wait': 'click'},
+        {'action': 'hotkey', 'keys': [COMMAND_KEY, 'w'], 'wait': 'none'},
+        {'action': 'wait', 'wait': 'click'},
+    ],
+}
+
+
+def click_tags(name):
+    """:return: The tags of the clicks of the macro name, in order."""
+    return [step['tag'] for step in MACRO_STEPS[name] if step['action'] == 'click']
+
+
+def _config_waits(page_load_wait_time, mouse_click_wait_time):
+    return {'page_load': page_load_wait_time, 'click': mouse_click_wait_time, 'none': 0.0}
+
+
+def _steps_without_clicks(name, waits):
+    # Every step with its wait filled in; the clicks still need their position and timing
+    steps = []
+    for definition in MACRO_STEPS[name]:
+        step = {key: value for key, value in definition.items() if key not in ('wait', 'prompt')}
+        step['delay'] = waits[definition['wait']]
+        steps.append(step)
+    return steps
+
+
+def macro_from_config(name, coordinates, page_load_wait_time=1.0, mouse_move_wait_time=1.0, mouse_click_wait_time=1.0):
+    """
+    Builds a macro from the click positions and wait times in the config file, for when none has been recorded.
+    It plays the same way the script always clicked: move to the button, wait, click, wait.
+
+    :param name: DELETE_MACRO or RENAME_MACRO.
+    :param coordinates: Dictionary of click tag (e.g. 'three_dots') to its (x, y) from the config file.
+    :return: The macro dictionary.
+    """
+    steps = _steps_without_clicks(name, _config_waits(page_load_wait_time, mouse_click_wait_time))
+    for step in steps:
+        if step['action'] == 'click':
+            step['x'], step['y'] = coordinates[step['tag']]
+            step['hover'] = mouse_move_wait_time
+    # No display geometry: the positions are used as they are
+    return {'name': name, 'screen': None, 'window': None, 'steps': steps}
+
+
+class MacroRecorder:
+    """
+    Turns the clicks and key presses of someone doing an action once into a macro.  For each click it keeps the
+    position (relative to the browser window when its position is known), how long after the previous click or
+    key press it came, and how long the pointer rested on the target first; a click after typing (the rename's
+    save button) is timed from the last key press, as the replay types the text at once.  Feed it the events as
+    they happen; MouseClickFinderScript does that with pynput.
+
+    :param name: DELETE_MACRO or RENAME_MACRO.
+    :param page_load_wait_time: Wait before the first click; how long the page took to load can't be seen in the recording.
+    :param mouse_click_wait_time: Wait for the steps that aren't clicks, as in the config.
+    :param screen: (width, height) of the display while recording, or None if unknown.
+    :param clock: Function returning the current time in seconds.
+    """
+
+    def __init__(self, name, page_load_wait_time=1.0, mouse_click_wait_time=1.0, screen=None, clock=time.monotonic):
+        self.name = name
+        self.waits = _config_waits(page_load_wait_time, mouse_click_wait_time)
+        self.screen = list(screen) if screen else None
+        self.window = None
+        self.clock = clock
+        self.clicks = []
+        self.last_move = None
+        self.last_input = None
+        self.keys_since_click = 0
+
+    @property
+    def done(self):
+        return len(self.clicks) >= len(click_tags(self.name))
+
+    def next_prompt(self):
+        """:return: What to click next, or None when every click has been recorded."""
+        prompts = [step['prompt'] for step in MACRO_STEPS[self.name] if step['action'] == 'click']
+        return None if self.done else prompts[len(self.clicks)]
+
+    def on_move(self, x, y):
+        self.last_move = self.clock()
+
+    def on_key(self):
+        # Keys pressed before the first click (e.g. alt-tab to the browser) aren't part of the action
+        if self.clicks:
+            self.last_input = self.clock()
+            self.keys_since_click += 1
+
+    def on_click(self, x, y, template=None, window=None):
+        """
+        Records the next click of the macro.
+
+        :param template: Picture of the button (see ScreenReadiness), kept with the click for the caller to save.
+        :param window: (left, top, width, height) of the window clicked in, if known; the first one is kept.
+        :return: The tag of the click, or None if the macro is already complete.
+        """
+        if self.done:
+            return None
+        now = self.clock()
+        if self.window is None and window is not None:
+            self.window = list(window)
+        # Time since the previous click or key press, and the part of it the pointer spent resting on the target
+        gap = None if self.last_input is None else now - self.last_input
+        rested = now - self.last_move if self.last_move is not None else 0.0
+        if gap is not None:
+            rested = min(rested, gap)
+        self.clicks.append({'x': x, 'y': y, 'gap': gap, 'rested': rested, 'keys': self.keys_since_click, 'template': template})
+        self.last_input = now
+        self.keys_since_click = 0
+        return click_tags(self.name)[len(self.clicks) - 1]
+
+    def templates(self):
+        """:return: Dictionary of click tag to the picture recorded with it (None if there is none)."""
+        return dict(zip(click_tags(self.name), (click['template'] for click in self.clicks)))
+
+    def macro(self):
+        """:return: The recorded macro dictionary (see MacroPlayer)."""
+        steps = _steps_without_clicks(self.name, self.waits)
+        clicks = iter(self.clicks)
+        for number, step in enumerate(steps):
+            if step['action'] != 'click':
+                continue
+            click = next(clicks)
+            left, top = self.window[:2] if self.window else (0, 0)
+            step['x'], step['y'] = click['x'] - left, click['y'] - top
+            if number and steps[number - 1]['action'] in KEYBOARD_ACTIONS and not click['keys']:
+                # No key presses reached the recorder (pynput can't see the keyboard without accessibility access on
+                # macOS, nor on Wayland), so the time before this click includes the typing: keep the config wait
+                logging.warning(f"No typing was seen before {step['tag']}, so it waits {step['delay']}s from the config instead of the recorded time")
+                step['hover'] = 0.0
+                continue
+            # A rest long enough to look deliberate is kept; otherwise the pointer goes straight to the click
+            step['hover'] = round(click['rested'], 3) if click['rested'] >= MIN_HOVER_SECONDS else 0.0
+            if click['gap'] is not None:
+                step['delay'] = round(max(0.0, click['gap'] - click['rested']), 3)
+        return {'name': self.name, 'screen': self.screen, 'window': self.window, 'steps': steps}
+
+
+def _copy_to_clipboard(text):
+    # pyperclip comes with pyautogui; it is only needed for titles that can't be typed
+    import pyperclip
+    pyperclip.copy(text)
+
+
+def macro_path(macro_dir, name):
+    return os.path.join(macro_dir, f"{name}.json")
+
+
+def save_macro(macro, macro_dir):
+    """Saves a macro as JSON in macro_dir, so it can be read and edited by hand."""
+    os.makedirs(macro_dir, exist_ok=True)
+    with open(macro_path(macro_dir, macro['name']), 'w', encoding='utf-8') as file:
+        json.dump(macro, file, indent=2)
+
+
+def load_macro(macro_dir, name):
+    """:return: The macro recorded as name, or None if there isn't one (or it can't be read)."""
+    path = macro_path(macro_dir, name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as file:
+            macro = json.load(file)
+    except (OSError, ValueError) as e:
+        logging.error(f"Error reading mouse macro {path}: {e}")
+        return None
+    if [step.get('tag') for step in macro.get('steps', []) if step.get('action') == 'click'] != click_tags(name):
+        logging.error(f"Mouse macro {path} doesn't have the clicks {', '.join(click_tags(name))}; record it again")
+        return None
+    return macro
+
+
+class MacroPlayer:
+    """
+    Plays macros with a mouse and keyboard driver (the pyautogui module, or a fake for testing).  Positions are
+    scaled from the display (and browser window, if it was recorded) of the recording to the current one, and
+    the waits are shortened by speed.  A click waits for its recorded picture instead, when there is one.
+
+    :param driver: Object with pyautogui's moveTo, click, hotkey, write and size functions.
+    :param browser: Object with webbrowser's open function.
+    :param scale_factor: Multiplies every position given to the driver (macos_scale_factor on macOS).
+    :param speed: How many times faster than recorded the waits go; the picture waits are not shortened.
+    :param waiter: A ScreenReadiness.ReadinessWaiter, or None to always sleep the full waits.
+    :param templates: Dictionary of click tag to recorded picture, from ScreenReadiness.load_templates.
+    :param sleep: Function used to wait.
+    :param clipboard: Function putting text on the clipboard, for text the driver can't type (pyperclip's copy if None).
+    """
+
+    def __init__(self, driver, browser, scale_factor=1.0, speed=1.0, waiter=None, templates=None, sleep=time.sleep, clipboard=None):
+        self.driver = driver
+        self.browser = browser
+        self.clipboard = clipboard or _copy_to_clipboard
+        self.scale_factor = scale_factor
+        self.speed = speed if speed > 0 else 1.0
+        self.waiter = waiter
+        self.templates = templates or {}
+        self.sleep = sleep
+
+    def _template(self, tag):
+        return self.templates.get(tag) if self.waiter is not None else None
+
+    def _window(self, macro):
+        # Where to map recorded positions to: the browser window if it was recorded, else the whole display
+        width, height = self.driver.size()
+        if macro.get('window'):
+            try:
+                window = self.driver.getActiveWindow()
+                if window is not None and window.width > 0:
+                    return window.left, window.top, window.width, window.height
+            except Exception:
+                pass
+            recorded_width, recorded_height = macro['screen'] or macro['window'][2:]
+            left, top, window_width, window_height = macro['window']
+            # The window can't be found on this system, so assume it covers the same part of the display
+            return (left * width / recorded_width, top * height / recorded_height,
+                    window_width * width / recorded_width, window_height * height / recorded_height)
+        return 0, 0, width, height
+
+    def position(self, macro, step, window):
+        """:return: Where the click step is on the current display, before the scale factor."""
+        x, y = step['x'], step['y']
+        if macro.get('window'):
+            left, top, width, height = window
+            return left + x * width / macro['window'][2], top + y * height / macro['window'][3]
+        if macro.get('screen'):
+            return x * window[2] / macro['screen'][0], y * window[3] / macro['screen'][1]
+        return x, y
+
+    def _wait(self, seconds):
+        if seconds > 0:
+            self.sleep(seconds / self.speed)
+
+    def _scaled(self, point):
+        return tuple(c * self.scale_factor for c in point)
+
+    def _keys(self, keys):
+        command = 'cmd' if platform.system() == 'Darwin' else 'ctrl'  # Darwin is the name for the macOS operating system
+        return [command if key == COMMAND_KEY else key for key in keys]
+
+    def play(self, macro, opened=None, **values):
+        """
+        Plays every step of macro.
+
+        :param opened: Seconds since the caller opened the page already (e.g. in a tab ahead of time); the open
+                       step is then skipped and the wait for the page to load shortened by that much.
+        :param values: What to fill the placeholders of the steps with, e.g. url and new_title.
+        :return: True if it was played, False if it couldn't be started.
+        """
+        # pyautogui's write only types ASCII and leaves out everything else, so other text is pasted instead.  It is
+        # put on the clipboard before the page is touched, so a clipboard that can't be used leaves the album as it was.
+        for text in (step['text'].format(**values) for step in macro['steps'] if step['action'] == 'write'):
+            if text.isascii():
+                continue
+            try:
+                self.clipboard(text)
+            except Exception as e:
+                logging.error(f"Can't type '{text}': it has letters that can only be pasted, and the clipboard can't be used ({e})")
+                return False
+        window = None
+        positions = {}
+        head_start = None
+        for step in macro['steps']:
+            action = step['action']
+            with RunMetrics.metrics.timer('gui_step_seconds', step=step.get('tag') or action):
+                if action == 'open':
+                    if opened is not None:
+                        head_start = opened
+                        continue
+                    self._wait(step['delay'])
+                    self.browser.open(step['text'].format(**values))
+                elif action == 'click':
+                    if window is None:
+                        window = self._window(macro)
+                    point = positions[step['tag']] = self.position(macro, step, window)
+                    # The first click after the page was opened waits for it to load, less the time it has had already
+                    delay = step['delay'] if head_start is None else max(0.0, step['delay'] - head_start)
+                    head_start = None
+                    template = self._template(step['tag'])
+                    if template is not None:
+                        # Rest the pointer on the button while waiting, the way its picture was taken
+                        self.driver.moveTo(self._scaled(point))
+                        if not self.waiter.wait_for_template(point[0], point[1], template, delay + step['hover']):
+                            logging.warning(f"Gave up waiting for {step['tag']} after {delay + step['hover']}s, clicking anyway")
+                        self.driver.click(self._scaled(point))
+                        continue
+                    self._wait(delay)
+                    if step['hover']:
+                        self.driver.moveTo(self._scaled(point))
+                        self._wait(step['hover'])
+                    self.driver.click(self._scaled(point))
+                elif action in ('hotkey', 'write', 'wait'):
+                    gone = step.get('wait_until_gone')
+                    if gone in positions and self._template(gone) is not None:
+                        self.waiter.wait_for_template_gone(positions[gone][0], positions[gone][1], self._template(gone), step['delay'])
+                    elif self._template(step.get('skip_with_template')) is None:
+                        self._wait(step['delay'])
+                    if action == 'hotkey':
+                        self.driver.hotkey(*self._keys(step['keys']))
+                    elif action == 'write':
+                        self._type(step['text'].format(**values))
+                else:
+                    logging.warning(f"Skipping unknown macro step {action}")
+        return True
+
+    def _type(self, text):
+        if text.isascii():
+            self.driver.write(text)
+            return
+        # Copied again in case another step's text has been put on the clipboard since
+        self.clipboard(text)
+        self.driver.hotkey(*self._keys([COMMAND_KEY, 'v']))
+
+
+class TabPrefetcher:
+    """
+    Keeps the pages of the next albums loading in tabs to the right of the one the macro is working on, so each
+    page has had the time the previous albums took to load by the time the macro gets to it.  Relies on the browser
+    opening new tabs at the end and going to the tab on the right when one is closed, as Chrome, Edge and Firefox do.
+
+    :param driver: pyautogui, or a stand-in for it.
+    :param browser: The webbrowser module, or a stand-in for it.
+    :param urls: The pages, in the order they are worked on.  The macro must close each one's tab when done.
+    :param depth: How many tabs are kept loading ahead of the current one.
+    :param settle: Seconds to let the browser open a new tab before switching away from it.
+    :param clock: Function returning the time in seconds.
+    :param sleep: Function to wait with.
+    """
+
+    def __init__(self, driver, browser, urls, depth=1, settle=1.0, clock=time.monotonic, sleep=time.sleep):
+        self.driver = driver
+        self.browser = browser
+        self.urls = list(urls)
+        self.depth = max(0, depth)
+        self.settle = settle
+        self.clock = clock
+        self.sleep = sleep
+        self.current = 0
+        self.opened_at = {}
+
+    def _open(self, number):
+        self.browser.open(self.urls[number], new=2)
+        self.opened_at[number] = self.clock()
+
+    def _back_to_current(self, tabs):
+        # The new tab was put in front, the current one is tabs to its left
+        if self.settle > 0:
+            self.sleep(self.settle)
+        for _ in range(tabs):
+            self.driver.hotkey(*PREVIOUS_TAB_KEYS)
+
+    def start(self):
+        """Opens the first page and the ones after it, and goes back to the first."""
+        ahead = min(self.depth, len(self.urls) - 1)
+        for number in range(ahead + 1):
+            self._open(number)
+        self._back_to_current(ahead)
+
+    def seconds_loading(self):
+        """:return: How long the current page has been loading, for MacroPlayer.play's opened."""
+        return self.clock() - self.opened_at[self.current]
+
+    def advance(self):
+        """After the current page's tab was closed (which brings up the next), opens the next page to load ahead."""
+        self.current += 1
+        number = self.current + self.depth
+        if number < len(self.urls):
+            self._open(number)
+            self._back_to_current(self.depth)
@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# Every metric name in the Prometheus textfile starts with this
+METRIC_PREFIX = 'google_photos_album_cleanup_'
+# Upper bounds (seconds) of the latency histogram buckets.  API calls take tens of milliseconds, a mouse step
+# waiting for a page to load can take several seconds.
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DEFAULT_PROMETHEUS_INTERVAL = 10.0
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, like a Prometheus histogram, plus the smallest and largest value."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """:return: An estimate of the q quantile: the upper bound of the bucket it falls in (the maximum for the last one)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        values = {'sum': self.sum, 'mean': self.sum / self.count if self.count else None, 'min': self.min, 'max': self.max,
+                  'p50': self.quantile(0.5), 'p95': self.quantile(0.95)}
+        return {'count': self.count, **{key: None if value is None else round(value, 6) for key, value in values.items()}}
+
+
+class Progress:
+    """Albums done out of a total for one task, with an ETA from the rate so far."""
+
+    def __init__(self, total, clock):
+        self.total = total
+        self.done = 0
+        self.clock = clock
+        self.started = clock()
+
+    def eta_seconds(self):
+        """:return: Seconds left at the rate so far, or None until the first album is done."""
+        if not self.done:
+            return None
+        return (self.clock() - self.started) / self.done * max(0, self.total - self.done)
+
+
+def format_duration(seconds):
+    """:return: seconds as e.g. '1h02m' or '3m05s', or '?' for None."""
+    if seconds is None:
+        return '?'
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _prometheus_labels(labels, extra=None):
+    labels = list(labels) + list(extra or [])
+    if not labels:
+        return ''
+    escaped = (f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"' for name, value in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+def _summary_key(name, labels):
+    return name + ''.join(f"[{label}={value}]" for label, value in labels)
+
+
+class RunMetrics:
+    """
+    Counters, latency histograms and progress of one run of the script.  They can be written as a Prometheus
+    textfile while the run goes on (for node_exporter's textfile collector, or just to look at) and as a JSON
+    summary at the end.  All methods can be called from several threads.
+
+    :param prometheus_file: Path of the Prometheus textfile, or None to not write one.
+    :param prometheus_interval: Least seconds between two writes of the textfile.
+    :param clock: Function returning the current time in seconds.
+    """
+
+    def __init__(self, prometheus_file=None, prometheus_interval=DEFAULT_PROMETHEUS_INTERVAL, clock=time.monotonic):
+        self.prometheus_file = prometheus_file
+        self.prometheus_interval = prometheus_interval
+        self.clock = clock
+        self.started = clock()
+        self.started_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.counters = {}
+        self.histograms = {}
+        self.progress = {}
+        self.last_prometheus_write = None
+        self.lock = threading.Lock()
+        # Held while the textfile is written, so two threads never write it at once
+        self.write_lock = threading.Lock()
+
+    def increment(self, name, amount=1, **labels):
+        """Adds amount to the counter name with these labels."""
+        with self.lock:
+            key = (name, _label_key(labels))
+            self.counters[key] = self.counters.get(key, 0) + amount
+        self.maybe_write_prometheus()
+
+    def observe(self, name, seconds, **labels):
+        """Adds one latency in seconds to the histogram name with these labels."""
+        with self.lock:
+            key = (name, _label_key(labels))
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+        self.maybe_write_prometheus()
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes how long the block takes in the histogram name, whether or not it raises."""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(name, self.clock() - start, **labels)
+
+    def start_progress(self, task, total):
+        """Starts counting albums done for task (e.g. 'delete') out of total."""
+        with self.lock:
+            self.progress[task] = Progress(total, self.clock)
+        self.maybe_write_prometheus(force=True)
+
+    def advance(self, task, amount=1):
+        """
+        Counts amount more albums done for task.
+
+        :return: The ETA in seconds for the rest of the task, or None if it isn't known.
+        """
+        with self.lock:
+            progress = self.progress.get(task)
+            if progress is None:
+                return None
+            progress.done += amount
+            eta = progress.eta_seconds()
+        self.maybe_write_prometheus()
+        return eta
+
+    def progress_text(self, task):
+        """:return: e.g. '12/500, ETA 1h02m' for log lines, or '' if task isn't running."""
+        progress = self.progress.get(task)
+        if progress is None:
+            return ''
+        return f"{progress.done}/{progress.total}, ETA {format_duration(progress.eta_seconds())}"
+
+    def maybe_write_prometheus(self, force=False):
+        """Writes the Prometheus textfile if it is due (or force), so it never costs more than a write per interval."""
+        if not self.prometheus_file:
+            return
+        now = self.clock()
+        with self.lock:
+            if not force and self.last_prometheus_write is not None and now - self.last_prometheus_write < self.prometheus_interval:
+                return
+            self.last_prometheus_write = now
+        self.write_prometheus(self.prometheus_file)
+
+    def prometheus_text(self):
+        """:return: The metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(h.buckets), list(h.bucket_counts), h.count, h.sum) for key, h in self.histograms.items()}
+            progress = {task: (p.done, p.total, p.eta_seconds()) for task, p in self.progress.items()}
+            uptime = self.clock() - self.started
+
+        lines.append(f"# TYPE {METRIC_PREFIX}run_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}run_seconds {uptime:.3f}")
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} counter")
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name == name:
+                    lines.append(f"{METRIC_PREFIX}{name}{_prometheus_labels(labels)} {value}")
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} histogram")
+            for (histogram_name, labels), (buckets, bucket_counts, count, total) in sorted(histograms.items()):
+                if histogram_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f"{METRIC_PREFIX}{name}_bucket{_prometheus_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{METRIC_PREFIX}{name}_bucket{_prometheus_labels(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{METRIC_PREFIX}{name}_sum{_prometheus_labels(labels)} {total:.6f}")
+                lines.append(f"{METRIC_PREFIX}{name}_count{_prometheus_labels(labels)} {count}")
+        if progress:
+            for gauge, index in (('progress_done', 0), ('progress_total', 1), ('progress_eta_seconds', 2)):
+                lines.append(f"# TYPE {METRIC_PREFIX}{gauge} gauge")
+                for task, values in sorted(progress.items()):
+                    if values[index] is not None:
+                        lines.append(f"{METRIC_PREFIX}{gauge}{_prometheus_labels([('task', task)])} {values[index]:.3f}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, file_path):
+        """
+        Writes prometheus_text() to file_path.  It is written to a temporary file of its own next to it and renamed,
+        so a scraper never reads half a file, and one write at a time, so an older text never replaces a newer one.
+        """
+        with self.write_lock:
+            temporary_path = None
+            try:
+                with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=os.path.dirname(os.path.abspath(file_path)),
+                                                 prefix=os.path.basename(file_path) + '.', suffix='.tmp', delete=False) as file:
+                    temporary_path = file.name
+                    file.write(self.prometheus_text())
+                # Temporary files are only readable by their owner, and node_exporter may run as another user
+                os.chmod(temporary_path, 0o644)
+                os.replace(temporary_path, file_path)
+            except OSError as e:
+                logging.error(f"Error writing metrics to {file_path}: {e}")
+                if temporary_path and os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+
+    def summary(self):
+        """:return: Dictionary with the counters, histogram summaries and progress of the run so far."""
+        with self.lock:
+            return {
+                'started': self.started_at,
+                'run_seconds': round(self.clock() - self.started, 3),
+                'counters': {_summary_key(name, labels): value for (name, labels), value in sorted(self.counters.items())},
+                'latencies': {_summary_key(name, labels): histogram.summary() for (name, labels), histogram in sorted(self.histograms.items())},
+                'progress': {task: {'done': p.done, 'total': p.total, 'eta_seconds': p.eta_seconds()} for task, p in self.progress.items()},
+            }
+
+    def write_summary(self, file_path):
+        """Writes summary() as JSON.  :return: True if it was written."""
+        try:
+            with open(file_path, 'w', encoding='utf-8') as file:
+                json.dump(self.summary(), file, indent=2)
+        except OSError as e:
+            logging.error(f"Error writing the run summary to {file_path}: {e}")
+            return False
+        logging.info(f"Run summary written to {file_path}")
+        return True
+
+
+# The metrics of this run.  Everything records into it; main() replaces it with one that writes the configured files.
+metrics = RunMetrics()
+
+
+def configure(prometheus_file=None, prometheus_interval=DEFAULT_PROMETHEUS_INTERVAL):
+    """Starts a fresh RunMetrics as the module's metrics, writing the Prometheus textfile to prometheus_file."""
+    global metrics
+    metrics = RunMetrics(prometheus_file, prometheus_interval)
+    return metrics
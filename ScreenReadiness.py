@@ -0,0 +1,159 @@
+import os
+import time
+import logging
+
+# Half the width/height (in screen points) of the small picture taken around each recorded click
+TEMPLATE_HALF_SIZE = 12
+# Average per-pixel difference (0-255 grayscale) below which a region counts as matching its template
+DEFAULT_MATCH_TOLERANCE = 12.0
+# How often the screen is checked while waiting
+DEFAULT_POLL_INTERVAL = 0.1
+
+
+class PyAutoGuiScreenGrabber:
+    """
+    Grabs small regions of the real screen with pyautogui.  Coordinates are the same screen points that
+    pyautogui and pynput use; on high resolution (e.g. Retina) displays they are scaled to screenshot pixels.
+    """
+
+    def __init__(self):
+        # Screenshot pixels per screen point, measured with one full screenshot the first time it's needed
+        self.scale = None
+
+    def grab(self, x, y, half_size=TEMPLATE_HALF_SIZE):
+        """
+        :return: A grayscale PIL image of the square around (x, y).
+        """
+        # Imported here so the waiter can be used (and tested) without a display
+        import pyautogui
+        if self.scale is None:
+            # Screenshots are in pixels, mouse coordinates in points; they differ on high resolution displays
+            self.scale = pyautogui.screenshot().width / pyautogui.size()[0]
+        left, top, right, bottom = region_around(x * self.scale, y * self.scale, half_size * self.scale)
+        # Only the region is captured, rather than the whole screen every time the waiter polls
+        left, top = max(0, left), max(0, top)
+        return pyautogui.screenshot(region=(left, top, max(1, right - left), max(1, bottom - top))).convert('L')
+
+
+class RecordedScreenGrabber:
+    """
+    Plays back recorded full-screen screenshots against a clock, for testing the waiter without a display.
+
+    :param frames: List of (time, PIL image) pairs in time order; each frame is shown from its time on.
+    :param clock: Function returning the current (usually virtual) time.
+    """
+
+    def __init__(self, frames, clock):
+        self.frames = frames
+        self.clock = clock
+
+    def grab(self, x, y, half_size=TEMPLATE_HALF_SIZE):
+        now = self.clock()
+        current = self.frames[0][1]
+        for frame_time, frame in self.frames:
+            if frame_time > now:
+                break
+            current = frame
+        return crop_around(current, x, y, half_size)
+
+
+def region_around(x, y, half_size):
+    """:return: The (left, top, right, bottom) pixel box of the square centred on (x, y)."""
+    left, top = int(round(x - half_size)), int(round(y - half_size))
+    # Always at least one pixel, so single pixel checks work too
+    return left, top, max(left + 1, int(round(x + half_size))), max(top + 1, int(round(y + half_size)))
+
+
+def crop_around(image, x, y, half_size):
+    """Returns the grayscale square of image centred on (x, y)."""
+    return image.crop(region_around(x, y, half_size)).convert('L')
+
+
+def images_match(image, template, tolerance=DEFAULT_MATCH_TOLERANCE):
+    """
+    :return: True if the two images differ on average by no more than tolerance per pixel (image is resized to
+             the template first, so a template recorded on a display with a different pixel density still works).
+    """
+    from PIL import ImageChops, ImageStat
+    if image.size != template.size:
+        image = image.resize(template.size)
+    difference = ImageChops.difference(image.convert('L'), template.convert('L'))
+    return ImageStat.Stat(difference).mean[0] <= tolerance
+
+
+class ReadinessWaiter:
+    """
+    Waits for something to show up on screen instead of sleeping for a fixed time.  Every wait has an upper
+    bound (the sleep the script used to do), so a condition that never shows up costs no more than before.
+
+    :param grabber: Object with a grab(x, y, half_size) method returning a PIL image, e.g. PyAutoGuiScreenGrabber.
+    :param clock: Function returning the current time in seconds.
+    :param sleep: Function used to wait between polls.
+    :param poll_interval: Seconds between screen checks.
+    :param tolerance: See images_match.
+    :param template_half_size: Half the size, in screen points, of the region compared with a template.
+    """
+
+    def __init__(self, grabber, clock=time.monotonic, sleep=time.sleep, poll_interval=DEFAULT_POLL_INTERVAL, tolerance=DEFAULT_MATCH_TOLERANCE, template_half_size=TEMPLATE_HALF_SIZE):
+        self.grabber = grabber
+        self.clock = clock
+        self.sleep = sleep
+        self.poll_interval = poll_interval
+        self.tolerance = tolerance
+        self.template_half_size = template_half_size
+
+    def wait_until(self, condition, timeout):
+        """
+        Polls condition() until it returns True or timeout seconds have passed.
+
+        :return: True if the condition was met, False on timeout.
+        """
+        deadline = self.clock() + timeout
+        while True:
+            if condition():
+                return True
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return False
+            self.sleep(min(self.poll_interval, remaining))
+
+    def wait_for_template(self, x, y, template, timeout):
+        """Waits until the region around (x, y) looks like template."""
+        return self.wait_until(lambda: images_match(self.grabber.grab(x, y, self.template_half_size), template, self.tolerance), timeout)
+
+    def wait_for_template_gone(self, x, y, template, timeout):
+        """Waits until the region around (x, y) no longer looks like template (e.g. a dialog has closed)."""
+        return self.wait_until(lambda: not images_match(self.grabber.grab(x, y, self.template_half_size), template, self.tolerance), timeout)
+
+    def wait_for_pixel(self, x, y, colour, timeout, tolerance=DEFAULT_MATCH_TOLERANCE):
+        """Waits until the pixel at (x, y) is within tolerance of the grayscale colour (0-255)."""
+        return self.wait_until(lambda: abs(self.grabber.grab(x, y, 0.5).getpixel((0, 0)) - colour) <= tolerance, timeout)
+
+
+def template_path(template_dir, tag):
+    return os.path.join(template_dir, f"{tag}.png")
+
+
+def save_template(image, template_dir, tag):
+    """Saves the picture taken around a recorded click so the deleter can wait for it later."""
+    os.makedirs(template_dir, exist_ok=True)
+    image.save(template_path(template_dir, tag))
+
+
+def load_templates(template_dir, tags):
+    """
+    Loads the pictures recorded with MouseClickFinderScript.
+
+    :return: Dictionary of tag to grayscale PIL image; tags without a recorded picture map to None.
+    """
+    # Pillow is only needed once the mouse is driven, so it isn't imported with the module
+    from PIL import Image
+    templates = {}
+    for tag in tags:
+        path = template_path(template_dir, tag)
+        try:
+            templates[tag] = Image.open(path).convert('L') if os.path.exists(path) else None
+        except OSError as e:
+            logging.error(f"Error reading readiness template {path}: {e}")
+            templates[tag] = None
+    return templates
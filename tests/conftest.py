@@ -0,0 +1,102 @@
+import os
+import sys
+import logging
+import configparser
+import pytest
+
+# The script's modules live at the top of the repository rather than in a package
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+import FakePhotosApi
+import GooglePhotosApi
+
+
+def fake_service_options(fake, **options):
+    """:return: PhotosServiceFactory settings for talking to the fake (no token, no discovery cache); options override them."""
+    from google.auth.credentials import AnonymousCredentials
+    return {'discovery_url': fake.discovery_url, 'credentials': AnonymousCredentials(), 'discovery_cache_file': '', **options}
+
+
+@pytest.fixture
+def fake_photos_api():
+    """
+    Starts local fakes of the Photos Library API (see FakePhotosApi) for a test and registers a service factory
+    for each, so the script's own API code talks to the fake.  The fixture is a function taking the
+    FakePhotosApi arguments and returning the started fake.  Its service factory is kept under the fake's url as
+    the scope, or under the scope, credentials_file and token_file given, e.g. those of an account in a config file.
+    """
+    fakes = []
+
+    def start(albums, scope=None, credentials_file='', token_file='', **options):
+        fake = FakePhotosApi.FakePhotosApi(albums, **options).start()
+        fakes.append(fake)
+        GooglePhotosApi.get_service_factory(scope or fake.url, credentials_file, token_file, **fake_service_options(fake))
+        return fake
+
+    yield start
+    for fake in fakes:
+        fake.stop()
+
+
+@pytest.fixture
+def fake_service_factory():
+    """:return: A function making a new PhotosServiceFactory for a fake, not shared with the rest of the test; keyword arguments are its settings."""
+    return lambda fake, **options: GooglePhotosApi.PhotosServiceFactory(fake.url, '', '', **fake_service_options(fake, **options))
+
+
+@pytest.fixture
+def no_wait_rate_limiter():
+    """:return: A function making AdaptiveRateLimiters that never actually sleep, so retries don't slow the tests down."""
+    return lambda: GooglePhotosApi.AdaptiveRateLimiter(initial_rate=1000, max_rate=1000, sleep=lambda seconds: None)
+
+
+@pytest.fixture
+def flagged_album_list():
+    """:return: A function making a typed album list of count synthetic albums (see FakePhotosApi.make_albums), all flagged for deleting."""
+    import pandas as pd
+    import AlbumSchema
+
+    def make(count):
+        albums = FakePhotosApi.make_albums(count)
+        return AlbumSchema.apply_schema(pd.DataFrame({'Album Title': [album['title'] for album in albums], 'Photo Count': [album['mediaItemsCount'] for album in albums],
+                                                      'Delete Flag': True, 'Album ID': [album['id'] for album in albums], 'Album URL': [album['productUrl'] for album in albums]}))
+    return make
+
+
+@pytest.fixture
+def root_log_handlers():
+    # Reading the config file adds the script's log handlers to the root logger
+    handlers = list(logging.getLogger().handlers)
+    yield
+    for handler in logging.getLogger().handlers[:]:
+        if handler not in handlers:
+            logging.getLogger().removeHandler(handler)
+            handler.close()
+
+
+@pytest.fixture
+def script_config(tmp_path, root_log_handlers):
+    """
+    :return: A function writing a copy of the script's config file into the test's folder and returning its path.
+             Every file it names is in that folder, the listing is neither limited nor slowed down and no metrics
+             are written.  Keyword arguments are sections to add or change, e.g. AlbumLister={'album_list_length_limit': '50'}.
+    """
+    def write(**sections):
+        config = configparser.ConfigParser()
+        config.read(os.path.join(REPOSITORY, 'GooglePhotosAlbumCleanupConfig.ini'))
+        config['logging']['file'] = str(tmp_path / 'cleanup.log')
+        config['GooglePhotosAPI'].update({'token_file': str(tmp_path / 'token.json'), 'discovery_cache_file': ''})
+        config['AlbumLister'].update({'album_list_file': str(tmp_path / 'albums.xlsx'), 'snapshot_db_file': str(tmp_path / 'albums.db'), 'album_list_length_limit': '0',
+                                      'requests_per_second': '1000', 'max_requests_per_second': '1000'})
+        config['AlbumDeleter']['journal_file'] = str(tmp_path / 'journal.jsonl')
+        config['Metrics'].update({'summary_file': '', 'prometheus_textfile': ''})
+        for section, options in sections.items():
+            if section not in config:
+                config[section] = {}
+            config[section].update(options)
+        config_file = str(tmp_path / 'config.ini')
+        with open(config_file, 'w') as file:
+            config.write(file)
+        return config_file
+    return write
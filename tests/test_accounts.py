@@ -0,0 +1,58 @@
+import os
+import pandas as pd
+import pytest
+import FakePhotosApi
+import GooglePhotosAlbumCleanup
+
+
+@pytest.fixture
+def accounts_config(tmp_path, script_config, fake_photos_api):
+    """
+    Writes a config file with three accounts, each with its own fake API: family and work have albums, and the
+    first page of broken's listing fails.  :return: Tuple of (config file path, dictionary of account to its fake).
+    """
+    accounts = {account: {'token_file': str(tmp_path / f"token - {account}.json")} for account in ('family', 'work', 'broken')}
+    config_file = script_config(Accounts={'workers': '3', 'consolidated_album_list_file': str(tmp_path / 'all accounts.csv')},
+                                **{f"Account {account}": options for account, options in accounts.items()})
+    parameters = GooglePhotosAlbumCleanup.read_config_and_set_up_logging(config_file)
+    fakes = {}
+    for account, count in (('family', 3), ('work', 2), ('broken', 2)):
+        albums = [{**album, 'id': f"{account}-{album['id']}"} for album in FakePhotosApi.make_albums(count, seed_title=account)]
+        fakes[account] = fake_photos_api(albums, scope=parameters['scopes'], credentials_file=parameters['credentials_file'], token_file=accounts[account]['token_file'],
+                                         failing_page_tokens={None} if account == 'broken' else ())
+    return config_file, fakes
+
+
+def read_consolidated(file_path):
+    # The consolidated list has the long spreadsheet headers
+    return pd.read_csv(file_path, keep_default_na=False).rename(columns={**GooglePhotosAlbumCleanup.LONG_TO_SHORT_HEADERS, **GooglePhotosAlbumCleanup.OPTIONAL_LONG_TO_SHORT_HEADERS})
+
+
+def test_accounts_are_listed_into_their_own_files_and_one_consolidated_list(accounts_config, tmp_path):
+    config_file, fakes = accounts_config
+    # broken fails, which doesn't stop the others
+    assert GooglePhotosAlbumCleanup.main(['--config', config_file, '--account', 'all', 'list']) == 1
+    assert os.path.exists(tmp_path / 'albums - family.db') and os.path.exists(tmp_path / 'albums - work.db')
+    assert not os.path.exists(tmp_path / 'albums.db')
+    consolidated = read_consolidated(tmp_path / 'all accounts.csv')
+    assert consolidated.columns[0] == 'Account'
+    assert list(zip(consolidated['Account'], consolidated['Album ID'])) == [
+        ('family', 'family-album-0'), ('family', 'family-album-1'), ('family', 'family-album-2'), ('work', 'work-album-0'), ('work', 'work-album-1')]
+    assert fakes['broken'].requests == 1
+
+
+def test_marking_one_account_leaves_the_others_alone(accounts_config, tmp_path):
+    config_file, fakes = accounts_config
+    for album in fakes['family'].albums + fakes['work'].albums:
+        album['title'] = 'Copy of ' + album['title']
+    assert GooglePhotosAlbumCleanup.main(['--config', config_file, '--account', 'family', '--account', 'work', 'list']) == 0
+    assert GooglePhotosAlbumCleanup.main(['--config', config_file, '--account', 'family', 'mark-rename']) == 0
+    consolidated = read_consolidated(tmp_path / 'all accounts.csv').set_index('Album ID')
+    assert consolidated.loc[['family-album-0', 'family-album-1', 'family-album-2'], 'Album New Title'].tolist() == ['family 0', 'family 1', 'family 2']
+    assert consolidated.loc[['work-album-0', 'work-album-1'], 'Album New Title'].tolist() == ['', '']
+
+
+def test_commands_needing_the_browser_run_on_one_account_at_a_time(accounts_config):
+    config_file, _ = accounts_config
+    assert GooglePhotosAlbumCleanup.main(['--config', config_file, '--account', 'family', '--account', 'work', 'delete']) == 1
+    assert GooglePhotosAlbumCleanup.main(['--config', config_file, '--account', 'nobody', 'list']) == 1
@@ -0,0 +1,59 @@
+import logging
+import os
+import ActionJournal
+import FakeDesktop
+import FakePhotosApi
+import GooglePhotosAlbumCleanup
+
+
+class CrashingBrowser(FakeDesktop.FakeWebBrowser):
+    """A browser that stops the run (like Ctrl-C) when it's asked to open crash_url."""
+
+    def __init__(self, crash_url):
+        super().__init__()
+        self.crash_url = crash_url
+
+    def open(self, url, new=0, autoraise=True):
+        if url == self.crash_url:
+            raise KeyboardInterrupt
+        return super().open(url, new, autoraise)
+
+
+def delete_with_journal(parameters):
+    album_list = GooglePhotosAlbumCleanup.load_album_list(parameters)
+    return GooglePhotosAlbumCleanup.run_journaled(album_list, parameters, lambda album_list, journal: GooglePhotosAlbumCleanup.delete_albums(
+        album_list, 100, 1.0, (10, 10), (20, 20), (30, 30), page_load_wait_time=0, mouse_move_wait_time=0, mouse_click_wait_time=0, journal=journal))
+
+
+def test_deleting_carries_on_after_a_crash(tmp_path, caplog, flagged_album_list):
+    parameters = {'storage_backend': 'sqlite', 'album_store_file': str(tmp_path / 'albums.db'), 'album_list_file': str(tmp_path / 'albums.xlsx'),
+                  'auto_export_xlsx': False, 'journal_file': str(tmp_path / 'journal.jsonl')}
+    GooglePhotosAlbumCleanup.open_album_store(parameters).write(flagged_album_list(5))
+    urls = [album['productUrl'] for album in FakePhotosApi.make_albums(5)]
+
+    # The first run is stopped while album-2 is being opened
+    with FakeDesktop.fake_desktop(GooglePhotosAlbumCleanup):
+        GooglePhotosAlbumCleanup.webbrowser = browser = CrashingBrowser(urls[2])
+        delete_with_journal(parameters)
+    assert browser.opened == urls[:2]
+    saved = GooglePhotosAlbumCleanup.load_album_list(parameters)
+    assert list(saved['Actions'].astype(str).str.startswith('Deleted')) == [True, True, False, False, False]
+    assert not os.path.exists(parameters['journal_file'])
+
+    # A crash that left a journal behind (album-2 deleted, album-3 half done, a half-written line) before the
+    # album list was saved
+    with ActionJournal.ActionJournal(parameters['journal_file']) as journal:
+        journal.record('album-2', ActionJournal.DELETED, 'Deleted on 2024-01-01 12:00:00')
+        journal.record('album-3', ActionJournal.STARTED, title='Album 3')
+    with open(parameters['journal_file'], 'a', encoding='utf-8') as journal:
+        journal.write('{"album_id": "album-4", "sta')
+
+    with FakeDesktop.fake_desktop(GooglePhotosAlbumCleanup) as (clock, pyautogui, browser), caplog.at_level(logging.WARNING):
+        delete_with_journal(parameters)
+    # Only the albums the journal doesn't show as deleted are opened again
+    assert browser.opened == urls[3:]
+    assert 'Album 3 (album-3) was being processed' in caplog.text
+    saved = GooglePhotosAlbumCleanup.load_album_list(parameters)
+    assert saved['Actions'].astype(str).str.startswith('Deleted').all()
+    assert saved.loc[saved['Album ID'] == 'album-2', 'Actions'].iloc[0] == 'Deleted on 2024-01-01 12:00:00'
+    assert os.path.exists(parameters['journal_file'] + '.merged')
@@ -0,0 +1,54 @@
+import pandas as pd
+import AlbumDuplicates
+import AlbumSchema
+import GooglePhotosAlbumCleanup
+
+
+def photos(*numbers):
+    return [f"media-{n}" for n in numbers]
+
+
+# Album ID: (title, photos)
+LIBRARY = {
+    # The copy comes first in the list, but the album without 'Copy of ' is the one kept
+    'album-0': ('Copy of Trip', photos(*range(10))),
+    'album-1': ('Trip', photos(*range(10))),
+    'album-2': ('Trip highlights', photos(*range(5))),
+    # 19 of the 21 photos in either album are in both
+    'album-3': ('Party', photos(*range(100, 119), 200)),
+    'album-4': ('Party 2', photos(*range(100, 120))),
+    'album-5': ('Garden', photos(*range(300, 310))),
+    'album-6': ('Empty', []),
+}
+
+
+def library_album_list():
+    return AlbumSchema.apply_schema(pd.DataFrame({'Album Title': [title for title, _ in LIBRARY.values()], 'Photo Count': [len(media_ids) for _, media_ids in LIBRARY.values()],
+                                                  'Album ID': list(LIBRARY), 'Album URL': [f"https://photos.google.com/lr/album/{album_id}" for album_id in LIBRARY]}))
+
+
+def test_finds_exact_duplicates_subsets_and_near_duplicates():
+    duplicates = AlbumDuplicates.find_duplicate_albums({album_id: media_ids for album_id, (_, media_ids) in LIBRARY.items()})
+    assert duplicates == {
+        'album-1': (AlbumDuplicates.EXACT_DUPLICATE, 'album-0', 1.0),
+        'album-2': (AlbumDuplicates.SUBSET, 'album-0', 0.5),
+        'album-4': (AlbumDuplicates.NEAR_DUPLICATE, 'album-3', 19 / 21),
+    }
+
+
+def test_marks_duplicates_listed_from_the_api(fake_photos_api):
+    albums = [{'id': album_id, 'title': title, 'mediaItemsCount': str(len(media_ids))} for album_id, (title, media_ids) in LIBRARY.items()]
+    fake = fake_photos_api(albums, memberships={album_id: media_ids for album_id, (_, media_ids) in LIBRARY.items()})
+    parameters = {'scopes': fake.url, 'credentials_file': '', 'token_file': '', 'discovery_cache_file': '', 'discovery_cache_ttl_hours': 0, 'max_connections': 4,
+                  'requests_per_second': 1000, 'max_requests_per_second': 1000, 'max_retries': 5, 'duplicate_workers': 4,
+                  'duplicate_kinds_to_delete': (AlbumDuplicates.EXACT_DUPLICATE,), 'near_duplicate_threshold': 0.8}
+
+    album_list = GooglePhotosAlbumCleanup.mark_duplicate_albums(library_album_list(), parameters).set_index('Album ID')
+    assert album_list['Duplicate Of'].to_dict() == {'album-0': 'album-1', 'album-1': '', 'album-2': 'album-1', 'album-3': '', 'album-4': 'album-3', 'album-5': '', 'album-6': ''}
+    assert album_list.loc['album-2', 'Duplicate Type'] == 'subset (50% of the other album)'
+    assert album_list.loc['album-4', 'Duplicate Type'] == 'near duplicate (90% of photos in common)'
+    # Only exact duplicates are flagged by default
+    assert album_list.index[album_list['Delete Flag']].tolist() == ['album-0']
+    assert album_list.loc['album-0', 'Matched Rule'] == f"delete: {AlbumDuplicates.EXACT_DUPLICATE} album"
+    # The empty album's photos aren't asked for
+    assert fake.requests == 6
@@ -0,0 +1,57 @@
+import time
+import pytest
+import FakePhotosApi
+import GooglePhotosApi
+import GooglePhotosAlbumCleanup
+import AlbumStorage
+
+
+def album_ids(pages):
+    return [album['id'] for results in pages for album in results.get('albums', [])]
+
+
+def test_pages_come_in_order_through_throttling(fake_photos_api, no_wait_rate_limiter):
+    fake = fake_photos_api(FakePhotosApi.make_albums(230), throttle_every=3)
+    pages = GooglePhotosApi.fetch_album_pages(GooglePhotosApi.get_photos_service(fake.url, '', ''), no_wait_rate_limiter())
+    assert album_ids(pages) == [f"album-{i}" for i in range(230)]
+    assert fake.throttled > 0
+
+
+def test_failed_page_is_raised_after_the_pages_before_it(fake_photos_api, no_wait_rate_limiter):
+    from googleapiclient.errors import HttpError
+    fake = fake_photos_api(FakePhotosApi.make_albums(230), failing_page_tokens={'100'})
+    pages = GooglePhotosApi.fetch_album_pages(GooglePhotosApi.get_photos_service(fake.url, '', ''), no_wait_rate_limiter())
+    listed = []
+    with pytest.raises(HttpError):
+        for results in pages:
+            listed.extend(album['id'] for album in results['albums'])
+    assert listed == [f"album-{i}" for i in range(100)]
+
+
+def test_stopping_early_does_not_wait_for_a_backoff(fake_photos_api):
+    # Every second request is throttled, so the page after the first is fetched in a long backoff
+    fake = fake_photos_api(FakePhotosApi.make_albums(230), throttle_every=2)
+    rate_limiter = GooglePhotosApi.AdaptiveRateLimiter(initial_rate=1000, max_rate=1000, base_backoff=30, max_backoff=30)
+    pages = GooglePhotosApi.fetch_album_pages(GooglePhotosApi.get_photos_service(fake.url, '', ''), rate_limiter)
+    assert len(next(pages)['albums']) == 50
+    start = time.monotonic()
+    pages.close()
+    assert time.monotonic() - start < 5
+
+
+@pytest.mark.parametrize('backend', ['sqlite', 'csv'])
+def test_failed_sync_is_not_saved_as_finished_and_resumes(fake_photos_api, tmp_path, backend):
+    fake = fake_photos_api(FakePhotosApi.make_albums(230), failing_page_tokens={'100'})
+    store = AlbumStorage.open_album_store(backend, str(tmp_path / f"albums.{backend}"), GooglePhotosAlbumCleanup.LONG_TO_SHORT_HEADERS, GooglePhotosAlbumCleanup.OPTIONAL_LONG_TO_SHORT_HEADERS)
+    sync = lambda: GooglePhotosAlbumCleanup.google_photos_album_sync(fake.url, '', '', store, requests_per_second=1000, max_requests_per_second=1000, max_retries=0)
+
+    assert sync() is None
+    assert store.checkpoint() == '100'
+
+    fake.failing_page_tokens.clear()
+    requests_before = fake.requests
+    album_list = sync()
+    assert album_list['Album ID'].tolist() == [f"album-{i}" for i in range(230)]
+    assert store.checkpoint() is None
+    # Carried on from the page that failed instead of starting over (three pages of 50 from album 100)
+    assert fake.requests - requests_before == 3
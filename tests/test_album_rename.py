@@ -0,0 +1,51 @@
+import pandas as pd
+import AlbumSchema
+import FakeDesktop
+import FakePhotosApi
+import GooglePhotosAlbumCleanup
+import GooglePhotosApi
+
+
+def rename_list(albums, new_titles):
+    # new_titles has one entry per album, plus any album IDs the API doesn't know
+    album_ids = [album['id'] for album in albums] + [album_id for album_id in new_titles if album_id not in {album['id'] for album in albums}]
+    return AlbumSchema.apply_schema(pd.DataFrame({'Album Title': [f"Old {album_id}" for album_id in album_ids], 'Photo Count': '1',
+                                                  'Album New Title': [new_titles.get(album_id, '') for album_id in album_ids], 'Album ID': album_ids,
+                                                  'Album URL': [f"https://photos.google.com/lr/album/{album_id}" for album_id in album_ids]}))
+
+
+def rename(album_list, fake, rate_limiter, use_mouse=True):
+    return GooglePhotosAlbumCleanup.rename_albums(album_list, 100, (10, 10), (20, 20), (30, 30), (40, 40), page_load_wait_time=0, mouse_move_wait_time=0, mouse_click_wait_time=0,
+                                                  service_factory=GooglePhotosApi.get_service_factory(fake.url, '', ''), rate_limiter=rate_limiter, workers=2, use_mouse=use_mouse)
+
+
+def test_albums_the_api_may_not_change_are_renamed_with_the_mouse(fake_photos_api, no_wait_rate_limiter):
+    albums = FakePhotosApi.make_albums(4)
+    fake = fake_photos_api(albums, read_only_album_ids={'album-1', 'album-3'})
+    album_list = rename_list(albums, {'album-0': 'Zero', 'album-1': 'One', 'album-3': 'Three', 'album-9': 'Gone'})
+
+    with FakeDesktop.fake_desktop(GooglePhotosAlbumCleanup) as (clock, pyautogui, browser):
+        album_list = rename(album_list, fake, no_wait_rate_limiter())
+    actions = album_list.set_index('Album ID')['Actions'].astype(str)
+    assert fake.album_index['album-0']['title'] == 'Zero'
+    assert actions['album-0'].startswith("Renamed to 'Zero'") and '(API, ' in actions['album-0']
+    # 403: the album wasn't made by this app, so only the web page can rename it, in album list order
+    assert browser.opened == ['https://photos.google.com/lr/album/album-1', 'https://photos.google.com/lr/album/album-3']
+    assert [args[0] for name, args in pyautogui.calls if name == 'write'] == ['One', 'Three']
+    assert '(mouse, ' in actions['album-1'] and '(mouse, ' in actions['album-3']
+    # Any other error is recorded, and the mouse isn't tried
+    assert actions['album-9'].startswith('Rename failed on ')
+    assert actions['album-2'] == ''
+
+
+def test_mouse_fallback_can_be_switched_off(fake_photos_api, no_wait_rate_limiter):
+    albums = FakePhotosApi.make_albums(2)
+    fake = fake_photos_api(albums, read_only_album_ids={'album-1'})
+    album_list = rename_list(albums, {'album-0': 'Zero', 'album-1': 'One'})
+
+    with FakeDesktop.fake_desktop(GooglePhotosAlbumCleanup) as (clock, pyautogui, browser):
+        album_list = rename(album_list, fake, no_wait_rate_limiter(), use_mouse=False)
+    assert browser.opened == []
+    assert album_list.set_index('Album ID')['Actions'].astype(str)['album-1'] == ''
+    # Still waiting for the mouse, so the next run tries it again
+    assert [job[1] for job in GooglePhotosAlbumCleanup.albums_to_rename(album_list, 100)] == ['album-1']
@@ -0,0 +1,51 @@
+import pandas as pd
+import ActionJournal
+import AlbumDuplicates
+import AlbumSchema
+import AlbumTitleClusters
+import FakePhotosApi
+import GooglePhotosAlbumCleanup
+
+
+def typed_album_list(count):
+    albums = FakePhotosApi.make_albums(count)
+    # Some albums for every rule to mark
+    for album in albums[::7]:
+        album['title'] = 'Copy of ' + album['title']
+    for album in albums[::11]:
+        album['title'] = album['title'] + ' iPhoto Events Jul 4, 2009'
+    album_list = pd.DataFrame({'Album Title': [album['title'] for album in albums], 'Photo Count': [album['mediaItemsCount'] for album in albums],
+                               'Album ID': [album['id'] for album in albums], 'Album URL': [album['productUrl'] for album in albums]})
+    return AlbumSchema.apply_schema(album_list)
+
+
+def test_set_values_adds_new_text_to_the_categories():
+    album_list = typed_album_list(10)
+    AlbumSchema.set_values(album_list, album_list.index[:3], 'Actions', 'Deleted on 2024-01-01')
+    AlbumSchema.set_values(album_list, 5, 'Actions', 'Renamed')
+    assert isinstance(album_list['Actions'].dtype, pd.CategoricalDtype)
+    assert list(album_list['Actions'][:6]) == ['Deleted on 2024-01-01'] * 3 + ['', '', 'Renamed']
+
+
+def test_types_survive_marking_and_the_journal(tmp_path):
+    album_list = typed_album_list(2000)
+    dtypes = album_list.dtypes.astype(str)
+    memory = album_list.memory_usage(deep=True).sum()
+
+    album_list = GooglePhotosAlbumCleanup.mark_albums_to_delete(album_list, True, ['Album 1'])
+    album_list = GooglePhotosAlbumCleanup.mark_albums_to_rename(album_list)
+    memberships = {album_id: ['photo-1', 'photo-2'] for album_id in album_list['Album ID'][:4]}
+    album_list = AlbumDuplicates.mark_duplicate_albums(album_list, memberships)
+    album_list = AlbumTitleClusters.mark_title_clusters(album_list)
+    journal_file = str(tmp_path / 'journal.jsonl')
+    with ActionJournal.ActionJournal(journal_file) as journal:
+        journal.record('album-3', 'deleted', 'Deleted on 2024-01-01')
+    assert ActionJournal.merge_journal(album_list, journal_file) == 1
+
+    assert album_list['Delete Flag'].sum() > 0
+    assert (album_list['Album New Title'] != '').sum() > 0
+    assert (album_list['Duplicate Type'] != '').sum() > 0
+    assert album_list.loc[album_list['Album ID'] == 'album-3', 'Actions'].iloc[0] == 'Deleted on 2024-01-01'
+    assert album_list.dtypes.astype(str).equals(dtypes)
+    # The rule names and new titles add a little; turning the columns back into Python strings would add several times the list
+    assert album_list.memory_usage(deep=True).sum() < 2 * memory
@@ -0,0 +1,89 @@
+import pytest
+import FakePhotosApi
+import GooglePhotosAlbumCleanup
+import AlbumStorage
+
+
+def open_store(backend, tmp_path):
+    extension = '.db' if backend == 'sqlite' else AlbumStorage.FILE_BACKENDS[backend]
+    return AlbumStorage.open_album_store(backend, str(tmp_path / f"albums{extension}"), GooglePhotosAlbumCleanup.LONG_TO_SHORT_HEADERS, GooglePhotosAlbumCleanup.OPTIONAL_LONG_TO_SHORT_HEADERS)
+
+
+def sync(fake, store, limit=0, full_refresh=False):
+    return GooglePhotosAlbumCleanup.google_photos_album_sync(fake.url, '', '', store, requests_per_second=1000, max_requests_per_second=1000,
+                                                             full_refresh=full_refresh, album_list_length_limit=limit)
+
+
+def test_limit_stops_after_a_whole_page_and_keeps_its_token():
+    pages = [{'albums': [{'id': f"{page}-{i}"} for i in range(50)], 'nextPageToken': str(page + 1)} for page in range(3)]
+    limited = list(GooglePhotosAlbumCleanup.limit_album_pages(pages, 60))
+    assert len(limited) == 2
+    assert limited[-1]['nextPageToken'] == '2'
+    assert len(limited[-1]['albums']) == 50
+
+
+@pytest.mark.parametrize('backend', ['sqlite', 'csv', 'parquet'])
+def test_limited_sync_keeps_albums_it_did_not_list(fake_photos_api, tmp_path, backend):
+    fake = fake_photos_api(FakePhotosApi.make_albums(120))
+    store = open_store(backend, tmp_path)
+    album_list = sync(fake, store, full_refresh=True)
+    album_list['Delete Flag'] = True
+    store.write(album_list)
+    # An album deleted in Google Photos is only dropped once a listing has finished
+    fake.albums = [album for album in fake.albums if album['id'] != 'album-110']
+
+    limited = sync(fake, store, limit=50)
+    assert store.checkpoint() is not None
+    for album_list in (limited, store.read()):
+        assert len(album_list) == 120
+        assert album_list['Delete Flag'].all()
+
+    synced = sync(fake, store)
+    assert store.checkpoint() is None
+    assert sorted(synced['Album ID']) == sorted(album['id'] for album in fake.albums)
+    assert synced['Delete Flag'].all()
+    assert len(store.read()) == 119
+
+
+@pytest.mark.parametrize('backend', ['sqlite', 'csv'])
+def test_limited_first_listing_is_saved_and_carried_on(fake_photos_api, tmp_path, backend):
+    fake = fake_photos_api(FakePhotosApi.make_albums(120))
+    store = open_store(backend, tmp_path)
+    assert len(sync(fake, store, limit=50, full_refresh=True)) == 50
+    assert len(sync(fake, store, limit=50)) == 100
+    assert sync(fake, store, limit=50)['Album ID'].tolist() == [f"album-{i}" for i in range(120)]
+    assert store.checkpoint() is None
+
+
+@pytest.mark.parametrize('backend', ['sqlite', 'csv'])
+def test_option_1_with_a_limit_loses_none_of_the_stored_albums(script_config, fake_photos_api, monkeypatch, capsys, tmp_path, backend):
+    config_file = script_config(AlbumLister={'album_list_length_limit': '50'}, AlbumStorage={'backend': backend, 'store_file': str(tmp_path / f"albums.{backend}")})
+    parameters = GooglePhotosAlbumCleanup.read_config_and_set_up_logging(config_file)
+    fake = fake_photos_api(FakePhotosApi.make_albums(120), scope=parameters['scopes'], credentials_file=parameters['credentials_file'], token_file=parameters['token_file'])
+    # An album list from before, with flags set on it
+    assert GooglePhotosAlbumCleanup.command_list({**parameters, 'album_list_length_limit': 0})
+    store = GooglePhotosAlbumCleanup.open_album_store(parameters)
+    album_list = store.read()
+    album_list['Delete Flag'] = True
+    store.write(album_list)
+    fake.albums = [album for album in fake.albums if album['id'] != 'album-110']
+
+    def option_1():
+        answers = iter(['1', 'y', 'q'])
+        monkeypatch.setattr('builtins.input', lambda prompt='': next(answers))
+        assert GooglePhotosAlbumCleanup.main(['--config', config_file]) == 0
+        return capsys.readouterr().out
+
+    # Downloading the list again forgets the flags, but the albums it hasn't got to yet stay in the list
+    assert 'Sync (option 7) to carry on' in option_1()
+    album_list = store.read()
+    assert len(album_list) == 120
+    assert not album_list['Delete Flag'].any()
+    assert store.checkpoint() == '50'
+    # Doing it again carries on rather than starting over
+    option_1()
+    assert len(store.read()) == 120
+    assert store.checkpoint() == '100'
+    assert 'can be further processed' in option_1()
+    assert store.checkpoint() is None
+    assert sorted(store.read()['Album ID']) == sorted(album['id'] for album in fake.albums)
@@ -0,0 +1,72 @@
+import asyncio
+import configparser
+import pathlib
+import pandas as pd
+import pytest
+import AlbumSchema
+import HeadlessBrowserDeleter
+
+MOCK_PAGE = (pathlib.Path(__file__).parent / 'mock_photos_album.html').as_uri()
+CONFIG_FILE = pathlib.Path(__file__).parent.parent / 'GooglePhotosAlbumCleanupConfig.ini'
+
+
+def config_selectors():
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    return {key: config.get('HeadlessBrowser', key) for key in HeadlessBrowserDeleter.DEFAULT_SELECTORS}
+
+
+def album_list(queries):
+    urls = [f"{MOCK_PAGE}?album={i}{query}" for i, query in enumerate(queries)]
+    return AlbumSchema.apply_schema(pd.DataFrame({'Album Title': [f"Album {i}" for i in range(len(urls))], 'Photo Count': '1', 'Delete Flag': True,
+                                                  'Album ID': [f"album-{i}" for i in range(len(urls))], 'Album URL': urls}))
+
+
+def run_delete_jobs(jobs, selectors, timeout):
+    async_api = pytest.importorskip('playwright.async_api')
+
+    async def run():
+        async with async_api.async_playwright() as playwright:
+            try:
+                browser = await playwright.chromium.launch()
+            except Exception as e:
+                pytest.skip(f"Playwright can't start Chromium here: {str(e).strip().splitlines()[0]}")
+            try:
+                return await HeadlessBrowserDeleter.run_delete_jobs(await browser.new_context(), jobs, 2, selectors, timeout)
+            finally:
+                await browser.close()
+
+    return asyncio.run(run())
+
+
+def test_config_file_has_the_default_selectors():
+    assert config_selectors() == HeadlessBrowserDeleter.DEFAULT_SELECTORS
+
+
+def test_deletes_albums_with_the_config_selectors():
+    albums = album_list(['', '', ''])
+    results = run_delete_jobs(HeadlessBrowserDeleter.albums_to_delete(albums, 10), config_selectors(), timeout=5.0)
+    assert sorted(results) == list(albums.index)
+    assert all(action.startswith('Deleted on ') for action in results.values())
+
+
+def test_album_without_delete_in_its_menu_fails_and_the_others_go_on():
+    albums = album_list(['&shared=1', ''])
+    results = run_delete_jobs(HeadlessBrowserDeleter.albums_to_delete(albums, 10), config_selectors(), timeout=1.0)
+    assert results[0].startswith('Delete failed on ')
+    assert 'Timeout' in results[0]
+    assert results[1].startswith('Deleted on ')
+
+
+def test_failed_album_is_tried_again_on_the_next_run():
+    # The page is slower than the step timeout the first time round
+    albums = album_list(['&delay=1500', ''])
+    jobs = HeadlessBrowserDeleter.albums_to_delete(albums, 10)
+    results = run_delete_jobs(jobs, config_selectors(), timeout=0.5)
+    AlbumSchema.set_values(albums, list(results), 'Actions', list(results.values()))
+    assert results[0].startswith('Delete failed on ')
+
+    retry = HeadlessBrowserDeleter.albums_to_delete(albums, 10)
+    assert [job[1] for job in retry] == ['album-0']
+    results = run_delete_jobs(retry, config_selectors(), timeout=5.0)
+    assert results[0].startswith('Deleted on ')
@@ -0,0 +1,58 @@
+import pandas as pd
+import AlbumMarkingRules
+import AlbumSchema
+import GooglePhotosAlbumCleanupBenchmark
+
+
+def album_list(albums, delete_flags=None):
+    """:param albums: List of (title, photo count) pairs."""
+    return AlbumSchema.apply_schema(pd.DataFrame({'Album Title': [title for title, _ in albums], 'Photo Count': [count for _, count in albums],
+                                                  'Delete Flag': delete_flags or [False] * len(albums), 'Album ID': [f"album-{i}" for i in range(len(albums))],
+                                                  'Album URL': ''}))
+
+
+def mark(albums, delete_empty_albums=True, delete_albums_that_contain=('',), **options):
+    rules = AlbumMarkingRules.compile_delete_rules(delete_empty_albums, delete_albums_that_contain)
+    return AlbumMarkingRules.apply_delete_rules(album_list(albums, **options), rules)
+
+
+def test_first_matching_rule_is_the_one_recorded():
+    marked = mark([('iPhoto Events Jul 4, 2009 Camping', 0), ('iPhoto Events Jul 4, 2009 Camping', 3), ('iPhoto Events Jul 4, 2009', 3), ('Garden', 3)],
+                  delete_albums_that_contain=('Camping',))
+    assert marked['Delete Flag'].tolist() == [True, True, True, False]
+    assert marked['Matched Rule'].tolist() == ['delete: empty album', 'delete: title contains configured text', 'delete: iPhoto Events date', '']
+
+
+def test_trailing_comma_in_the_config_does_not_match_every_album():
+    # 'Camping,' in the config file is split into 'Camping' and ''
+    marked = mark([('Camping 2019', 3), ('Garden', 3)], delete_albums_that_contain=tuple('Camping,'.split(',')))
+    assert marked['Delete Flag'].tolist() == [True, False]
+    # Nothing but empty entries means no title rule at all
+    assert [name for name, _ in AlbumMarkingRules.compile_delete_rules(False, ('', ''))] == ['delete: iPhoto Events date']
+
+
+def test_configured_text_is_matched_as_it_is_written():
+    marked = mark([('Photos (old)', 3), ('Photos old', 3), ('Photos.old', 3), ('Photos+old', 3)], delete_albums_that_contain=('(old)', 's.o'))
+    assert marked['Delete Flag'].tolist() == [True, False, True, False]
+
+
+def test_flags_set_by_hand_are_never_cleared():
+    marked = mark([('Garden', 3), ('Copy of Garden', 0), ('Trip', 3)], delete_flags=[True, False, False])
+    assert marked['Delete Flag'].tolist() == [True, True, False]
+    # Only the album a rule marked records a rule
+    assert marked['Matched Rule'].tolist() == ['', 'delete: empty album', '']
+
+
+def test_photo_count_that_cant_be_read_is_not_an_empty_album():
+    marked = mark([('Garden', ''), ('Trip', 'lots'), ('Empty', '0')])
+    assert marked['Photo Count'].isna().tolist() == [True, True, False]
+    assert marked['Delete Flag'].tolist() == [False, False, True]
+
+
+def test_rule_engine_marks_the_same_albums_as_the_row_by_row_code():
+    settings = (True, ('Wedding', 'Camping'))
+    synthetic = GooglePhotosAlbumCleanupBenchmark.make_synthetic_album_list(2000)
+    expected = GooglePhotosAlbumCleanupBenchmark.iterrows_mark_albums_to_delete(synthetic.copy(), *settings)['Delete Flag'] == True
+    marked = GooglePhotosAlbumCleanupBenchmark.rule_engine_mark_albums_to_delete(AlbumSchema.apply_schema(synthetic.copy()), *settings)
+    assert expected.sum() > 0
+    assert marked['Delete Flag'].equals(expected)
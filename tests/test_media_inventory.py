@@ -0,0 +1,96 @@
+import pandas as pd
+import pytest
+import AlbumSchema
+import AlbumSnapshotStore
+import GooglePhotosApi
+import MediaInventory
+
+# Album ID: photos.  m3 is in three albums, m4 in two, m6 in none
+MEMBERSHIPS = {
+    'album-a': ['m1', 'm2', 'm3'],
+    'album-b': ['m3', 'm4'],
+    'album-c': ['m3', 'm4', 'm5'],
+    'album-d': [],
+}
+MEDIA_ITEMS = [{'id': f"m{i}", 'filename': f"IMG_{i}.JPG", 'mimeType': 'image/jpeg'} for i in range(1, 7)]
+
+
+@pytest.fixture
+def inventory(tmp_path, fake_photos_api, no_wait_rate_limiter):
+    """:return: A function starting a fake library (FakePhotosApi arguments) and returning the fake and a take_inventory for it."""
+    conn = MediaInventory.open_inventory(str(tmp_path / 'inventory.db'))
+
+    def start(**options):
+        fake = fake_photos_api([], memberships=MEMBERSHIPS, media_items=MEDIA_ITEMS, **options)
+        service_factory = GooglePhotosApi.get_service_factory(fake.url, '', '')
+        take = lambda **arguments: MediaInventory.take_inventory(conn, service_factory, list(MEMBERSHIPS), no_wait_rate_limiter(), workers=2, page_size=2, **arguments)
+        return fake, take
+
+    start.conn = conn
+    yield start
+    conn.close()
+
+
+def stored_media_ids(conn):
+    return sorted(row[0] for row in conn.execute("SELECT media_id FROM media_items"))
+
+
+def test_interrupted_media_listing_carries_on_from_the_page_it_stopped_at(inventory):
+    fake, take = inventory(failing_page_tokens={'4'})
+    assert not take()
+    # Two pages of two were stored, with the token of the page that failed
+    assert stored_media_ids(inventory.conn) == ['m1', 'm2', 'm3', 'm4']
+    assert AlbumSnapshotStore.get_meta(inventory.conn, 'media_page_token') == '4'
+
+    fake.failing_page_tokens.clear()
+    requests = fake.requests
+    assert take()
+    # Only the last page of the library, then one search per album
+    assert fake.requests - requests == 1 + 4
+    assert stored_media_ids(inventory.conn) == ['m1', 'm2', 'm3', 'm4', 'm5', 'm6']
+    assert AlbumSnapshotStore.get_meta(inventory.conn, 'media_page_token') is None
+
+
+def test_albums_already_listed_are_skipped_when_carrying_on(inventory):
+    fake, take = inventory(failing_album_ids={'album-b'})
+    assert not take()
+    assert MediaInventory.albums_left(inventory.conn, list(MEMBERSHIPS)) == ['album-b']
+
+    fake.failing_album_ids.clear()
+    requests = fake.requests
+    assert take()
+    # The library isn't listed again, and only album-b's photos are
+    assert fake.requests - requests == 1
+    assert MediaInventory.albums_left(inventory.conn, list(MEMBERSHIPS)) == []
+    # A finished inventory is started over
+    requests = fake.requests
+    assert take()
+    assert fake.requests - requests == 3 + 4
+
+
+def test_counts_photos_in_no_other_album_and_the_albums_sharing_the_rest(inventory):
+    _, take = inventory()
+    assert take()
+    counts = MediaInventory.album_photo_counts(inventory.conn)
+    assert counts.loc[['album-a', 'album-b', 'album-c', 'album-d']].values.tolist() == [
+        # Unique, Shared, Sharing
+        [2, 1, 2],
+        [0, 2, 2],
+        [1, 2, 2],
+        [0, 0, 0],
+    ]
+    assert MediaInventory.library_summary(inventory.conn) == {'items': 6, 'in_no_album': 1}
+
+    album_ids = ['album-a', 'album-b', 'album-c', 'album-d', 'album-new', 'album-new-empty']
+    album_list = AlbumSchema.apply_schema(pd.DataFrame({'Album Title': album_ids, 'Photo Count': [3, 2, 3, 0, 4, 0], 'Album ID': album_ids, 'Album URL': ''}))
+    album_list = MediaInventory.apply_inventory(album_list, counts)
+    # Albums made since the inventory aren't counted (-1 for left empty), unless they are empty
+    assert album_list[list(MediaInventory.INVENTORY_COLUMNS)].fillna(-1).values.tolist() == [
+        [2, 1, 2],
+        [0, 2, 2],
+        [1, 2, 2],
+        [0, 0, 0],
+        [-1, -1, -1],
+        [0, 0, 0],
+    ]
+    assert str(album_list[MediaInventory.UNIQUE_PHOTOS_COLUMN].dtype) == 'Int32'
@@ -0,0 +1,135 @@
+import json
+import pytest
+import FakeDesktop
+import MouseMacros
+
+# The browser window while recording (left, top, width, height) on a 1920x1080 display
+RECORDED_WINDOW = (100, 50, 1600, 1000)
+# Each click: where on the display, when the pointer got there and when it clicked
+RECORDED_CLICKS = [((1700, 145), 2.0, 2.5), ((1600, 200), 3.0, 4.5), ((1000, 600), 5.0, 5.2)]
+
+
+def record_delete_macro():
+    clock = FakeDesktop.VirtualClock()
+    recorder = MouseMacros.MacroRecorder(MouseMacros.DELETE_MACRO, page_load_wait_time=7, mouse_click_wait_time=1, screen=(1920, 1080), clock=clock.monotonic)
+    tags = []
+    for (x, y), moved, clicked in RECORDED_CLICKS:
+        clock.sleep(moved - clock.now)
+        recorder.on_move(x, y)
+        clock.sleep(clicked - clock.now)
+        tags.append(recorder.on_click(x, y, window=RECORDED_WINDOW))
+    assert tags == MouseMacros.click_tags(MouseMacros.DELETE_MACRO) and recorder.done
+    return recorder.macro()
+
+
+def play(macro, screen_size=(1920, 1080), speed=1.0, **values):
+    """:return: Tuple of (list of (time, position) of every click, the fake pyautogui, the fake browser, the virtual time it all took)."""
+    with FakeDesktop.fake_desktop() as (clock, pyautogui, browser):
+        pyautogui.PAUSE = 0
+        pyautogui.screen_size = screen_size
+        clicks = []
+        click = pyautogui.click
+        pyautogui.click = lambda *args, **kwargs: (clicks.append((clock.now, args[0])), click(*args, **kwargs))
+        MouseMacros.MacroPlayer(pyautogui, browser, speed=speed, sleep=clock.sleep).play(macro, **values)
+    return clicks, pyautogui, browser, clock.now
+
+
+def test_recorded_macro_keeps_the_timing_of_the_recording():
+    macro = record_delete_macro()
+    clicks = [step for step in macro['steps'] if step['action'] == 'click']
+    # Relative to the window; the first click waits for the page, and only a deliberate rest is kept as a hover
+    assert [(step['x'], step['y']) for step in clicks] == [(1600, 95), (1500, 150), (900, 550)]
+    assert [step['delay'] for step in clicks] == [7, 0.5, 0.5]
+    assert [step['hover'] for step in clicks] == [0.0, 1.5, 0.0]
+
+    times_and_points, pyautogui, browser, seconds = play(macro, url='https://photos.google.com/lr/album/album-0')
+    assert browser.opened == ['https://photos.google.com/lr/album/album-0']
+    assert times_and_points == [(7.0, (1700.0, 145.0)), (9.0, (1600.0, 200.0)), (9.5, (1000.0, 600.0))]
+    assert pyautogui.calls[-1][0] == 'hotkey' and pyautogui.calls[-1][1][-1] == 'w'
+    assert seconds == pytest.approx(11.5)
+
+
+def test_replay_scales_to_the_display_and_speeds_up_the_waits():
+    times_and_points, _, _, seconds = play(record_delete_macro(), screen_size=(3840, 2160), speed=2.0, url='')
+    assert times_and_points == [(3.5, (3400.0, 290.0)), (4.5, (3200.0, 400.0)), (4.75, (2000.0, 1200.0))]
+    assert seconds == pytest.approx(5.75)
+
+
+def test_saved_macro_loads_back_and_a_wrong_one_is_refused(tmp_path):
+    macro = record_delete_macro()
+    MouseMacros.save_macro(macro, str(tmp_path))
+    assert MouseMacros.load_macro(str(tmp_path), MouseMacros.DELETE_MACRO) == json.loads(json.dumps(macro))
+    assert MouseMacros.load_macro(str(tmp_path), MouseMacros.RENAME_MACRO) is None
+    # A macro recorded for the delete clicks can't be played as the rename
+    with open(MouseMacros.macro_path(str(tmp_path), MouseMacros.RENAME_MACRO), 'w') as file:
+        json.dump({**macro, 'name': MouseMacros.RENAME_MACRO}, file)
+    assert MouseMacros.load_macro(str(tmp_path), MouseMacros.RENAME_MACRO) is None
+
+
+def test_macro_from_config_clicks_the_way_the_script_always_has():
+    coordinates = dict(zip(MouseMacros.click_tags(MouseMacros.RENAME_MACRO), ((10, 10), (20, 20), (30, 30), (40, 40))))
+    macro = MouseMacros.macro_from_config(MouseMacros.RENAME_MACRO, coordinates, page_load_wait_time=5, mouse_move_wait_time=1, mouse_click_wait_time=2)
+    times_and_points, pyautogui, _, seconds = play(macro, url='', new_title='Trip')
+    # Page load, then move, rest and click each button; the title is typed over the old one before saving
+    assert times_and_points == [(6.0, (10, 10)), (9.0, (20, 20)), (12.0, (30, 30)), (13.0, (40, 40))]
+    assert [(name, args[-1]) for name, args in pyautogui.calls if name in ('hotkey', 'write')] == [('hotkey', 'a'), ('write', 'Trip'), ('hotkey', 'w')]
+    assert seconds == pytest.approx(17.0)
+
+
+def record_rename_macro(keys_seen=True):
+    clock = FakeDesktop.VirtualClock()
+    recorder = MouseMacros.MacroRecorder(MouseMacros.RENAME_MACRO, page_load_wait_time=7, mouse_click_wait_time=1, screen=(1920, 1080), clock=clock.monotonic)
+    for (x, y), moved, clicked in RECORDED_CLICKS:
+        clock.sleep(moved - clock.now)
+        recorder.on_move(x, y)
+        clock.sleep(clicked - clock.now)
+        recorder.on_click(x, y)
+    # Select the old title and type the new one, then go to the checkmark
+    for pressed in (5.6, 5.8, 6.1, 6.5, 6.9, 7.4):
+        clock.sleep(pressed - clock.now)
+        if keys_seen:
+            recorder.on_key()
+    clock.sleep(7.7 - clock.now)
+    recorder.on_move(60, 80)
+    clock.sleep(8.0 - clock.now)
+    recorder.on_click(60, 80)
+    assert recorder.done
+    return recorder.macro()
+
+
+def test_click_after_typing_is_timed_from_the_last_key_press():
+    save = record_rename_macro()['steps'][6]
+    assert save['tag'] == 'rename_save_button'
+    # The replay types at once, so only the 0.6 seconds after the last key press count, half of it resting on the button
+    assert save['delay'] == pytest.approx(0.3) and save['hover'] == 0.0
+
+
+def test_click_after_typing_keeps_the_config_wait_if_no_key_presses_were_seen():
+    save = record_rename_macro(keys_seen=False)['steps'][6]
+    assert save['delay'] == 0.0 and save['hover'] == 0.0
+
+
+def test_title_that_cant_be_typed_is_pasted_from_the_clipboard():
+    coordinates = dict(zip(MouseMacros.click_tags(MouseMacros.RENAME_MACRO), ((10, 10), (20, 20), (30, 30), (40, 40))))
+    macro = MouseMacros.macro_from_config(MouseMacros.RENAME_MACRO, coordinates)
+    with FakeDesktop.fake_desktop() as (clock, pyautogui, browser):
+        copied = []
+        assert MouseMacros.MacroPlayer(pyautogui, browser, sleep=clock.sleep, clipboard=copied.append).play(macro, url='', new_title='Été à Zürich 東京')
+    assert copied == ['Été à Zürich 東京', 'Été à Zürich 東京']
+    keys = [args for name, args in pyautogui.calls if name in ('hotkey', 'write')]
+    assert [key[-1] for key in keys] == ['a', 'v', 'w']
+    assert keys[1][0] in ('ctrl', 'cmd')
+
+
+def test_title_is_left_alone_if_it_cant_be_typed_or_pasted(caplog):
+    coordinates = dict(zip(MouseMacros.click_tags(MouseMacros.RENAME_MACRO), ((10, 10), (20, 20), (30, 30), (40, 40))))
+    macro = MouseMacros.macro_from_config(MouseMacros.RENAME_MACRO, coordinates)
+
+    def no_clipboard(text):
+        raise RuntimeError('no copy/paste mechanism')
+
+    with FakeDesktop.fake_desktop() as (clock, pyautogui, browser):
+        assert not MouseMacros.MacroPlayer(pyautogui, browser, sleep=clock.sleep, clipboard=no_clipboard).play(macro, url='', new_title='Zürich')
+    # Not even the album was opened
+    assert browser.opened == [] and pyautogui.calls == []
+    assert "Can't type 'Zürich'" in caplog.text
@@ -0,0 +1,131 @@
+import os
+import logging
+import threading
+import pytest
+import RunMetrics
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_quantiles_are_bucket_bounds_capped_at_the_largest_value():
+    histogram = RunMetrics.Histogram()
+    assert histogram.quantile(0.5) is None
+    for value in [0.005] * 50 + [0.3] * 45 + [40.0] * 5:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(0.95) == 0.5
+    # The 60 second bucket, but nothing took longer than 40
+    assert histogram.quantile(0.99) == 40.0
+    assert histogram.summary() == {'count': 100, 'sum': 213.75, 'mean': 2.1375, 'min': 0.005, 'max': 40.0, 'p50': 0.01, 'p95': 0.5}
+
+
+def test_values_above_every_bucket_are_only_in_the_count():
+    histogram = RunMetrics.Histogram(buckets=(1.0,))
+    histogram.observe(0.5)
+    histogram.observe(90.0)
+    assert histogram.bucket_counts == [1]
+    assert histogram.count == 2
+    assert histogram.quantile(0.99) == 90.0
+
+
+def test_prometheus_text_has_counters_histograms_and_progress_with_their_labels():
+    clock = FakeClock()
+    metrics = RunMetrics.RunMetrics(clock=clock)
+    metrics.increment('albums_deleted_total', method='mouse')
+    metrics.increment('albums_deleted_total', 2, method='browser')
+    metrics.increment('errors_total', album='Say "cheese"\\ \n')
+    with metrics.timer('api_request_seconds', operation='list'):
+        clock.now += 0.02
+    metrics.observe('api_request_seconds', 3.0, operation='list')
+    metrics.start_progress('delete', 10)
+    clock.now += 8.0
+    metrics.advance('delete', 2)
+    prefix = RunMetrics.METRIC_PREFIX
+    lines = metrics.prometheus_text().splitlines()
+
+    assert lines[:2] == [f"# TYPE {prefix}run_seconds gauge", f"{prefix}run_seconds 8.020"]
+    assert f"# TYPE {prefix}albums_deleted_total counter" in lines
+    assert f'{prefix}albums_deleted_total{{method="browser"}} 2' in lines
+    assert f'{prefix}albums_deleted_total{{method="mouse"}} 1' in lines
+    # Backslashes, quotes and newlines in label values are escaped
+    assert f'{prefix}errors_total{{album="Say \\"cheese\\"\\\\ \\n"}} 1' in lines
+    # Buckets count every value up to their bound
+    assert f"# TYPE {prefix}api_request_seconds histogram" in lines
+    assert f'{prefix}api_request_seconds_bucket{{operation="list",le="0.01"}} 0' in lines
+    assert f'{prefix}api_request_seconds_bucket{{operation="list",le="0.025"}} 1' in lines
+    assert f'{prefix}api_request_seconds_bucket{{operation="list",le="2.5"}} 1' in lines
+    assert f'{prefix}api_request_seconds_bucket{{operation="list",le="5.0"}} 2' in lines
+    assert f'{prefix}api_request_seconds_bucket{{operation="list",le="+Inf"}} 2' in lines
+    assert f'{prefix}api_request_seconds_sum{{operation="list"}} 3.020000' in lines
+    assert f'{prefix}api_request_seconds_count{{operation="list"}} 2' in lines
+    assert f'{prefix}progress_done{{task="delete"}} 2.000' in lines
+    assert f'{prefix}progress_total{{task="delete"}} 10.000' in lines
+    assert f'{prefix}progress_eta_seconds{{task="delete"}} 32.000' in lines
+    # Every sample is a name, optional labels and a number
+    for line in lines:
+        if not line.startswith('#'):
+            float(line.rsplit(' ', 1)[1])
+
+
+def test_eta_is_the_time_left_at_the_rate_so_far():
+    clock = FakeClock()
+    metrics = RunMetrics.RunMetrics(clock=clock)
+    metrics.start_progress('delete', 100)
+    assert metrics.advance('delete', 0) is None
+    assert metrics.progress_text('delete') == '0/100, ETA ?'
+    clock.now += 50.0
+    assert metrics.advance('delete', 10) == pytest.approx(450.0)
+    assert metrics.progress_text('delete') == '10/100, ETA 7m30s'
+    # Slower albums push the ETA out
+    clock.now += 150.0
+    assert metrics.advance('delete', 10) == pytest.approx(800.0)
+    clock.now += 7000.0
+    assert metrics.progress_text('delete') == '20/100, ETA 8h00m'
+    assert metrics.advance('delete', 90) == 0
+    assert metrics.advance('rename') is None
+    assert metrics.progress_text('rename') == ''
+
+
+def test_textfile_is_written_at_most_once_an_interval_unless_forced(tmp_path):
+    clock = FakeClock()
+    prometheus_file = str(tmp_path / 'metrics.prom')
+    metrics = RunMetrics.RunMetrics(prometheus_file, prometheus_interval=10.0, clock=clock)
+    metrics.increment('albums_listed_total')
+    assert 'albums_listed_total 1' in open(prometheus_file).read()
+    metrics.increment('albums_listed_total')
+    assert 'albums_listed_total 1' in open(prometheus_file).read()
+    clock.now += 10.0
+    metrics.increment('albums_listed_total')
+    assert 'albums_listed_total 3' in open(prometheus_file).read()
+    metrics.increment('albums_listed_total')
+    metrics.start_progress('delete', 5)
+    assert 'albums_listed_total 4' in open(prometheus_file).read()
+
+
+def test_threads_writing_the_textfile_at_once_dont_get_in_each_others_way(tmp_path, caplog):
+    prometheus_file = str(tmp_path / 'metrics.prom')
+    metrics = RunMetrics.RunMetrics(prometheus_file, prometheus_interval=0.0)
+
+    def work(thread):
+        for _ in range(100):
+            metrics.increment('albums_deleted_total', thread=thread)
+            metrics.maybe_write_prometheus(force=True)
+
+    threads = [threading.Thread(target=work, args=(thread,)) for thread in range(8)]
+    with caplog.at_level(logging.ERROR):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+    assert os.listdir(tmp_path) == ['metrics.prom']
+    # The last write saw every increment
+    text = open(prometheus_file).read()
+    for thread in range(8):
+        assert f'{RunMetrics.METRIC_PREFIX}albums_deleted_total{{thread="{thread}"}} 100' in text
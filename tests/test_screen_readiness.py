@@ -0,0 +1,39 @@
+from PIL import Image, ImageDraw
+import FakeDesktop
+import ScreenReadiness
+
+
+def screen(size, button=None):
+    # A white screen, with a black button at the box given
+    image = Image.new('L', size, 255)
+    if button:
+        ImageDraw.Draw(image).rectangle(button, fill=0)
+    return image
+
+
+def test_grabber_captures_only_the_region_around_the_point():
+    with FakeDesktop.fake_desktop() as (clock, pyautogui, browser):
+        # A high resolution display: two screenshot pixels per screen point
+        pyautogui.frames = [(0.0, screen((3840, 2160), button=(1980, 1080, 2020, 1120)))]
+        grabber = ScreenReadiness.PyAutoGuiScreenGrabber()
+        first = grabber.grab(1000, 550, half_size=10)
+        second = grabber.grab(1000, 550, half_size=10)
+    regions = [args[0] for name, args in pyautogui.calls if name == 'screenshot']
+    # One full screenshot to measure the scale, then only the 40 by 40 pixels around the point
+    assert regions == [None, (1980, 1080, 40, 40), (1980, 1080, 40, 40)]
+    assert first.size == second.size == (40, 40)
+    assert first.getextrema() == (0, 0)
+
+
+def test_waiter_stops_waiting_as_soon_as_the_button_shows():
+    button = (90, 90, 110, 110)
+    template = ScreenReadiness.crop_around(screen((200, 200), button), 100, 100, ScreenReadiness.TEMPLATE_HALF_SIZE)
+    with FakeDesktop.fake_desktop() as (clock, pyautogui, browser):
+        pyautogui.screen_size = (200, 200)
+        pyautogui.frames = [(0.0, screen((200, 200))), (2.5, screen((200, 200), button))]
+        waiter = ScreenReadiness.ReadinessWaiter(ScreenReadiness.PyAutoGuiScreenGrabber(), clock=clock.monotonic, sleep=clock.sleep)
+        assert waiter.wait_for_template(100, 100, template, timeout=10)
+        assert 2.5 <= clock.now < 2.5 + ScreenReadiness.DEFAULT_POLL_INTERVAL + 1e-9
+        # A button that never goes away costs the timeout and no more
+        assert not waiter.wait_for_template_gone(100, 100, template, timeout=3)
+        assert abs(clock.now - 5.5) < 1e-6
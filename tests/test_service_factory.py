@@ -0,0 +1,75 @@
+import os
+import pytest
+import FakePhotosApi
+import GooglePhotosApi
+
+
+@pytest.fixture
+def factory(fake_service_factory):
+    return lambda fake, cache_file: fake_service_factory(fake, discovery_cache_file=cache_file, discovery_cache_ttl=3600)
+
+
+def list_titles(service):
+    return [album['title'] for album in service.albums().list(pageSize=50).execute()['albums']]
+
+
+def test_discovery_document_is_downloaded_once_and_then_read_from_the_cache(fake_photos_api, tmp_path, factory):
+    fake = fake_photos_api(FakePhotosApi.make_albums(3))
+    cache_file = str(tmp_path / 'discovery.json')
+    first = factory(fake, cache_file)
+    assert list_titles(first()) == ['Album 0', 'Album 1', 'Album 2']
+    assert first.timings['discovery_source'] == 'network'
+    # The next run of the script
+    second = factory(fake, cache_file)
+    assert list_titles(second()) == ['Album 0', 'Album 1', 'Album 2']
+    assert second.timings['discovery_source'] == 'cache'
+    assert fake.discovery_requests == 1
+
+
+def test_expired_cache_is_downloaded_again_or_used_if_the_download_fails(fake_photos_api, tmp_path, factory):
+    fake = fake_photos_api(FakePhotosApi.make_albums(3))
+    cache_file = str(tmp_path / 'discovery.json')
+    factory(fake, cache_file)()
+    os.utime(cache_file, (0, 0))
+    refreshed = factory(fake, cache_file)
+    refreshed()
+    assert refreshed.timings['discovery_source'] == 'network'
+    assert fake.discovery_requests == 2
+
+    os.utime(cache_file, (0, 0))
+    fake.stop()
+    offline = factory(fake, cache_file)
+    offline()
+    assert offline.timings['discovery_source'] == 'expired cache'
+
+
+def test_cache_of_another_discovery_url_is_not_used(fake_photos_api, tmp_path, factory):
+    cache_file = str(tmp_path / 'discovery.json')
+    first = fake_photos_api(FakePhotosApi.make_albums(1))
+    factory(first, cache_file)()
+    second = fake_photos_api(FakePhotosApi.make_albums(2))
+    service = factory(second, cache_file)()
+    # The document from the first fake would point the service at the first fake
+    assert list_titles(service) == ['Album 0', 'Album 1']
+    assert second.discovery_requests == 1
+
+
+def test_one_factory_and_service_are_shared_by_every_thread(fake_photos_api, no_wait_rate_limiter):
+    album_ids = [f"album-{i}" for i in range(40)]
+    fake = fake_photos_api(FakePhotosApi.make_albums(40), memberships={album_id: [f"media-{album_id}"] for album_id in album_ids})
+    service_factory = GooglePhotosApi.get_service_factory(fake.url, '', '')
+    # Asking again, e.g. from another command in the same run, gives the same factory and its settings are kept
+    assert GooglePhotosApi.get_service_factory(fake.url, '', '', max_connections=1) is service_factory
+    services = set()
+
+    def fetch(service, album_id):
+        services.add(id(service))
+        return GooglePhotosApi.fetch_album_media_ids(service, album_id, rate_limiter, max_retries=5)
+
+    rate_limiter = no_wait_rate_limiter()
+    results = {album_id: media_ids for album_id, media_ids, error, seconds in GooglePhotosApi.map_with_thread_services(service_factory, fetch, album_ids, workers=8)}
+    assert results == {album_id: [f"media-{album_id}"] for album_id in album_ids}
+    assert services == {id(service_factory())}
+    assert fake.discovery_requests == 1
+    # Keep-alive connections are reused rather than one opened per request
+    assert len(fake.connections) <= service_factory.max_connections
@@ -0,0 +1,16 @@
+import os
+import GooglePhotosAlbumCleanup
+import GooglePhotosAlbumCleanupBenchmark
+
+SCRIPT = os.path.abspath(GooglePhotosAlbumCleanup.__file__)
+
+
+def test_import_loads_no_heavy_modules():
+    _, packages = GooglePhotosAlbumCleanupBenchmark.import_times('GooglePhotosAlbumCleanup')
+    assert not packages.intersection(GooglePhotosAlbumCleanupBenchmark.HEAVY_MODULES)
+
+
+def test_config_and_menu_load_no_heavy_modules(tmp_path):
+    config_file = os.path.join(os.path.dirname(SCRIPT), GooglePhotosAlbumCleanup.CONFIG_FILENAME)
+    _, packages = GooglePhotosAlbumCleanupBenchmark.menu_startup(SCRIPT, config_file, str(tmp_path))
+    assert not packages.intersection(GooglePhotosAlbumCleanupBenchmark.HEAVY_MODULES)
@@ -0,0 +1,32 @@
+import pytest
+import FakeDesktop
+import GooglePhotosAlbumCleanup
+
+PAGE_LOAD_SECONDS = 5.0
+
+
+def delete_in_tabs(album_list, prefetch_tabs):
+    with FakeDesktop.fake_desktop(GooglePhotosAlbumCleanup, page_load_seconds=PAGE_LOAD_SECONDS) as (clock, pyautogui, browser):
+        GooglePhotosAlbumCleanup.delete_albums(album_list, 100, 1.0, (1700, 145), (1600, 200), (1000, 600), page_load_wait_time=7, mouse_move_wait_time=1,
+                                               mouse_click_wait_time=1, prefetch_tabs=prefetch_tabs)
+    return clock.now, browser
+
+
+@pytest.mark.parametrize('prefetch_tabs', [1, 3])
+def test_prefetched_tabs_get_no_click_before_their_page_has_loaded(prefetch_tabs, flagged_album_list):
+    album_list = flagged_album_list(8)
+    urls = album_list['Album URL'].tolist()
+    seconds, browser = delete_in_tabs(album_list, prefetch_tabs)
+    assert browser.opened == urls
+    # Every album was deleted in its own tab, in order: three clicks on its page, then its tab closed
+    assert browser.closed == urls
+    assert [url for url, _ in browser.clicks] == [url for url in urls for _ in range(3)]
+    assert browser.early_clicks() == 0
+    assert album_list['Actions'].astype(str).str.startswith('Deleted on ').all()
+
+
+def test_prefetching_saves_the_page_load_waits(flagged_album_list):
+    seconds_one_by_one, browser = delete_in_tabs(flagged_album_list(8), prefetch_tabs=0)
+    assert browser.early_clicks() == 0
+    seconds_in_tabs, _ = delete_in_tabs(flagged_album_list(8), prefetch_tabs=1)
+    assert seconds_in_tabs < seconds_one_by_one * 0.75
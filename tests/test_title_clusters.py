@@ -0,0 +1,53 @@
+import pandas as pd
+import AlbumSchema
+import AlbumTitleClusters
+
+# (title, photo count)
+ALBUMS = [
+    ('Trip', 10),
+    ('Copy of Trip', 10),
+    # More photos than the album kept, so only renamed
+    ('Trip (1)', 12),
+    ('trip!', 3),
+    # Numbered albums are only copies of an album without the number
+    ('Week 1', 5),
+    ('Week 2', 5),
+    ("Grandma's Birthday", 8),
+    ('Grandmas birthday', 8),
+    ('Summer holiday in Spain', 40),
+    ('Sumer holiday in Spain', 20),
+    ('Garden', 4),
+]
+
+
+def album_list():
+    return AlbumSchema.apply_schema(pd.DataFrame({'Album Title': [title for title, _ in ALBUMS], 'Photo Count': [count for _, count in ALBUMS],
+                                                  'Album ID': [f"album-{i}" for i in range(len(ALBUMS))], 'Album URL': ''}))
+
+
+def test_title_keys_drop_copy_markers_case_and_punctuation():
+    assert AlbumTitleClusters.title_keys(['Copy of Trip (2)', 'Trip - Copy 2', 'trip!', 'Trip 2', 'Week 2']) == ['trip', 'trip', 'trip', 'trip', 'week 2']
+
+
+def test_clusters_copies_and_similar_titles():
+    marked = AlbumTitleClusters.mark_title_clusters(album_list(), delete_copies=True).set_index('Album Title')
+    assert marked['Title Cluster'].to_dict() == {
+        'Trip': 'Trip (keep)', 'Copy of Trip': 'Trip (copy)', 'Trip (1)': 'Trip (similar)', 'trip!': 'Trip (copy)',
+        'Week 1': '', 'Week 2': '',
+        "Grandma's Birthday": "Grandma's Birthday (keep)", 'Grandmas birthday': "Grandma's Birthday (copy)",
+        'Summer holiday in Spain': 'Summer holiday in Spain (keep)', 'Sumer holiday in Spain': 'Summer holiday in Spain (similar)',
+        'Garden': '',
+    }
+    assert marked.index[marked['Delete Flag']].tolist() == ['Copy of Trip', 'trip!', 'Grandmas birthday']
+    assert marked.index[marked['Album New Title'] != ''].tolist() == ['Trip (1)', 'Sumer holiday in Spain']
+    assert marked.loc['Sumer holiday in Spain', 'Album New Title'] == 'Summer holiday in Spain'
+
+
+def test_new_titles_typed_by_hand_are_kept():
+    albums = album_list()
+    albums['Album New Title'] = AlbumSchema.annotation_column(pd.Series(['Trip to the sea' if title == 'Trip (1)' else '' for title, _ in ALBUMS], index=albums.index))
+    marked = AlbumTitleClusters.mark_title_clusters(albums).set_index('Album Title')
+    assert marked.loc['Trip (1)', 'Album New Title'] == 'Trip to the sea'
+    assert marked.loc['Sumer holiday in Spain', 'Album New Title'] == 'Summer holiday in Spain'
+    # Copies are only flagged when asked to
+    assert not marked['Delete Flag'].any()